@@ -9,6 +9,7 @@ import streamlit as st
 
 from pygsod.isdhistory import ISDHistory
 from pygsod.output import GetOneStation
+from pygsod.search import StationSearch
 from pygsod.utils import FileType, OutputType
 
 EPHISTORY_PATH = Path(__file__).resolve().parent / "ep_weather_stations.xlsx"
@@ -18,8 +19,8 @@ logger.setLevel("INFO")
 
 
 def read_isd_history():
-    # This will download or update the isd-history.csv as needed
-    isd = ISDHistory()
+    # This will download or update the isd-history.csv as needed, once per process
+    isd = ISDHistory.shared()
     return isd.df
 
 
@@ -98,10 +99,17 @@ if type_of_file == FileType.Historical:
         st.session_state["read_history"] = read_isd_history()
 
     df_dropdown = st.session_state["read_history"]
+    search_key = "search_history"
 
 
 else:
     df_dropdown = read_ep_ws()
+    search_key = "search_ep_ws"
+
+# The dropdown lists are precomputed once, not on every rerun
+if search_key not in st.session_state.keys():
+    st.session_state[search_key] = StationSearch(df_dropdown)
+search = st.session_state[search_key]
 
 st.markdown("### Select the weather station")
 
@@ -136,27 +144,20 @@ if not lat_long:
     with col1:
         country = st.selectbox(
             "Country code",
-            (df_dropdown["CTRY"].fillna("N/A").sort_values().unique()),
+            search.countries(na_rep="N/A"),
             on_change=set_to_false,
         ).replace("N/A", "")
     with col2:
         if country == "":
             list_states = ["N/A"]
         else:
-            list_states = df_dropdown[df_dropdown.CTRY == country]["STATE"].fillna("N/A").sort_values().unique()
+            list_states = search.states(country, na_rep="N/A")
         state = st.selectbox("State", list_states, on_change=set_to_false).replace("N/A", "")
 
     if state == "":
         state = None
 
-    if state is None:
-        list_ws = df_dropdown[(df_dropdown.CTRY == country)]["STATION NAME"].sort_values().unique()
-    else:
-        list_ws = (
-            df_dropdown[(df_dropdown.CTRY == country) & (df_dropdown.STATE == state)]["STATION NAME"]
-            .sort_values()
-            .unique()
-        )
+    list_ws = search.station_names(country, state=state)
 
     ws = st.selectbox("Weather Station", list_ws, on_change=set_to_false)
 
@@ -19,3 +19,11 @@ if not RESULT_DIR.exists():
     RESULT_DIR.mkdir(parents=True)
 
 ISDHISTORY_PATH = SUPPORT_DIR / "isd-history.csv"
+
+ISDINVENTORY_PATH = SUPPORT_DIR / "isd-inventory.csv"
+
+# NOAA's FTP server, where all the data lives
+NOAA_FTP_HOST = "ftp.ncdc.noaa.gov"
+
+# NOAA's HTTPS server, which publishes the same /pub/data tree as the FTP
+NOAA_HTTPS_URL = "https://www.ncei.noaa.gov"
@@ -0,0 +1,132 @@
+"""Vectorized decoding of fixed-width text files, such as NOAA's GSOD and ISD-Lite."""
+
+from typing import BinaryIO, Optional
+
+import numpy as np
+
+# ASCII codes
+_ZERO = np.uint8(ord("0"))
+_MINUS = ord("-")
+_DOT = ord(".")
+_SPACE = ord(" ")
+
+
+def read_char_matrix(f: BinaryIO, skiprows: int = 0, width: Optional[int] = None) -> np.ndarray:
+    """
+    Reads a fixed-width file as a (n_lines, width) uint8 matrix of its bytes
+
+    Lines shorter than `width` are padded with NUL bytes, which the decoders
+    below treat as blanks, so that trailing blanks stripped by some tools
+    don't matter. When all the lines have the same length, the matrix is a
+    read-only view of the bytes read, without copies
+
+    Args:
+    ------
+        f (file-like): opened for binary reading
+
+        skiprows (int): number of header lines to skip
+
+        width (int, optional): minimum width of the matrix, the longest line
+            if wider
+
+    Returns:
+    --------
+        chars (np.ndarray): one row per non-empty line
+
+    """
+    data = f.read()
+    offset = 0
+    for _ in range(skiprows):
+        offset = data.find(b"\n", offset) + 1
+        if offset == 0:
+            offset = len(data)
+
+    # Lines all the same length, the usual case: use the bytes as is
+    line_width = data.find(b"\n", offset) + 1 - offset
+    if line_width > (width or 0) and (len(data) - offset) % line_width == 0:
+        chars = np.frombuffer(data, dtype=np.uint8, offset=offset).reshape(-1, line_width)
+        if (chars[:, -1] == ord("\n")).all():
+            return chars[:, :-1]
+
+    lines = data[offset:].splitlines()
+    lines = [line for line in lines if line.strip()]
+    width = max([width or 0] + [len(line) for line in lines])
+    if width == 0:
+        return np.zeros((len(lines), 0), dtype=np.uint8)
+    return np.array(lines, dtype="S{}".format(width)).view(np.uint8).reshape(len(lines), width)
+
+
+def parse_numbers(chars: np.ndarray, start: int, end: int) -> np.ndarray:
+    """
+    Decodes the numbers in columns [start, end[ of `chars`, eg '  -12.5'
+
+    Each character position is processed for all the lines at once: digits
+    accumulate in an integer mantissa, and the digits after the '.' set the
+    power of ten to divide it by. Anything else, blanks included, is skipped
+
+    Returns:
+    --------
+        values (np.ndarray): float64, NaN where the field has no digits
+
+    """
+    # (width, n_lines), so that each position is contiguous
+    field = np.ascontiguousarray(chars[:, start:end]).T.copy()
+    digits = field - _ZERO
+    is_digit = digits < 10  # uint8: anything below '0' wraps around
+    digits *= is_digit
+    multipliers = np.where(is_digit, np.uint8(10), np.uint8(1))
+
+    mantissa = np.zeros(field.shape[1], dtype=np.int64)
+    for digit, multiplier in zip(digits, multipliers):
+        mantissa *= multiplier
+        mantissa += digit
+
+    values = mantissa.astype(np.float64)
+    is_dot = field == _DOT
+    if is_dot.any():
+        n_decimals = (is_digit & np.logical_or.accumulate(is_dot, axis=0)).sum(axis=0)
+        values /= np.power(10.0, n_decimals)
+    values[(field == _MINUS).any(axis=0)] *= -1
+    values[~is_digit.any(axis=0)] = np.nan
+    return values
+
+
+def parse_integers(chars: np.ndarray, start: int, end: int, dtype=np.int64) -> np.ndarray:
+    """
+    Decodes the integers in columns [start, end[ of `chars`
+
+    Args:
+    ------
+        dtype (np.dtype): the integer type to return, eg np.int16 for 4-digit
+            fields
+
+    Returns:
+    --------
+        values (np.ndarray): `dtype`, or float64 with NaN if some fields are
+            blank
+
+    """
+    values = parse_numbers(chars, start, end)
+    if np.isnan(values).any():
+        return values
+    return values.astype(dtype)
+
+
+def parse_strings(chars: np.ndarray, start: int, end: int) -> np.ndarray:
+    """
+    Decodes the text in columns [start, end[ of `chars`, stripped
+
+    Returns:
+    --------
+        values (np.ndarray): object array of str, NaN where blank
+
+    """
+    field = chars[:, start:end].copy()
+    # NUL padding is blank too
+    field[field == 0] = _SPACE
+    values = field.view("S{}".format(end - start)).ravel()
+    # Few distinct values (station ids, flags): only decode those
+    uniques, inverse = np.unique(values, return_inverse=True)
+    uniques = np.char.strip(uniques).astype(str).astype(object)
+    uniques[uniques == ""] = np.nan
+    return uniques[inverse]
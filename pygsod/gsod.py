@@ -11,18 +11,315 @@ Weather stations are stored into the file `weatherfiles.txt`
 with the syntax "USAF-WBAN"
 
 """
+
 import datetime
 import os
+from typing import List, Optional
 
 import numpy as np
 import pandas as pd
 
 from pygsod.constants import WEATHER_DIR
+from pygsod.fixedwidth import parse_integers, parse_numbers, parse_strings, read_char_matrix
 from pygsod.noaadata import NOAAData
-from pygsod.utils import DataType, get_valid_year, is_list_like
+from pygsod.utils import DataType, get_valid_year, is_list_like, open_maybe_gzip
+
+# Define the [start,end[ for the fixed-width format
+GSOD_COLSPECS = [
+    (0, 6),
+    (7, 12),
+    (14, 18),
+    (18, 20),
+    (20, 22),
+    (24, 30),
+    (31, 33),
+    (35, 41),
+    (42, 44),
+    (46, 52),
+    (53, 55),
+    (57, 63),
+    (64, 66),
+    (68, 73),
+    (74, 76),
+    (78, 83),
+    (84, 86),
+    (88, 93),
+    (95, 100),
+    (102, 108),
+    (108, 109),
+    (110, 116),
+    (116, 117),
+    (118, 123),
+    (123, 124),
+    (125, 130),
+    (132, 133),
+    (133, 134),
+    (134, 135),
+    (135, 136),
+    (136, 137),
+    (137, 138),
+]
+
+# Define column names
+GSOD_NAMES = [
+    "USAF",
+    "WBAN",
+    "YEAR",
+    "MONTH",
+    "DAY",
+    "TEMP_F",
+    "TEMP_Count",
+    "DEWP_F",
+    "DEWP_Count",
+    "SLP_mbar",
+    "SLP_Count",
+    "STP_mbar",
+    "STP_Count",
+    "VISIB_mi",
+    "VISIB_Count",
+    "WDSP_kn",
+    "WDSP_Count",
+    "MXSPD_kn",
+    "GUST_kn",
+    "MAX_F",
+    "MAX_Flag",
+    "MIN_F",
+    "MIN_Flag",
+    "PRCP_in",
+    "PRCP_Flag",
+    "SNDP_in",
+    "FRSHTT_Fog",
+    "FRSHTT_Rain_or_Drizzle",
+    "FRSHTT_Snow_or_Ice_Pellets",
+    "FRSHTT_Hail",
+    "FRSHTT_Thunder",
+    "FRSHTT_Tornado_or_Funnel_Cloud",
+]
+
+# Force dtypes
+GSOD_DTYPES = {
+    "DAY": np.int32,
+    "DEWP": np.float64,
+    "DEWP_Count": np.int32,
+    "FRSHTT_Fog": bool,
+    "FRSHTT_Hail": bool,
+    "FRSHTT_Rain_or_Drizzle": bool,
+    "FRSHTT_Snow_or_Ice_Pellets": bool,
+    "FRSHTT_Thunder": bool,
+    "FRSHTT_Tornado_or_Funnel_Cloud": bool,
+    "GUST": np.float64,
+    "MAX": np.float64,
+    "MAX_Flag": str,
+    "MIN": np.float64,
+    "MIN_Flag": str,
+    "MONTH": np.int32,
+    "MXSPD": np.float64,
+    "PRCP": np.float64,
+    "PRCP_Flag": str,
+    "SLP": np.float64,
+    "SLP_Count": np.int32,
+    "SNDP": np.float64,
+    "STP": np.float64,
+    "STP_Count": np.int32,
+    "TEMP": np.float64,
+    "TEMP_Count": np.int32,
+    "USAF": np.int32,
+    "VISIB": np.float64,
+    "VISIB_Count": np.int32,
+    "WBAN": np.int32,
+    "WDSP": np.float64,
+    "WDSP_Count": np.int32,
+    "YEAR": np.int32,
+}
+
+# Define NA values per column, based on gsod format description
+GSOD_NA_VALUES = {
+    "TEMP_F": 9999.9,
+    "DEWP_F": 9999.9,
+    "SLP_mbar": 9999.9,
+    "STP_mbar": 9999.9,
+    "VISIB_mi": 999.9,
+    "WDSP_kn": 999.9,
+    "MXSPD_kn": 999.9,
+    "GUST_kn": 999.9,
+    "MAX_F": 9999.9,
+    "MIN_F": 9999.9,
+    "PRCP_in": 99.9,
+    "SNDP_in": 999.9,
+}
+
+
+def _fahrenheit_to_celsius(temperature):
+    return (temperature - 32) * 5 / 9.0
+
+
+# Columns converted from IP units to SI (used by E+): SI column => (IP column,
+# conversion)
+GSOD_SI_CONVERSIONS = {
+    # Convert temperatures
+    "TEMP_C": ("TEMP_F", _fahrenheit_to_celsius),
+    "DEWP_C": ("DEWP_F", _fahrenheit_to_celsius),
+    "MAX_C": ("MAX_F", _fahrenheit_to_celsius),
+    "MIN_C": ("MIN_F", _fahrenheit_to_celsius),
+    # Convert millibars to Pa (1 mbar = 100 Pa)
+    "SLP_Pa": ("SLP_mbar", lambda pressure: pressure * 0.01),
+    "STP_Pa": ("STP_mbar", lambda pressure: pressure * 0.01),
+    # Convert knots to m/s (1 nautical mile = 1.852 km)
+    "WDSP_m/s": ("WDSP_kn", lambda speed: speed * 1852 / 3600.0),
+    "MXSPD_m/s": ("MXSPD_kn", lambda speed: speed * 1852 / 3600.0),
+    "GUST_m/s": ("GUST_kn", lambda speed: speed * 1852 / 3600.0),
+    # Convert inches to meter multiples (1 in = 2.54 cm)
+    "SNDP_cm": ("SNDP_in", lambda depth: depth * 2.54),
+    "PRCP_mm": ("PRCP_in", lambda depth: depth * 25.4),
+    # Convert miles to km (1 mile = 1.60934 km)
+    "VISIB_km": ("VISIB_mi", lambda distance: distance * 1.60934),
+}
+
+FRSHTT_COLUMNS = [
+    "FRSHTT_Fog",
+    "FRSHTT_Rain_or_Drizzle",
+    "FRSHTT_Snow_or_Ice_Pellets",
+    "FRSHTT_Hail",
+    "FRSHTT_Thunder",
+    "FRSHTT_Tornado_or_Funnel_Cloud",
+]
+
+# The columns of `parse_gsod_op_file`, in order
+GSOD_COLUMNS = [
+    "StationID",
+    "USAF",
+    "WBAN",
+    "TEMP_F",
+    "TEMP_C",
+    "TEMP_Count",
+    "DEWP_F",
+    "DEWP_C",
+    "DEWP_Count",
+    "SLP_mbar",
+    "SLP_Pa",
+    "SLP_Count",
+    "STP_mbar",
+    "STP_Pa",
+    "STP_Count",
+    "VISIB_mi",
+    "VISIB_km",
+    "VISIB_Count",
+    "WDSP_kn",
+    "WDSP_m/s",
+    "WDSP_Count",
+    "MXSPD_kn",
+    "MXSPD_m/s",
+    "GUST_kn",
+    "GUST_m/s",
+    "MAX_F",
+    "MAX_C",
+    "MAX_Flag",
+    "MIN_F",
+    "MIN_C",
+    "MIN_Flag",
+    "PRCP_in",
+    "PRCP_mm",
+    "PRCP_Flag",
+    "SNDP_in",
+    "SNDP_cm",
+    "FRSHTT_Fog",
+    "FRSHTT_Rain_or_Drizzle",
+    "FRSHTT_Snow_or_Ice_Pellets",
+    "FRSHTT_Hail",
+    "FRSHTT_Thunder",
+    "FRSHTT_Tornado_or_Funnel_Cloud",
+]
+
+
+def _read_op_fwf(f, fields: List[str]) -> pd.DataFrame:
+    """Reads the `fields` of an opened *.op file with `pd.read_fwf`."""
+    names = ["YEAR", "MONTH", "DAY"] + fields
+    colspecs = dict(zip(GSOD_NAMES, GSOD_COLSPECS))
+    op = pd.read_fwf(
+        f,
+        index_col="Date",
+        parse_dates={"Date": ["YEAR", "MONTH", "DAY"]},
+        colspecs=[colspecs[name] for name in names],
+        header=None,
+        names=names,
+        skiprows=1,
+        na_values={name: value for name, value in GSOD_NA_VALUES.items() if name in names},
+        dtypes=GSOD_DTYPES,
+    )
 
+    # Format USAF and WBAN as fixed-length numbers (strings)
+    if "USAF" in op:
+        op.USAF = op.USAF.map(str).str.zfill(6)
+    if "WBAN" in op:
+        op.WBAN = op.WBAN.map(str).str.zfill(5)
 
-def parse_gsod_op_file(op_path):
+    # Change these to bool, easier if you want to
+    # filter by these columns directly
+    frshtt_columns = [name for name in FRSHTT_COLUMNS if name in op]
+    op[frshtt_columns] = op[frshtt_columns].applymap(bool)
+    return op
+
+
+def _read_op_numpy(f, fields: List[str]) -> pd.DataFrame:
+    """
+    Reads the `fields` of an opened *.op file, same as `_read_op_fwf`
+
+    The lines all have the same layout, so the file is read as a matrix of
+    bytes and each column is decoded for all the days at once
+    """
+    chars = read_char_matrix(f, skiprows=1, width=GSOD_COLSPECS[-1][1])
+    colspecs = dict(zip(GSOD_NAMES, GSOD_COLSPECS))
+
+    year, month, day = (parse_integers(chars, *colspecs[name]) for name in ["YEAR", "MONTH", "DAY"])
+    months = np.asarray(year - 1970, dtype="datetime64[Y]").astype("datetime64[M]") + (month - 1)
+    dates = months.astype("datetime64[D]") + (day - 1)
+
+    columns = {}
+    for name in fields:
+        start, end = colspecs[name]
+        if name in ["USAF", "WBAN"] or name.endswith("_Flag"):
+            # USAFs can have letters too
+            columns[name] = parse_strings(chars, start, end)
+        elif name.endswith("_Count"):
+            columns[name] = parse_integers(chars, start, end)
+        elif name in FRSHTT_COLUMNS:
+            # Same as bool() of the digit: only '0' is False
+            columns[name] = chars[:, start] != ord("0")
+        else:
+            values = parse_numbers(chars, start, end)
+            if name in GSOD_NA_VALUES:
+                values[values == GSOD_NA_VALUES[name]] = np.nan
+            columns[name] = values
+
+    op = pd.DataFrame(columns, index=pd.DatetimeIndex(dates.astype("datetime64[ns]"), name="Date"))
+    # Format USAF and WBAN as fixed-length numbers (strings), once per station
+    for name, width in [("USAF", 6), ("WBAN", 5)]:
+        if name in op:
+            op[name] = op[name].map({value: str(value).zfill(width) for value in op[name].unique()})
+    return op
+
+
+def _gsod_fields(columns: List[str]) -> List[str]:
+    """The fields of the *.op files needed for `columns`, besides the date, in file order."""
+    needed = set()
+    for column in columns:
+        if column == "StationID":
+            needed.update(["USAF", "WBAN"])
+        elif column in GSOD_SI_CONVERSIONS:
+            needed.add(GSOD_SI_CONVERSIONS[column][0])
+        else:
+            needed.add(column)
+    return [name for name in GSOD_NAMES if name in needed]
+
+
+# Ways to read the raw columns, by `engine`
+_READERS = {
+    "numpy": _read_op_numpy,
+    "fwf": _read_op_fwf,
+}
+
+
+def parse_gsod_op_file(op_path, engine: str = "numpy", columns: Optional[List[str]] = None):
     """
     Parses the Wheater File downloaded from NOAA's GSOD
 
@@ -33,11 +330,21 @@ def parse_gsod_op_file(op_path):
 
     Args:
     ------
-        op_path (str, or list_like): Path to the *.op file, or a list of path
+        op_path (str, or list_like): Path to the *.op file, or a list of path.
+        gzip-compressed *.op.gz files are read transparently
 
         If a list, will parse all the files and concat the result in a single
         DataFrame
 
+        engine (str): how to read the fixed-width columns:
+            * 'numpy' (default): decodes each column for all the lines at
+              once with NumPy, several times faster
+            * 'fwf': with `pd.read_fwf`
+        Both give the same DataFrame
+
+        columns (list of str, optional): only decode these columns of
+        `GSOD_COLUMNS`, and the ones they are converted from. Defaults to all
+
     Returns:
     --------
         op (pd.DataFrame): a DataFrame of the parsed results
@@ -78,129 +385,19 @@ def parse_gsod_op_file(op_path):
     #
     # names = df.Name.tolist()
 
-    # Define the [start,end[ for the fixed-width format
-    colspecs = [
-        (0, 6),
-        (7, 12),
-        (14, 18),
-        (18, 20),
-        (20, 22),
-        (24, 30),
-        (31, 33),
-        (35, 41),
-        (42, 44),
-        (46, 52),
-        (53, 55),
-        (57, 63),
-        (64, 66),
-        (68, 73),
-        (74, 76),
-        (78, 83),
-        (84, 86),
-        (88, 93),
-        (95, 100),
-        (102, 108),
-        (108, 109),
-        (110, 116),
-        (116, 117),
-        (118, 123),
-        (123, 124),
-        (125, 130),
-        (132, 133),
-        (133, 134),
-        (134, 135),
-        (135, 136),
-        (136, 137),
-        (137, 138),
-    ]
-
-    # Define column names
-    names = [
-        "USAF",
-        "WBAN",
-        "YEAR",
-        "MONTH",
-        "DAY",
-        "TEMP_F",
-        "TEMP_Count",
-        "DEWP_F",
-        "DEWP_Count",
-        "SLP_mbar",
-        "SLP_Count",
-        "STP_mbar",
-        "STP_Count",
-        "VISIB_mi",
-        "VISIB_Count",
-        "WDSP_kn",
-        "WDSP_Count",
-        "MXSPD_kn",
-        "GUST_kn",
-        "MAX_F",
-        "MAX_Flag",
-        "MIN_F",
-        "MIN_Flag",
-        "PRCP_in",
-        "PRCP_Flag",
-        "SNDP_in",
-        "FRSHTT_Fog",
-        "FRSHTT_Rain_or_Drizzle",
-        "FRSHTT_Snow_or_Ice_Pellets",
-        "FRSHTT_Hail",
-        "FRSHTT_Thunder",
-        "FRSHTT_Tornado_or_Funnel_Cloud",
-    ]
-
-    # Force dtypes
-    dtypes = {
-        "DAY": np.int32,
-        "DEWP": np.float64,
-        "DEWP_Count": np.int32,
-        "FRSHTT_Fog": bool,
-        "FRSHTT_Hail": bool,
-        "FRSHTT_Rain_or_Drizzle": bool,
-        "FRSHTT_Snow_or_Ice_Pellets": bool,
-        "FRSHTT_Thunder": bool,
-        "FRSHTT_Tornado_or_Funnel_Cloud": bool,
-        "GUST": np.float64,
-        "MAX": np.float64,
-        "MAX_Flag": str,
-        "MIN": np.float64,
-        "MIN_Flag": str,
-        "MONTH": np.int32,
-        "MXSPD": np.float64,
-        "PRCP": np.float64,
-        "PRCP_Flag": str,
-        "SLP": np.float64,
-        "SLP_Count": np.int32,
-        "SNDP": np.float64,
-        "STP": np.float64,
-        "STP_Count": np.int32,
-        "TEMP": np.float64,
-        "TEMP_Count": np.int32,
-        "USAF": np.int32,
-        "VISIB": np.float64,
-        "VISIB_Count": np.int32,
-        "WBAN": np.int32,
-        "WDSP": np.float64,
-        "WDSP_Count": np.int32,
-        "YEAR": np.int32,
-    }
-
-    # Define NA values per column, based on gsod format description
-    na_values = {
-        "TEMP_F": 9999.9,
-        "DEWP_F": 9999.9,
-        "SLP_mbar": 9999.9,
-        "STP_mbar": 9999.9,
-        "VISIB_mi": 999.9,
-        "WDSP_kn": 999.9,
-        "MXSPD_kn": 999.9,
-        "GUST_kn": 999.9,
-        "MAX_F": 9999.9,
-        "MIN_F": 9999.9,
-        "PRCP_in": 99.9,
-        "SNDP_in": 999.9,
-    }
+    if engine not in _READERS:
+        raise ValueError("Unknown engine '{}', expected one of: {}".format(engine, ", ".join(_READERS)))
+    read_op = _READERS[engine]
+
+    if columns is None:
+        columns = GSOD_COLUMNS
+    else:
+        unknown = [column for column in columns if column not in GSOD_COLUMNS]
+        if unknown:
+            raise ValueError("Unknown columns: {}".format(", ".join(unknown)))
+        # In the usual order
+        columns = [column for column in GSOD_COLUMNS if column in columns]
+    fields = _gsod_fields(columns)
 
     # If a single path, put it in a list of one-element
     if not is_list_like(op_path):
@@ -208,119 +405,18 @@ def parse_gsod_op_file(op_path):
 
     all_ops = []
     for p in op_path:
-        i_op = pd.read_fwf(
-            p,
-            index_col="Date",
-            parse_dates={"Date": ["YEAR", "MONTH", "DAY"]},
-            colspecs=colspecs,
-            header=None,
-            names=names,
-            skiprows=1,
-            na_values=na_values,
-            dtypes=dtypes,
-        )
-        all_ops.append(i_op)
+        with open_maybe_gzip(p) as f:
+            all_ops.append(read_op(f, fields))
     op = pd.concat(all_ops)
-
-    # Format USAF and WBAN as fixed-length numbers (strings)
-    op.USAF = op.USAF.map(str).str.zfill(6)
-    op.WBAN = op.WBAN.map(str).str.zfill(5)
-    op["StationID"] = op.USAF + "-" + op.WBAN
-
-    # Change these to bool, easier if you want to
-    # filter by these columns directly
-    op[
-        [
-            "FRSHTT_Fog",
-            "FRSHTT_Rain_or_Drizzle",
-            "FRSHTT_Snow_or_Ice_Pellets",
-            "FRSHTT_Hail",
-            "FRSHTT_Thunder",
-            "FRSHTT_Tornado_or_Funnel_Cloud",
-        ]
-    ] = op[
-        [
-            "FRSHTT_Fog",
-            "FRSHTT_Rain_or_Drizzle",
-            "FRSHTT_Snow_or_Ice_Pellets",
-            "FRSHTT_Hail",
-            "FRSHTT_Thunder",
-            "FRSHTT_Tornado_or_Funnel_Cloud",
-        ]
-    ].applymap(
-        bool
-    )
+    if "StationID" in columns:
+        op["StationID"] = op.USAF + "-" + op.WBAN
 
     # Convert from IP units to SI (used by E+)
+    for column, (ip_column, convert) in GSOD_SI_CONVERSIONS.items():
+        if column in columns:
+            op[column] = convert(op[ip_column])
 
-    # Convert temperatures
-    op["TEMP_C"] = (op["TEMP_F"] - 32) * 5 / 9.0
-    op["DEWP_C"] = (op["DEWP_F"] - 32) * 5 / 9.0
-    op["MAX_C"] = (op["MAX_F"] - 32) * 5 / 9.0
-    op["MIN_C"] = (op["MIN_F"] - 32) * 5 / 9.0
-
-    # Convert millibars to Pa (1 mbar = 100 Pa)
-    op["SLP_Pa"] = op["SLP_mbar"] * 0.01
-    op["STP_Pa"] = op["STP_mbar"] * 0.01
-
-    # Convert knots to m/s (1 nautical mile = 1.852 km)
-    op["WDSP_m/s"] = op["WDSP_kn"] * 1852 / 3600.0
-    op["MXSPD_m/s"] = op["MXSPD_kn"] * 1852 / 3600.0
-    op["GUST_m/s"] = op["GUST_kn"] * 1852 / 3600.0
-
-    # Convert inches to meter multiples (1 in = 2.54 cm)
-    op["SNDP_cm"] = op["SNDP_in"] * 2.54
-    op["PRCP_mm"] = op["PRCP_in"] * 25.4
-
-    # Convert miles to km (1 mile = 1.60934 km)
-    op["VISIB_km"] = op["VISIB_mi"] * 1.60934
-
-    col_order = [
-        "StationID",
-        "USAF",
-        "WBAN",
-        "TEMP_F",
-        "TEMP_C",
-        "TEMP_Count",
-        "DEWP_F",
-        "DEWP_C",
-        "DEWP_Count",
-        "SLP_mbar",
-        "SLP_Pa",
-        "SLP_Count",
-        "STP_mbar",
-        "STP_Pa",
-        "STP_Count",
-        "VISIB_mi",
-        "VISIB_km",
-        "VISIB_Count",
-        "WDSP_kn",
-        "WDSP_m/s",
-        "WDSP_Count",
-        "MXSPD_kn",
-        "MXSPD_m/s",
-        "GUST_kn",
-        "GUST_m/s",
-        "MAX_F",
-        "MAX_C",
-        "MAX_Flag",
-        "MIN_F",
-        "MIN_C",
-        "MIN_Flag",
-        "PRCP_in",
-        "PRCP_mm",
-        "PRCP_Flag",
-        "SNDP_in",
-        "SNDP_cm",
-        "FRSHTT_Fog",
-        "FRSHTT_Rain_or_Drizzle",
-        "FRSHTT_Snow_or_Ice_Pellets",
-        "FRSHTT_Hail",
-        "FRSHTT_Thunder",
-        "FRSHTT_Tornado_or_Funnel_Cloud",
-    ]
-
-    op = op[col_order]
+    op = op[columns]
 
     return op
 
@@ -0,0 +1,229 @@
+"""NOAA's isd-inventory.csv: the number of observations per station and month."""
+
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from pygsod.constants import ISDINVENTORY_PATH
+from pygsod.transport import FTPTransport, Transport
+from pygsod.utils import as_path
+
+# Where isd-inventory.csv lives on NOAA's servers
+ISDINVENTORY_REMOTE_PATH = "/pub/data/noaa/isd-inventory.csv"
+
+# How old the local isd-inventory.csv can get before it is downloaded again,
+# in seconds: 30 days
+MAX_AGE = 30 * 24 * 60 * 60
+
+MONTHS = ["JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC"]
+
+# Counts are stored as uint16: a month with more observations than that is
+# recorded as having this many, which is plenty to tell whether it has data
+MAX_COUNT = np.iinfo(np.uint16).max
+
+
+class ISDInventory:
+    """
+    Class for the ISDInventory file and methods
+
+    `isd-inventory.csv` has the number of observations of each station, for
+    each year and month. It tells which station-years actually have data,
+    gaps included, which the BEGIN/END of `isd-history.csv` doesn't.
+
+    It is stored compactly, one row per station-year that has an entry,
+    grouped by station and sorted by year:
+        * `stations`: the USAF-WBANs, `offsets[i]:offsets[i + 1]` being the
+          rows of `stations[i]`
+        * `years`: (n_rows,) int16, the year of each row
+        * `counts`: (n_rows, 12) uint16, the observations per month
+    """
+
+    def __init__(self, isd_inventory_path: Optional[Path] = None, transport: Optional[Transport] = None):
+        """
+        Init the ISDInventory. Checks if exists, if not downloads it, then
+        loads it
+
+        Args:
+        ------
+            isd_inventory_path (str): path to `isd-inventory.csv`, optional,
+            will default to ../support/isd-inventory.csv
+
+            transport (Transport): how to reach NOAA's data, to download
+            `isd-inventory.csv` if needed. Defaults to NOAA's FTP
+
+        """
+        self.transport = transport
+
+        if isd_inventory_path is None:
+            self.isd_inventory_path = ISDINVENTORY_PATH
+        else:
+            self.isd_inventory_path = as_path(isd_inventory_path)
+
+        self.update_isd_inventory()
+        self._parse_inventory()
+
+    def update_isd_inventory(self, force: bool = False) -> bool:
+        """
+        Will download the `isd-inventory.csv` file if it doesn't exist, or
+        if the local copy was modified more than `MAX_AGE` (30 days) ago.
+        Unlike `ISDHistory.update_isd_history`, the remote file isn't checked
+        for changes: it is updated monthly and large, so its age is enough
+
+        Args:
+        ------
+            force (bool, optional): whether to force an update or not
+
+        Returns:
+        --------
+            update_needed (bool): True if updated, False otherwise
+
+        """
+        update_needed = force
+        if not self.isd_inventory_path.is_file():
+            print("isd-inventory.csv not found, will download it")
+            update_needed = True
+        elif time.time() - self.isd_inventory_path.lstat().st_mtime > MAX_AGE:
+            update_needed = True
+
+        if update_needed and not self.download_isd_inventory(self.isd_inventory_path, transport=self.transport):
+            raise ValueError(f"Something went wrong when downloading isd-inventory.csv to {self.isd_inventory_path}")
+
+        return update_needed
+
+    @staticmethod
+    def download_isd_inventory(isd_inventory_path: Path, transport: Optional[Transport] = None) -> bool:
+        """
+        Downloads the isd-inventory.csv from NOAA
+
+        Args:
+        ------
+            isd_inventory_path (str): path on local disk to save the file
+
+            transport (Transport, optional): how to reach NOAA's data. A fresh
+                session with the same settings is opened for the download.
+                Defaults to NOAA's FTP
+
+        Returns:
+        --------
+            success (bool): whether it worked or not
+
+        """
+        if transport is None:
+            transport = FTPTransport()
+
+        # Write to a temp file then move it, so that an interrupted transfer
+        # never leaves a truncated, yet recent, isd-inventory.csv behind
+        isd_inventory_path = as_path(isd_inventory_path)
+        tmp_path = isd_inventory_path.with_name(isd_inventory_path.name + ".tmp")
+        try:
+            with transport.clone() as session:
+                with open(tmp_path, "wb") as f:
+                    session.retrieve(ISDINVENTORY_REMOTE_PATH, f.write)
+            os.replace(tmp_path, isd_inventory_path)
+        except Exception as err:
+            print("'isd-inventory.csv' failed to download")
+            print("  {}".format(err))
+            if tmp_path.exists():
+                tmp_path.unlink()
+            return False
+
+        print("Success: isd-inventory.csv loaded")
+        return True
+
+    def _parse_inventory(self):
+        """Loads the isd-inventory.csv into the compact arrays."""
+        df = pd.read_csv(
+            self.isd_inventory_path,
+            sep=",",
+            dtype={"USAF": str, "WBAN": str, "YEAR": np.int16, **{month: np.int64 for month in MONTHS}},
+        )
+        station_ids = df["USAF"] + "-" + df["WBAN"].str.zfill(5)
+
+        codes, stations = pd.factorize(station_ids, sort=True)
+        order = np.lexsort((df["YEAR"].to_numpy(), codes))
+
+        self.stations = pd.Index(stations)
+        self.offsets = np.searchsorted(codes[order], np.arange(len(stations) + 1))
+        self.years = df["YEAR"].to_numpy()[order]
+        self.counts = np.minimum(df[MONTHS].to_numpy()[order], MAX_COUNT).astype(np.uint16)
+        # The last year the inventory covers, later ones are unknown
+        self.last_year = int(self.years.max()) if len(self.years) else 0
+
+        self._station_codes: Dict[str, int] = {usaf_wban: i for i, usaf_wban in enumerate(stations)}
+
+    def _row(self, usaf_wban: str, year: int) -> Optional[int]:
+        """The row of a station-year in `counts`, None if it has no entry."""
+        code = self._station_codes.get(usaf_wban)
+        if code is None:
+            return None
+        start, end = self.offsets[code], self.offsets[code + 1]
+        row = start + np.searchsorted(self.years[start:end], year)
+        if row < end and self.years[row] == year:
+            return int(row)
+        return None
+
+    def monthly_counts(self, usaf_wban: str, year: int) -> np.ndarray:
+        """The (12,) observations per month of a station-year, zeros if it has no entry."""
+        row = self._row(usaf_wban, year)
+        if row is None:
+            return np.zeros(12, dtype=np.uint16)
+        return self.counts[row]
+
+    def has_data(self, usaf_wban: str, year: int) -> Optional[bool]:
+        """
+        Whether the station has any observation in `year`
+
+        Returns:
+        --------
+            has_data (bool or None): None if the inventory doesn't know: the
+                station isn't in it, or `year` is after `last_year`
+        """
+        if usaf_wban not in self._station_codes or year > self.last_year:
+            return None
+        row = self._row(usaf_wban, year)
+        return row is not None and bool(self.counts[row].any())
+
+    def rank_stations(self, years: Iterable[int], stations: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Ranks stations by how complete their records are over `years`
+
+        Args:
+        ------
+            years (list of int): the years of interest
+
+            stations (list of str, optional): USAF-WBANs to rank, defaults to
+                all the stations in the inventory
+
+        Returns:
+        --------
+            ranking (pd.DataFrame): indexed by USAF-WBAN, with the number of
+                'months' with data, the number of 'observations', and the
+                'completeness', the fraction of the months of `years` with
+                data. Most complete first
+
+        """
+        years = np.unique(np.asarray(list(years), dtype=np.int16))
+
+        station_codes = np.repeat(np.arange(len(self.stations)), np.diff(self.offsets))
+        in_years = np.isin(self.years, years)
+        counts = self.counts[in_years]
+        months = np.bincount(station_codes[in_years], weights=(counts > 0).sum(axis=1), minlength=len(self.stations))
+        observations = np.bincount(
+            station_codes[in_years], weights=counts.sum(axis=1, dtype=np.int64), minlength=len(self.stations)
+        )
+
+        ranking = pd.DataFrame(
+            {
+                "months": months.astype(np.int32),
+                "observations": observations.astype(np.int64),
+                "completeness": months / (12 * max(len(years), 1)),
+            },
+            index=self.stations,
+        )
+        if stations is not None:
+            ranking = ranking.reindex(stations, fill_value=0)
+        return ranking.sort_values(["completeness", "observations"], ascending=False, kind="stable")
@@ -11,17 +11,123 @@ Weather stations are stored into the file `weatherfiles.txt`
 with the syntax "USAF-WBAN"
 
 """
+
 import datetime
 import os
+import re
+from typing import List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 
 from pygsod.constants import WEATHER_DIR
+from pygsod.fixedwidth import parse_integers, parse_numbers, read_char_matrix
 from pygsod.noaadata import NOAAData
-from pygsod.utils import DataType, get_valid_year, is_list_like
+from pygsod.utils import DataType, get_valid_year, is_list_like, open_maybe_gzip, strip_gz_suffix
+
+# Define the [start,end[ for the fixed-width format. isd-lite-format.txt
+# gives Pos 9-11 for the 2-digit DAY, which offsets everything after it: the
+# fields are actually 4-digit YEAR, 2-digit MONTH, DAY and HOUR separated by
+# blanks, then 6 characters per value
+ISD_LITE_COLSPECS = [
+    (0, 4),
+    (5, 7),
+    (8, 10),
+    (11, 13),
+    (13, 19),
+    (19, 25),
+    (25, 31),
+    (31, 37),
+    (37, 43),
+    (43, 49),
+    (49, 55),
+    (55, 61),
+]
+
+# Define column names
+ISD_LITE_NAMES = [
+    "YEAR",
+    "MONTH",
+    "DAY",
+    "HOUR",
+    "TEMP_C",
+    "DEWP_C",
+    "SLP_HPa",
+    "WIND_dir",
+    "WDSP_ms",
+    "SkyCond",
+    "PRCP_mm_1hr",
+    "PRCP_mm_6hr",
+]
+
+# The values are stored as integers, scaled by these factors
+ISD_LITE_SCALE_FACTORS = {
+    "TEMP_C": 10.0,
+    "DEWP_C": 10.0,
+    "SLP_HPa": 10.0,
+    "WIND_dir": 1.0,
+    "WDSP_ms": 10.0,
+    "SkyCond": 1.0,
+    "PRCP_mm_1hr": 10.0,
+    "PRCP_mm_6hr": 10.0,
+}
+
+# Sentinel for missing values, in all the value fields
+ISD_LITE_NA_VALUE = -9999
+
+# The columns of `parse_isd_lite_op_file`, in order
+ISD_LITE_COLUMNS = ["HOUR"] + list(ISD_LITE_SCALE_FACTORS) + ["USAF", "WBAN", "StationID"]
+
+# Station files are named 'USAF-WBAN-YEAR' on NOAA's servers
+_ISD_LITE_NAME = re.compile(r"^(?P<usaf>[0-9A-Z]{6})-(?P<wban>[0-9]{5})-[0-9]{4}$")
+
+
+def _read_isd_lite(f, columns: List[str]) -> pd.DataFrame:
+    """
+    Reads the `columns` of an opened ISD-Lite file that are in it, indexed
+    by the date and hour
+
+    The lines all have the same layout, so the file is read as a matrix of
+    bytes and each field is decoded for all the hours at once: the date parts
+    as small integers, the values as one (n, n_values) float block that the
+    sentinels are masked in and that is scaled at once. Only the fields of
+    `columns` are decoded. Fields missing from short lines are NaN
+    """
+    chars = read_char_matrix(f, width=ISD_LITE_COLSPECS[-1][1])
+    fields = dict(zip(ISD_LITE_NAMES, ISD_LITE_COLSPECS))
+
+    year = parse_integers(chars, *fields["YEAR"], dtype=np.int32)
+    month, day, hour = (parse_integers(chars, *fields[name], dtype=np.int16) for name in ["MONTH", "DAY", "HOUR"])
+    months = np.asarray(year - 1970, dtype="datetime64[Y]").astype("datetime64[M]") + (month - 1)
+    dates = (months.astype("datetime64[D]") + (day - 1)).astype("datetime64[h]") + hour
+
+    names = [name for name in ISD_LITE_SCALE_FACTORS if name in columns]
+    # float, not int16: blank fields, eg stripped from short lines, are NaN
+    values = np.empty((len(chars), len(names)), dtype=np.float64)
+    for i, name in enumerate(names):
+        values[:, i] = parse_numbers(chars, *fields[name])
+    values[values == ISD_LITE_NA_VALUE] = np.nan
+    values /= np.array([ISD_LITE_SCALE_FACTORS[name] for name in names])
+
+    op = pd.DataFrame(values, columns=names, index=pd.DatetimeIndex(dates.astype("datetime64[ns]"), name="Date"))
+    if "HOUR" in columns:
+        op.insert(0, "HOUR", hour.astype(np.int64))
+    return op
+
+
+def _usaf_wban_from_name(path) -> Tuple[Optional[str], Optional[str]]:
+    """
+    The USAF and WBAN of an ISD-Lite file named like on NOAA's servers,
+    'USAF-WBAN-YEAR(.gz)', (None, None) otherwise: eg the files that
+    `NOAAData` saves are named after the station
+    """
+    match = _ISD_LITE_NAME.match(strip_gz_suffix(path).name)
+    if match is None:
+        return None, None
+    return match.group("usaf"), match.group("wban")
 
 
-def parse_isd_lite_op_file(op_path):
+def parse_isd_lite_op_file(op_path, columns: Optional[List[str]] = None):
     """
     Parses the Wheater File downloaded from NOAA's ISD-Lite
 
@@ -32,14 +138,21 @@ def parse_isd_lite_op_file(op_path):
 
     Args:
     ------
-        op_path (str, or list_like): Path to the *.op file, or a list of path
+        op_path (str, or list_like): Path to the *.op file, or a list of path.
+        gzip-compressed *.gz files are read transparently
 
         If a list, will parse all the files and concat the result in a single
         DataFrame
 
+        columns (list of str, optional): only decode these columns of
+        `ISD_LITE_COLUMNS`. Defaults to all
+
     Returns:
     --------
-        op (pd.DataFrame): a DataFrame of the parsed results
+        op (pd.DataFrame): a DataFrame of the parsed results, indexed by the
+        date and hour of the observations. USAF, WBAN and StationID are
+        parsed from the file names when named like on NOAA's servers,
+        'USAF-WBAN-YEAR(.gz)', None otherwise
 
     Needs:
     -------------------------------
@@ -77,82 +190,14 @@ def parse_isd_lite_op_file(op_path):
     #
     # names = df.Name.tolist()
 
-    # TODO: not working
-    # Define the [start,end[ for the fixed-width format
-    # colspecs = [
-    #     (0, 4),
-    #     (5, 7),
-    #     (8, 11),
-    #     (11, 13),
-    #     (13, 19),
-    #     (19, 24),
-    #     (25, 31),
-    #     (31, 37),
-    #     (37, 43),
-    #     (43, 49),
-    #     (49, 55),
-    #     (55, 61),
-    # ]
-
-    # Define column names
-    names = [
-        "YEAR",
-        "MONTH",
-        "DAY",
-        "HOUR",
-        "TEMP_C",
-        "DEWP_C",
-        "SLP_HPa",
-        "WIND_dir",
-        "WDSP_ms",
-        "SkyCond",
-        "PRCP_mm_1hr",
-        "PRCP_mm_6hr",
-    ]
-
-    scale_factors = {
-        "YEAR": None,
-        "MONTH": None,
-        "DAY": None,
-        "HOUR": None,
-        "TEMP_C": 10.0,
-        "DEWP_C": 10.0,
-        "SLP_HPa": 10.0,
-        "WIND_dir": 1.0,
-        "WDSP_ms": 10.0,
-        "SkyCond": None,
-        "PRCP_mm_1hr": 10.0,
-        "PRCP_mm_6hr": 10.0,
-    }
-
-    # TODO: use that!
-    # Force dtypes
-    # dtypes = {
-    #     "YEAR": np.int32,
-    #     "MONTH": np.int32,
-    #     "DAY": np.int32,
-    #     "HOUR": np.int32,
-    #     "TEMP_C": np.float64,
-    #     "DEWP_C": np.float64,
-    #     "SLP_HPa": np.float64,
-    #     "WIND_dir": np.float64,
-    #     "WDSP_ms": np.float64,
-    #     # 'SkyCond': np.float64,
-    #     "PRCP_mm_1hr": np.float64,
-    #     "PRCP_mm_6hr": np.float64,
-    # }
-
-    # Define NA values per column, based on gsod format description
-    na_values = {
-        "TEMP_C": -9999,
-        "DEWP_C": -9999,
-        "SLP_HPa": -9999,
-        "WIND_dir": -9999,
-        "WDSP_ms": -9999,
-        "SkyCond": -9999,
-        "PRCP_mm_1hr": -9999,
-        "PRCP_mm_6hr": -9999,
-    }
+    if columns is None:
+        columns = ISD_LITE_COLUMNS
+    else:
+        unknown = [column for column in columns if column not in ISD_LITE_COLUMNS]
+        if unknown:
+            raise ValueError("Unknown columns: {}".format(", ".join(unknown)))
+        # In the usual order
+        columns = [column for column in ISD_LITE_COLUMNS if column in columns]
 
     # If a single path, put it in a list of one-element
     if not is_list_like(op_path):
@@ -160,39 +205,21 @@ def parse_isd_lite_op_file(op_path):
 
     all_ops = []
     for p in op_path:
-        # TODO: NOT WORKING, there's an offset problem with the colspecs
-        # I parsed from the isd-lite-format.txt
-        # i_op = pd.read_fwf(p, index_col='Date',
-        # parse_dates={'Date': ['YEAR', 'MONTH', 'DAY']},
-        # colspecs=colspecs, header=None, names=names,
-        # skiprows=1,
-        # na_values=na_values, dtypes=dtypes)
-
-        i_op = pd.read_csv(
-            p,
-            sep=r"\s+",
-            index_col="Date",
-            parse_dates={"Date": ["YEAR", "MONTH", "DAY"]},
-            header=None,
-            names=names,
-            skiprows=1,
-            na_values=na_values,
-        )
-
-        # Parse USAF-WBAN from the file
-        fname = os.path.basename(p)
-        usaf, wban, year = fname.split("-")
-        i_op["USAF"] = usaf
-        i_op["WBAN"] = wban
-        i_op["StationID"] = "{}-{}".format(usaf, wban)
+        with open_maybe_gzip(p) as f:
+            i_op = _read_isd_lite(f, columns)
+
+        # Parse USAF-WBAN from the file, if named like NOAA's 'USAF-WBAN-YEAR'
+        usaf, wban = _usaf_wban_from_name(p)
+        if "USAF" in columns:
+            i_op["USAF"] = usaf
+        if "WBAN" in columns:
+            i_op["WBAN"] = wban
+        if "StationID" in columns:
+            i_op["StationID"] = "{}-{}".format(usaf, wban) if usaf is not None else None
 
         all_ops.append(i_op)
     op = pd.concat(all_ops)
 
-    for k, v in scale_factors.items():
-        if v is not None:
-            op[k] = op[k] / v
-
     return op
 
 
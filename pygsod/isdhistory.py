@@ -1,23 +1,72 @@
+import datetime
+import json
+import os
+import pickle
+import threading
 import time
-from ftplib import FTP
 
 # For the Haversine Formula
 from math import asin, cos, sqrt
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 
 from pygsod.constants import ISDHISTORY_PATH
+from pygsod.search import StationSearch
+from pygsod.spatial import StationIndex, chord_to_km, to_unit_vectors
+from pygsod.transport import FTPTransport, Transport
 from pygsod.utils import as_path
 
+# Where isd-history.csv lives on NOAA's servers
+ISDHISTORY_REMOTE_PATH = "/pub/data/noaa/isd-history.csv"
+
+# How often NOAA's isd-history.csv is checked for changes, in seconds: 1 day
+FRESHNESS_CHECK_INTERVAL = 24 * 60 * 60
+
+# How long to wait before checking again after a check failed, eg offline, in
+# seconds: 1 hour
+FRESHNESS_RETRY_INTERVAL = 60 * 60
+
+# Socket timeout of the check with the default transport, in seconds, so that
+# an unreachable server doesn't hang `ISDHistory()`
+FRESHNESS_CHECK_TIMEOUT = 10
+
+# Bumped whenever the parsed table changes, to invalidate the existing snapshots
+SNAPSHOT_VERSION = 1
+
+# Points per chunk in `closest_weather_station_batch`: each chunk allocates a
+# (chunk, n_stations) float64 matrix, about 30 MB for the ~30k stations
+BATCH_CHUNK_SIZE = 128
+
+# Default weights of the criteria of `rank_stations`
+RANKING_WEIGHTS = {"distance": 1.0, "elevation": 1.0, "coverage": 1.0}
+
+# What counts as 1 in the penalties of `rank_stations`: 100 km away, 100 m
+# higher or lower
+DISTANCE_SCALE = 100.0
+ELEVATION_SCALE = 100.0
+
+# isd-history.csv's ELEV(M) for unknown elevations is -999 or -999.9
+MISSING_ELEVATION = -999.0
+
 
 class ISDHistory:
     """
     Class for the ISDHistory file and methods
+
+    Use `ISDHistory.shared` to load each isd-history.csv only once per
+    process, rather than once per instance
     """
 
-    def __init__(self, isd_history_path: Optional[Path] = None):
+    # (resolved path, compact) => the instance loaded from it, see `shared`
+    _shared: Dict[Tuple[Path, bool], "ISDHistory"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self, isd_history_path: Optional[Path] = None, transport: Optional[Transport] = None, compact: bool = False
+    ):
         """
         Init the ISDHistory. Checks if exists, if not downloads it,
         stores the outpath
@@ -27,7 +76,22 @@ class ISDHistory:
             isd_history_path (str): path to `isd-history.csv`, optional,
             will default to ../support/isd-history.csv
 
+            transport (Transport): how to reach NOAA's data, to download
+            `isd-history.csv` if needed. Defaults to NOAA's FTP
+
+            compact (bool): load `df` with memory-compact dtypes: the text
+            columns as categoricals, LAT/LON/ELEV(M) as float32, and
+            BEGIN/END as int32 YYYYMMDD (0 if unknown) rather than
+            datetimes. Still indexed by USAF-WBAN. Use `years` and `date`
+            to read BEGIN/END either way
+
         """
+        self.transport = transport
+        self.compact = compact
+        self._spatial_index: Optional[StationIndex] = None
+        self._indexes_lock = threading.Lock()
+        self._search: Optional[StationSearch] = None
+
         # If isd_history_path isn't supplied, set it to the default path
         if isd_history_path is None:
             self.isd_history_path = ISDHISTORY_PATH
@@ -38,34 +102,80 @@ class ISDHistory:
         self.update_isd_history()
         self._parse_isd()
 
+    @classmethod
+    def shared(
+        cls, isd_history_path: Optional[Path] = None, transport: Optional[Transport] = None, compact: bool = False
+    ) -> "ISDHistory":
+        """
+        The ISDHistory of `isd_history_path`, shared within the process: it
+        is only checked for updates and parsed by the first call, later calls
+        for the same path (and `compact`) return the same instance. Use
+        `invalidate` to reload it
+
+        Its `df` is shared too, so it must not be modified in place
+
+        Args:
+        ------
+            isd_history_path (str): path to `isd-history.csv`, optional,
+            will default to ../support/isd-history.csv
+
+            transport (Transport): how to reach NOAA's data, only used by the
+            first call, to download `isd-history.csv` if needed
+
+            compact (bool): see `ISDHistory`
+
+        """
+        if isd_history_path is None:
+            isd_history_path = ISDHISTORY_PATH
+        key = (as_path(isd_history_path).resolve(), compact)
+        # Held while loading, so that concurrent first calls load it once
+        with cls._shared_lock:
+            isd = cls._shared.get(key)
+            if isd is None:
+                isd = cls(isd_history_path, transport=transport, compact=compact)
+                cls._shared[key] = isd
+        return isd
+
+    @classmethod
+    def invalidate(cls, isd_history_path: Optional[Path] = None) -> None:
+        """
+        Drops the shared instance of `isd_history_path`, so that the next call
+        to `shared` reloads it. All of them if None
+        """
+        with cls._shared_lock:
+            if isd_history_path is None:
+                cls._shared.clear()
+            else:
+                path = as_path(isd_history_path).resolve()
+                for compact in (False, True):
+                    cls._shared.pop((path, compact), None)
+
     def update_isd_history(self, force=False, dry_run=False):
         """
         Will download the `isd-history.csv` file
         if one of two conditions are true:
             * The `isd-history.csv` does not exist in the ../support/ folder
-            * the `isd-history.csv` is older than 1 month
+            * the `isd-history.csv` on NOAA's servers changed since it was
+              downloaded: its size and modification time are compared to the
+              ones recorded at the time, see `remote_state_path`
+
+        The remote check itself is a single SIZE/MDTM (FTP) or HEAD (HTTPS)
+        request, done at most every `FRESHNESS_CHECK_INTERVAL` seconds. If it
+        fails, eg: offline, the local copy is kept
 
         `isd-history.csv` is the list of weather stations, it includes start
             and end dates
 
         Args:
         ------
-            isd_history_path (str, Optional): path to `isd-history.csv`.
-                If None, will get the ISDHistory instance's `isd_pat` that was
-                set during initialization
-
             force (bool, optional): whether to force an update or not
 
+            dry_run (bool, optional): only check, don't download
+
         Returns:
         --------
             update_needed (bool): True if updated, False otherwise
 
-        Needs:
-        -------------------------------
-            import os
-            from ftplib import FTP
-            import time
-
         """
 
         update_needed = False
@@ -73,59 +183,127 @@ class ISDHistory:
         if self.isd_history_path.is_file():
             tm_time = self.isd_history_path.lstat().st_mtime
             print("isd-history.csv was last modified on: %s" % time.ctime(tm_time))
-            # Check if the isd-history.csv is older than 1 month
-            _d = 1 * 30 * 24 * 60 * 60
-            if time.time() - tm_time > _d:
-                update_needed = True
-            elif force:
+            if force:
                 print("Forcing update anyways")
                 update_needed = True
+            else:
+                update_needed = self._remote_changed()
         else:
             print("isd-history.csv not found, will download it")
             update_needed = True
 
         if update_needed:
             if not dry_run:
-                ret = self.download_isd(isd_history_path=self.isd_history_path)
+                ret = self.download_isd(isd_history_path=self.isd_history_path, transport=self.transport)
                 if not ret:
                     raise ValueError(
                         f"Something went wrong when downloading isd-history.csv to {self.isd_history_path}"
                     )
 
         else:
-            print("No updates necessary: isd-history.csv is not" " older than one month")
+            print("No updates necessary: isd-history.csv is up to date")
 
         return update_needed
 
+    @property
+    def remote_state_path(self) -> Path:
+        """Where the remote size and modification time of isd-history.csv are recorded, next to it."""
+        return ISDHistory._remote_state_path(self.isd_history_path)
+
+    @staticmethod
+    def _remote_state_path(isd_history_path: Path) -> Path:
+        return isd_history_path.with_name(isd_history_path.name + ".remote.json")
+
+    @staticmethod
+    def _write_remote_state(isd_history_path: Path, state: dict) -> None:
+        state_path = ISDHistory._remote_state_path(isd_history_path)
+        tmp_path = state_path.with_name(state_path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, state_path)
+
     @staticmethod
-    def download_isd(isd_history_path: Path):
+    def _save_remote_state(isd_history_path: Path, size: int, mtime: str) -> None:
+        """Records the remote (`size`, `mtime`) the local copy matches, as of now."""
+        ISDHistory._write_remote_state(isd_history_path, {"size": size, "mtime": mtime, "checked_at": time.time()})
+
+    def _remote_changed(self) -> bool:
+        """
+        Whether the remote isd-history.csv changed since the local copy was
+        downloaded. False if it was checked less than
+        `FRESHNESS_CHECK_INTERVAL` ago, or can't be checked: failures are
+        recorded too, and not retried for `FRESHNESS_RETRY_INTERVAL`
+        """
+        state = {}
+        try:
+            with open(self.remote_state_path, "r") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        now = time.time()
+        if now - state.get("checked_at", 0) < FRESHNESS_CHECK_INTERVAL:
+            return False
+        if now - state.get("failed_at", 0) < FRESHNESS_RETRY_INTERVAL:
+            return False
+
+        transport = self.transport if self.transport is not None else FTPTransport(timeout=FRESHNESS_CHECK_TIMEOUT)
+        try:
+            with transport.clone() as session:
+                size, mtime = session.stat(ISDHISTORY_REMOTE_PATH)
+            if size is None or mtime is None:
+                raise ValueError("the server doesn't tell its size and modification time")
+        except Exception as err:
+            print("Couldn't check whether isd-history.csv changed, keeping the local copy: {}".format(err))
+            try:
+                self._write_remote_state(self.isd_history_path, dict(state, failed_at=now))
+            except OSError:
+                pass
+            return False
+
+        if "size" in state:
+            changed = (size, mtime) != (state["size"], state["mtime"])
+        else:
+            # Downloaded before the remote state was recorded: the size is all we have
+            changed = size != self.isd_history_path.stat().st_size
+
+        if changed:
+            print("isd-history.csv changed on NOAA's servers, will download it")
+        else:
+            self._save_remote_state(self.isd_history_path, size, mtime)
+        return changed
+
+    @staticmethod
+    def download_isd(isd_history_path: Path, transport: Optional[Transport] = None):
         """
-        Downloads the isd-history.csv from NOAA
+        Downloads the isd-history.csv from NOAA, and records its remote size
+        and modification time, see `update_isd_history`
 
         Args:
         -----
             isd_history_path (str): path on local disk to save the file
 
+            transport (Transport, optional): how to reach NOAA's data. A fresh
+                session with the same settings is opened for the download, so
+                `transport` itself is left untouched. Defaults to NOAA's FTP
+
         Returns:
         --------
             success (bool): whether it worked or not
 
-        Needs:
-        -------------------------------
-            from ftplib import FTP
-
         """
 
-        ftp = FTP("ftp.ncdc.noaa.gov")
-        ftp.login()
+        if transport is None:
+            transport = FTPTransport()
 
-        # Change current working directory on FTP
-        # isd-history is now stored there
-        ftp.cwd("/pub/data/noaa/")
         success = False
         # Try to retrieve it
         try:
-            ftp.retrbinary("RETR isd-history.csv", open(isd_history_path, "wb").write)
+            with transport.clone() as session:
+                size, mtime = session.stat(ISDHISTORY_REMOTE_PATH)
+                with open(isd_history_path, "wb") as f:
+                    session.retrieve(ISDHISTORY_REMOTE_PATH, f.write)
+            ISDHistory._save_remote_state(isd_history_path, size, mtime)
             success = True
         except Exception as err:
             print("'isd-history.csv' failed to download")
@@ -133,27 +311,147 @@ class ISDHistory:
             return False
 
         print("Success: isd-history.csv loaded")
-        ftp.quit()
 
         return success
 
+    @property
+    def snapshot_path(self) -> Path:
+        """Where the parsed table is cached, next to isd-history.csv."""
+        suffix = ".compact.pkl" if self.compact else ".pkl"
+        return self.isd_history_path.with_name(self.isd_history_path.name + suffix)
+
     def _parse_isd(self):
         """
         Loads the isd-history.csv into a pandas dataframe.
 
         Will serve to check if the station has data up to the year we want data from and get
         its full name for reporting
+
+        The parsed table is cached as a binary snapshot, see `snapshot_path`,
+        which is used instead of parsing the CSV again as long as the CSV
+        keeps the same modification time and size
         """
 
-        self.df = pd.read_csv(self.isd_history_path, sep=",", parse_dates=[9, 10])
+        snapshot_key = self._snapshot_key()
+        self.df = self._load_snapshot(snapshot_key)
+        if self.df is None:
+            self.df = self._read_isd_csv()
+            if self.compact:
+                self.df = self._compact(self.df)
+            self._save_snapshot(snapshot_key, self.df)
+
+        # Cached for the distance computations, which never touch `df`
+        self._lat_rad = np.radians(self.df["LAT"].to_numpy(dtype=np.float64))
+        self._lon_rad = np.radians(self.df["LON"].to_numpy(dtype=np.float64))
+        self._cos_lat = np.cos(self._lat_rad)
+        self._unit_vectors = to_unit_vectors(self.df["LAT"], self.df["LON"])
+        self._elevations = self.df["ELEV(M)"].to_numpy(dtype=np.float64)
+        self._elevations = np.where(self._elevations <= MISSING_ELEVATION, np.nan, self._elevations)
+        # Unknown BEGIN/END never cover the years filtered on, like `df["END"].dt.year >= year`
+        self._begin_years = self.years(self.df["BEGIN"], missing=9999)
+        self._end_years = self.years(self.df["END"], missing=0)
+        self._spatial_index = None
+        self._search = None
+
+    def _read_isd_csv(self) -> pd.DataFrame:
+        """Parses isd-history.csv into a dataframe indexed by USAF-WBAN."""
+        df = pd.read_csv(self.isd_history_path, sep=",", parse_dates=[9, 10])
 
         # Need to format the USAF with leading zeros as needed
         # should always be len of 6, WBAN len 5
         # USAF now is a string, and has len 6 so no problem
 
-        self.df["StationID"] = self.df["USAF"] + "-" + self.df["WBAN"].map("{:05d}".format)
+        df["StationID"] = df["USAF"] + "-" + df["WBAN"].map("{:05d}".format)
+
+        return df.set_index("StationID")
+
+    @staticmethod
+    def _compact(df: pd.DataFrame) -> pd.DataFrame:
+        """The table with memory-compact dtypes, see `ISDHistory`."""
+        df = df.copy()
+        for col in ["USAF", "CTRY", "STATE", "ICAO", "STATION NAME"]:
+            df[col] = df[col].astype("category")
+        df["WBAN"] = df["WBAN"].astype(np.int32)
+        for col in ["LAT", "LON", "ELEV(M)"]:
+            df[col] = df[col].astype(np.float32)
+        for col in ["BEGIN", "END"]:
+            dates = df[col]
+            df[col] = (dates.dt.year * 10000 + dates.dt.month * 100 + dates.dt.day).fillna(0).astype(np.int32)
+        return df
+
+    @staticmethod
+    def years(dates: pd.Series, missing: int = 0) -> np.ndarray:
+        """
+        The years of a BEGIN/END column, whether compact or not
+
+        Args:
+        ------
+            dates (pd.Series): datetimes, or int YYYYMMDD (0 if unknown)
+
+            missing (int): the year to use for unknown dates
+
+        Returns:
+        --------
+            years (np.ndarray): int32
+        """
+        if pd.api.types.is_datetime64_any_dtype(dates):
+            return dates.dt.year.fillna(missing).to_numpy(dtype=np.int32)
+        dates = dates.to_numpy()
+        return np.where(dates > 0, dates // 10000, missing).astype(np.int32)
+
+    @staticmethod
+    def date(value) -> Optional[datetime.date]:
+        """A BEGIN/END value as a date, whether compact or not, None if unknown."""
+        if isinstance(value, (int, np.integer)):
+            if value <= 0:
+                return None
+            return datetime.date(int(value) // 10000, int(value) // 100 % 100, int(value) % 100)
+        if pd.isna(value):
+            return None
+        return value.date()
+
+    def _snapshot_key(self) -> tuple:
+        """
+        What a snapshot must have been made from to be valid: the same
+        version, pandas and numpy, and isd-history.csv. Pickled DataFrames
+        aren't guaranteed to load across pandas versions
+        """
+        st = self.isd_history_path.stat()
+        return (SNAPSHOT_VERSION, pd.__version__, np.__version__, st.st_mtime_ns, st.st_size)
 
-        self.df = self.df.set_index("StationID")
+    def _load_snapshot(self, snapshot_key: tuple) -> Optional[pd.DataFrame]:
+        """The cached table, None if there is no valid snapshot."""
+        # The key is pickled first, on its own, so that the table is only
+        # unpickled if it was written by the same versions
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                if pickle.load(f) != snapshot_key:
+                    return None
+                df = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as err:
+            print("Ignoring the unreadable snapshot '{}': {}".format(self.snapshot_path, err))
+            return None
+
+        if not isinstance(df, pd.DataFrame):
+            return None
+        return df
+
+    def _save_snapshot(self, snapshot_key: tuple, df: pd.DataFrame) -> None:
+        """Caches the parsed table, if the folder is writable."""
+        # Write to a temp file then move it, so that a concurrent reader never
+        # sees a partial snapshot
+        tmp_path = self.snapshot_path.with_name("{}.{}.tmp".format(self.snapshot_path.name, os.getpid()))
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(snapshot_key, f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as err:
+            print("Couldn't save the snapshot '{}': {}".format(self.snapshot_path, err))
+            if tmp_path.exists():
+                tmp_path.unlink()
 
     @staticmethod
     def distance(lat1, lon1, lat2, lon2):
@@ -165,20 +463,291 @@ class ISDHistory:
         a = 0.5 - cos((lat2 - lat1) * p) / 2 + cos(lat1 * p) * cos(lat2 * p) * (1 - cos((lon2 - lon1) * p)) / 2
         return 12742 * asin(sqrt(a))
 
+    def distances(self, lat: float, lon: float) -> np.ndarray:
+        """
+        Computes the Haversine distance, in km, from the point specified by
+        latitude and longitude to every station, in the order of `df`
+
+        Stations without coordinates are at NaN
+        """
+        lat_rad = np.radians(lat)
+        a = (
+            np.sin((self._lat_rad - lat_rad) / 2) ** 2
+            + self._cos_lat * np.cos(lat_rad) * np.sin((self._lon_rad - np.radians(lon)) / 2) ** 2
+        )
+        return 12742 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    def closest_weather_stations(self, lat: float, lon: float, k: int = 5, year: Optional[int] = None) -> pd.Series:
+        """
+        Returns the `k` closest weather stations to the point specified by
+        latitude and longitude
+
+        Args:
+        ------
+            lat, lon (float): the point, in degrees
+
+            k (int): how many stations to return
+
+            year (int, optional): only consider the stations which recorded
+                data up to that year at least
+
+        Returns:
+        --------
+            distances (pd.Series): distance in km, indexed by USAF-WBAN,
+                closest first
+
+        """
+        distances = self.distances(lat, lon)
+        distances[np.isnan(distances)] = np.inf
+        if year is not None:
+            distances[self._end_years < year] = np.inf
+
+        k = min(k, int(np.isfinite(distances).sum()))
+        closest = np.argpartition(distances, k - 1)[:k] if 0 < k < len(distances) else np.arange(k)
+        # Ties go to the first station in `df`
+        closest = np.sort(closest)
+        closest = closest[np.argsort(distances[closest], kind="stable")]
+        return pd.Series(distances[closest], index=self.df.index[closest], name="distance")
+
     def closest_weather_station(self, lat, lon, year=None):
         """
         Returns the USAF-WBAN of the closest weather station to the point
         specified by latitude and longitude as arguments
 
+        Raises:
+        -------
+            ValueError: if no station has data up to `year`, or coordinates
+
         """
-        self.df["distance"] = self.df.apply(
-            lambda x: ISDHistory.distance(lat1=x["LAT"], lon1=x["LON"], lat2=lat, lon2=lon),
-            axis=1,
+        closest = self.closest_weather_stations(lat, lon, k=1, year=year)
+        if closest.empty:
+            if year is None:
+                raise ValueError("No weather station with coordinates in isd-history.csv")
+            raise ValueError("No weather station has data up to {} in isd-history.csv".format(year))
+        return closest.index[0]
+
+    def rank_stations(
+        self,
+        lat: float,
+        lon: float,
+        elevation: Optional[float] = None,
+        start_year: Optional[int] = None,
+        end_year: Optional[int] = None,
+        n: int = 5,
+        weights: Optional[Dict[str, float]] = None,
+        max_distance: Optional[float] = None,
+    ) -> pd.DataFrame:
+        """
+        Ranks the weather stations for a site by several criteria at once,
+        rather than by distance alone
+
+        Each station gets a penalty per criterion, and the score is their
+        weighted sum, the lower the better:
+            * 'distance': the distance in km / `DISTANCE_SCALE`
+            * 'elevation': the elevation difference in m / `ELEVATION_SCALE`,
+              1 if the station's elevation is unknown, 0 if `elevation` is
+              None
+            * 'coverage': 1 - the fraction of `start_year` to `end_year`
+              within the station's BEGIN/END, 0 if no years are given
+
+        Args:
+        ------
+            lat, lon (float): the site, in degrees
+
+            elevation (float, optional): the site's elevation, in m
+
+            start_year, end_year (int, optional): the years of interest. Either
+                alone means that single year
+
+            n (int): how many stations to return
+
+            weights (dict, optional): weight of each criterion, missing ones
+                default to `RANKING_WEIGHTS`
+
+            max_distance (float, optional): ignore the stations further away,
+                in km
+
+        Returns:
+        --------
+            ranking (pd.DataFrame): the best `n` stations, indexed by
+                USAF-WBAN, with their 'STATION NAME', 'distance' (km),
+                'elevation_difference' (m), 'coverage' (fraction of the years),
+                and 'score', best first
+
+        """
+        weights = {**RANKING_WEIGHTS, **(weights or {})}
+        unknown_criteria = set(weights) - set(RANKING_WEIGHTS)
+        if unknown_criteria:
+            raise ValueError("Unknown ranking criteria: {}".format(", ".join(sorted(unknown_criteria))))
+
+        distances = self.distances(lat, lon)
+
+        if elevation is None:
+            elevation_differences = np.full(len(distances), np.nan)
+            elevation_penalties = np.zeros(len(distances))
+        else:
+            elevation_differences = np.abs(self._elevations - elevation)
+            elevation_penalties = np.nan_to_num(elevation_differences / ELEVATION_SCALE, nan=1.0)
+
+        if start_year is None and end_year is None:
+            coverage = np.ones(len(distances))
+        else:
+            start_year = end_year if start_year is None else start_year
+            end_year = start_year if end_year is None else end_year
+            overlap = np.minimum(self._end_years, end_year) - np.maximum(self._begin_years, start_year) + 1
+            coverage = np.clip(overlap, 0, None) / (end_year - start_year + 1)
+
+        scores = (
+            weights["distance"] * distances / DISTANCE_SCALE
+            + weights["elevation"] * elevation_penalties
+            + weights["coverage"] * (1 - coverage)
         )
-        # print(self.df.loc[self.df['distance'].argmin()])
+        scores[np.isnan(scores)] = np.inf
+        if max_distance is not None:
+            scores[~(distances <= max_distance)] = np.inf
+
+        n = min(n, int(np.isfinite(scores).sum()))
+        best = np.argpartition(scores, n - 1)[:n] if 0 < n < len(scores) else np.arange(n)
+        best = np.sort(best)
+        best = best[np.argsort(scores[best], kind="stable")]
+        return pd.DataFrame(
+            {
+                "STATION NAME": self.df["STATION NAME"].to_numpy()[best],
+                "distance": distances[best],
+                "elevation_difference": elevation_differences[best],
+                "coverage": coverage[best],
+                "score": scores[best],
+            },
+            index=self.df.index[best],
+        )
+
+    def closest_weather_station_batch(
+        self, lat, lon, year: Optional[int] = None, chunk_size: int = BATCH_CHUNK_SIZE
+    ) -> pd.DataFrame:
+        """
+        Finds the closest weather station to many points at once, eg: one per
+        building of a portfolio
+
+        The points are processed `chunk_size` at a time: for each chunk, the
+        distances to all the stations come from a single matrix product of
+        their unit vectors, so the memory used is bounded by `chunk_size`
+        whatever the number of points
+
+        Args:
+        ------
+            lat, lon (array-like of float): the points, in degrees
 
-        df = self.df.copy()
+            year (int, optional): only consider the stations which recorded
+                data up to that year at least, like `closest_weather_station`
+
+            chunk_size (int): how many points to process at once
+
+        Returns:
+        --------
+            closest (pd.DataFrame): one row per point, in the same order,
+                with its closest 'StationID' and the 'distance' to it in km.
+                Both are NaN for a point without coordinates
+
+        """
+        if np.size(lat) != np.size(lon):
+            raise ValueError("lat and lon must have the same length, not {} and {}".format(np.size(lat), np.size(lon)))
+        points = to_unit_vectors(np.ravel(lat), np.ravel(lon))
+
+        candidates = np.isfinite(self._unit_vectors).all(axis=1)
         if year is not None:
-            df = df[df["END"].dt.year >= year]
-        d = df["distance"].argmin()
-        return df.index[d]
+            candidates &= self._end_years >= year
+        candidates = np.flatnonzero(candidates)
+        station_vectors = self._unit_vectors[candidates]
+
+        closest = np.full(len(points), -1, dtype=np.int64)
+        chords = np.full(len(points), np.nan)
+        valid = np.flatnonzero(np.isfinite(points).all(axis=1))
+        if len(candidates):
+            for start in range(0, len(valid), chunk_size):
+                rows = valid[start : start + chunk_size]
+                # The closest station is the one with the largest dot product
+                nearest = candidates[np.argmax(points[rows] @ station_vectors.T, axis=1)]
+                closest[rows] = nearest
+                chords[rows] = np.linalg.norm(points[rows] - self._unit_vectors[nearest], axis=1)
+
+        station_ids = np.where(closest >= 0, self.df.index.to_numpy()[closest], np.nan)
+        return pd.DataFrame({"StationID": station_ids, "distance": chord_to_km(chords)})
+
+    @property
+    def search(self) -> StationSearch:
+        """The lookups by country, state and station name, built on first use, see `pygsod.search.StationSearch`."""
+        with self._indexes_lock:
+            if self._search is None:
+                self._search = StationSearch(self.df)
+            return self._search
+
+    @property
+    def spatial_index(self) -> StationIndex:
+        """The KD-tree over the stations, built on first use, see `pygsod.spatial.StationIndex`."""
+        with self._indexes_lock:
+            if self._spatial_index is None:
+                self._spatial_index = StationIndex(
+                    self.df["LAT"], self.df["LON"], begin_years=self._begin_years, end_years=self._end_years
+                )
+            return self._spatial_index
+
+    def nearest_stations(
+        self,
+        lat: float,
+        lon: float,
+        k: int = 5,
+        start_year: Optional[int] = None,
+        end_year: Optional[int] = None,
+    ) -> pd.Series:
+        """
+        Returns the `k` closest weather stations to the point specified by
+        latitude and longitude, using the `spatial_index`
+
+        Args:
+        ------
+            lat, lon (float): the point, in degrees
+
+            k (int): how many stations to return
+
+            start_year, end_year (int, optional): only consider the stations
+                whose BEGIN/END cover these years, eg: 2015 and 2024 for the
+                stations with data from 2015 to 2024
+
+        Returns:
+        --------
+            distances (pd.Series): distance in km, indexed by USAF-WBAN,
+                closest first
+
+        """
+        indices, distances = self.spatial_index.query(lat, lon, k=k, start_year=start_year, end_year=end_year)
+        return pd.Series(distances, index=self.df.index[indices], name="distance")
+
+    def stations_within(
+        self,
+        lat: float,
+        lon: float,
+        radius: float,
+        start_year: Optional[int] = None,
+        end_year: Optional[int] = None,
+    ) -> pd.Series:
+        """
+        Returns all the weather stations within `radius` km of the point
+        specified by latitude and longitude, using the `spatial_index`
+
+        Args:
+        ------
+            lat, lon (float): the point, in degrees
+
+            radius (float): in km
+
+            start_year, end_year (int, optional): only consider the stations
+                whose BEGIN/END cover these years
+
+        Returns:
+        --------
+            distances (pd.Series): distance in km, indexed by USAF-WBAN,
+                closest first
+
+        """
+        indices, distances = self.spatial_index.query_radius(lat, lon, radius, start_year=start_year, end_year=end_year)
+        return pd.Series(distances, index=self.df.index[indices], name="distance")
@@ -13,27 +13,192 @@ Parameters can be added but not currently used in EnergyPlus calculations:
 2. Visibility
 
 """
+
 import datetime
 import os
+from typing import List, NamedTuple, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 
 from pygsod.constants import WEATHER_DIR
+from pygsod.fixedwidth import parse_numbers
 from pygsod.noaadata import NOAAData
-from pygsod.utils import DataType, get_valid_year, is_list_like
+from pygsod.utils import DataType, get_valid_year, is_list_like, open_maybe_gzip, strip_gz_suffix
+
+
+class AdditionalDataField(NamedTuple):
+    """Where a value is in the additional data section, see '/pub/data/noaa/ish-format-document.pdf'."""
+
+    # The ISD groups that can have the value, the first one found wins
+    groups: Tuple[str, ...]
+    # Position of the value in the group, after its 3-character id
+    offset: int
+    width: int
+    missing: int
+    scale: float = 1.0
+    # (offset, character) the group must have, eg the code of RH1-RH3
+    code: Optional[Tuple[int, str]] = None
+
+
+# Length of each group of the additional data section, after its id
+ADDITIONAL_DATA_GROUPS = {
+    "AA1": 8,
+    "GF1": 23,
+    "GQ1": 14,
+    "MA1": 12,
+    "RH1": 9,
+    "RH2": 9,
+    "RH3": 9,
+}
+
+# Values of the additional data section, by column
+ADDITIONAL_DATA_FIELDS = {
+    # RH1 to RH3 are the mean, minimum and maximum of the day, in any order
+    "RELATIVE_HUMIDITY_PERCENTAGE": AdditionalDataField(("RH1", "RH2", "RH3"), 4, 3, 999, code=(3, "M")),
+    "TOTAL_SKY_COVER": AdditionalDataField(("GF1",), 0, 2, 99),
+    "OPAQUE_SKY_COVER": AdditionalDataField(("GF1",), 2, 2, 99),
+    "AZIMUTH_ANGLE": AdditionalDataField(("GQ1",), 9, 4, 9999, 10.0),
+    "ZENITH_ANGLE": AdditionalDataField(("GQ1",), 4, 4, 9999, 10.0),
+    "PRCP_PERIOD_hr": AdditionalDataField(("AA1",), 0, 2, 99),
+    "PRCP_mm": AdditionalDataField(("AA1",), 2, 4, 9999, 10.0),
+    "ALTIMETER_hPa": AdditionalDataField(("MA1",), 0, 5, 99999, 10.0),
+    "STP_hPa": AdditionalDataField(("MA1",), 6, 5, 99999, 10.0),
+}
+
+# The columns `parse_ish_file` extracts by default
+DEFAULT_ADDITIONAL_DATA = [
+    "RELATIVE_HUMIDITY_PERCENTAGE",
+    "TOTAL_SKY_COVER",
+    "OPAQUE_SKY_COVER",
+    "AZIMUTH_ANGLE",
+    "ZENITH_ANGLE",
+]
+
+# The columns of `parse_ish_file` besides the additional data, which come
+# before StationID
+ISH_COLUMNS = [
+    "USAF",
+    "WBAN",
+    "TEMP_C",
+    "TEMP_Count",
+    "DEWP_C",
+    "DEWP_Count",
+    "SLP_hPa",
+    "WIND_SPEED",
+    "WIND_DIRECTION",
+    "ADD_DATA",
+    "TEMP_F",
+    "SLP_Pa",
+]
+
+# Columns computed from others
+_ISH_DERIVED_FROM = {
+    "TEMP_F": ["TEMP_C"],
+    "SLP_Pa": ["SLP_hPa"],
+    "StationID": ["USAF", "WBAN"],
+    **{column: ["ADD_DATA"] for column in ADDITIONAL_DATA_FIELDS},
+}
+
+# Sections that end the additional data, their contents aren't searched
+_END_OF_ADDITIONAL_DATA = ["REM", "EQD", "QNN"]
+
+
+def _find_first(chars: np.ndarray, group: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Where `group` first appears in each row of `chars`
+
+    Returns:
+    --------
+        found (np.ndarray): bool, whether it appears in the row
+
+        starts (np.ndarray): its first position, 0 where not found
+
+    """
+    a, b, c = (np.uint8(ord(x)) for x in group)
+    is_group = (chars[:, :-2] == a) & (chars[:, 1:-1] == b) & (chars[:, 2:] == c)
+    found = is_group.any(axis=1)
+    return found, np.where(found, is_group.argmax(axis=1), 0)
+
+
+def extract_additional_data(add_data: pd.Series, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Extracts values of the additional data section, in one vectorized pass
+
+    The sections are turned into a matrix of bytes, where each group is
+    located in all the rows at once, and its window of bytes gathered. The
+    values are then decoded for all the rows at once, whatever the number
+    of values per group: adding a field to `ADDITIONAL_DATA_FIELDS` doesn't
+    add a pass
+
+    Args:
+    ------
+        add_data (pd.Series): the additional data sections, str, eg
+            'ADDAA101000595GF108031011...'
+
+        columns (list of str, optional): keys of `ADDITIONAL_DATA_FIELDS`,
+            defaults to `DEFAULT_ADDITIONAL_DATA`
+
+    Returns:
+    --------
+        values (pd.DataFrame): float64, indexed like `add_data`, NaN where
+            the group is absent or the value missing
+
+    """
+    if columns is None:
+        columns = DEFAULT_ADDITIONAL_DATA
+    unknown = [column for column in columns if column not in ADDITIONAL_DATA_FIELDS]
+    if unknown:
+        raise ValueError("Unknown additional data: {}".format(", ".join(unknown)))
+
+    strings = add_data.fillna("").to_numpy().astype(bytes)
+    # At least 3 characters, so that there is one id per row
+    strings = strings.astype("S{}".format(max(strings.dtype.itemsize, 3)))
+    chars = strings.view(np.uint8).reshape(len(strings), -1)
+
+    # Only search the additional data: blank out the remarks and such
+    for section in _END_OF_ADDITIONAL_DATA:
+        found, starts = _find_first(chars, section)
+        if found.any():
+            chars[found[:, None] & (np.arange(chars.shape[1]) >= starts[:, None])] = 0
+
+    # Each group needed, as a (n, length) window of bytes, NUL where absent
+    windows = {}
+    groups = sorted({group for column in columns for group in ADDITIONAL_DATA_FIELDS[column].groups})
+    padded = np.pad(chars, ((0, 0), (0, max(ADDITIONAL_DATA_GROUPS[group] for group in groups))))
+    for group in groups:
+        found, starts = _find_first(chars, group)
+        window = np.take_along_axis(padded, (starts + 3)[:, None] + np.arange(ADDITIONAL_DATA_GROUPS[group]), axis=1)
+        window[~found] = 0
+        windows[group] = window
+
+    values = {}
+    for column in columns:
+        field = ADDITIONAL_DATA_FIELDS[column]
+        value = np.full(len(chars), np.nan)
+        for group in field.groups:
+            window = windows[group]
+            candidate = parse_numbers(window, field.offset, field.offset + field.width)
+            if field.code is not None:
+                candidate[window[:, field.code[0]] != ord(field.code[1])] = np.nan
+            value = np.where(np.isnan(value), candidate, value)
+        value[value == field.missing] = np.nan
+        values[column] = value / field.scale
+    return pd.DataFrame(values, index=add_data.index)
 
 
 def parse_rh(data):
-    if "RH1" in data:
-        loc = data.find("RH3")
-        rh = int(data[(loc + 7) : (loc + 10)])
-        if rh == 999:
-            return np.nan  # if using 999 therew will be issue in interpolating
-        else:
-            return rh
-    else:
-        return np.nan
+    # The mean relative humidity: RH1 to RH3 are the mean, minimum and maximum
+    # of the day, in any order, told apart by their 'M', 'N' or 'X' code
+    for group in ["RH1", "RH2", "RH3"]:
+        loc = data.find(group)
+        if loc >= 0 and data[loc + 6 : loc + 7] == "M":
+            rh = int(data[(loc + 7) : (loc + 10)])
+            if rh == 999:
+                return np.nan  # if using 999 therew will be issue in interpolating
+            else:
+                return rh
+    return np.nan
 
 
 def parse_total_sky_cover(data):
@@ -90,17 +255,26 @@ def parse_azimuth(data):
         return np.nan
 
 
-def parse_ish_file(isd_full, create_excel_file=True):
+def parse_ish_file(isd_full, create_excel_file=True, additional_data_columns=None, columns=None):
     """
     Parses the Weather File downloaded from NOAA's Integrated Surface Data
     (ISD, formerly Integrated Surface Hourly (ISH))
     This file with no extension is a fixed-width file, which format
     is specified in '/pub/data/noaa/ish-format-document.pdf'
+    gzip-compressed files (`keep_compressed=True`) are read transparently
     Will also convert the IP units to SI units used by E+
     Args:
     ------
         isd_full object
         create_excel_file (bool): if True, it creates an excel file per year
+        additional_data_columns (list of str, optional): the values of the
+        additional data section to extract, keys of `ADDITIONAL_DATA_FIELDS`.
+        Defaults to `DEFAULT_ADDITIONAL_DATA`
+        columns (list of str, optional): only decode these columns, of
+        `ISH_COLUMNS`, `ADDITIONAL_DATA_FIELDS` or 'StationID', and the ones
+        they are computed from. Supersedes `additional_data_columns`.
+        Defaults to all of `ISH_COLUMNS`, the `additional_data_columns` and
+        'StationID'
     Returns:
     --------
         ish (pd.DataFrame): a DataFrame of the parsed results
@@ -214,49 +388,73 @@ def parse_ish_file(isd_full, create_excel_file=True):
         "WIND_DIRECTION": 999,
     }
 
+    if columns is None:
+        if additional_data_columns is None:
+            additional_data_columns = DEFAULT_ADDITIONAL_DATA
+        columns = ISH_COLUMNS + list(additional_data_columns) + ["StationID"]
+    all_columns = ISH_COLUMNS + list(ADDITIONAL_DATA_FIELDS) + ["StationID"]
+    unknown = [column for column in columns if column not in all_columns]
+    if unknown:
+        raise ValueError("Unknown columns: {}".format(", ".join(unknown)))
+    # In the usual order
+    columns = [column for column in all_columns if column in columns]
+    additional_data_columns = [column for column in columns if column in ADDITIONAL_DATA_FIELDS]
+
+    # Only read the fields needed, and the date
+    needed = {field for column in columns for field in _ISH_DERIVED_FROM.get(column, [column])}
+    used = [i for i, name in enumerate(names) if name in needed or name in ["YEAR", "MONTH", "DAY", "TIME"]]
+    colspecs = [colspecs[i] for i in used]
+    names = [names[i] for i in used]
+    na_values = {name: value for name, value in na_values.items() if name in names}
+
     for p, year in oppath_year:
-        i_op = pd.read_fwf(
-            p,
-            index_col="Date",
-            parse_dates={"Date": ["YEAR", "MONTH", "DAY", "TIME"]},
-            colspecs=colspecs,
-            header=None,
-            names=names,
-            skiprows=1,
-            na_values=na_values,
-            dtypes=dtypes,
-        )
-
-        i_op["TEMP_C"] = i_op["TEMP_C"] / 10  # scaling factor: 10
-        i_op["TEMP_F"] = i_op["TEMP_C"] * 1.8 + 32  # calculate C to F
-        i_op["DEWP_C"] = i_op["DEWP_C"] / 10  # scaling factor: 10
-        i_op["SLP_hPa"] = i_op["SLP_hPa"] / 10  # scaling factor: 10
-        i_op["WIND_SPEED"] = i_op["WIND_SPEED"] / 10  # scaling factor: 10
-
-        i_op["SLP_Pa"] = i_op["SLP_hPa"] * 100
+        with open_maybe_gzip(p) as f:
+            i_op = pd.read_fwf(
+                f,
+                index_col="Date",
+                parse_dates={"Date": ["YEAR", "MONTH", "DAY", "TIME"]},
+                colspecs=colspecs,
+                header=None,
+                names=names,
+                skiprows=1,
+                na_values=na_values,
+                dtypes=dtypes,
+            )
+
+        # scaling factor: 10
+        for name in ["TEMP_C", "DEWP_C", "SLP_hPa", "WIND_SPEED"]:
+            if name in i_op:
+                i_op[name] = i_op[name] / 10
+        if "TEMP_F" in columns:
+            i_op["TEMP_F"] = i_op["TEMP_C"] * 1.8 + 32  # calculate C to F
+        if "SLP_Pa" in columns:
+            i_op["SLP_Pa"] = i_op["SLP_hPa"] * 100
 
         # ADDITIONAL DATA SECTION
-        i_op["ADD_DATA"] = i_op["ADD_DATA"].fillna("")
-        i_op["RELATIVE_HUMIDITY_PERCENTAGE"] = i_op["ADD_DATA"].apply(parse_rh)
-        i_op["TOTAL_SKY_COVER"] = i_op["ADD_DATA"].apply(parse_total_sky_cover)
-        i_op["OPAQUE_SKY_COVER"] = i_op["ADD_DATA"].apply(parse_opaque_sky_cover)
-        i_op["AZIMUTH_ANGLE"] = i_op["ADD_DATA"].apply(parse_azimuth)
-        i_op["ZENITH_ANGLE"] = i_op["ADD_DATA"].apply(parse_zenith)
+        if "ADD_DATA" in i_op:
+            i_op["ADD_DATA"] = i_op["ADD_DATA"].fillna("")
+        if additional_data_columns:
+            additional_data = extract_additional_data(i_op["ADD_DATA"], columns=additional_data_columns)
+            i_op[additional_data.columns] = additional_data
 
         # filter the only data for the year we need
         i_op = i_op[i_op.index.year == year]
 
         if create_excel_file:
-            fname = p.with_suffix(".xlsx")
+            fname = strip_gz_suffix(p).with_suffix(".xlsx")
             i_op.to_excel(fname)
         all_ops.append(i_op)
 
     if len(all_ops) > 0:
         op = pd.concat(all_ops)
         # Format USAF and WBAN as fixed-length numbers (strings)
-        op.USAF = op.USAF.map(str).str.zfill(6)
-        op.WBAN = op.WBAN.map(str).str.zfill(5)
-        op["StationID"] = op.USAF + "-" + op.WBAN
+        if "USAF" in op:
+            op.USAF = op.USAF.map(str).str.zfill(6)
+        if "WBAN" in op:
+            op.WBAN = op.WBAN.map(str).str.zfill(5)
+        if "StationID" in columns:
+            op["StationID"] = op.USAF + "-" + op.WBAN
+        op = op[columns]
     else:
         op = pd.DataFrame()
 
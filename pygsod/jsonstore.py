@@ -0,0 +1,55 @@
+"""Base class for the small JSON files keeping track of the downloads."""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from pygsod.utils import as_path
+
+
+class JSONStore:
+    """
+    A dict of entries, keyed by the remote path, stored as a JSON file
+
+    The file is loaded lazily, on first access to `entries`, and only
+    written when `save` is called, if anything changed. Subclasses modify
+    `entries` while holding `_lock`, and set `_dirty`.
+    """
+
+    def __init__(self, path: Path):
+        """
+        Args:
+        ------
+            path (Path): path to the JSON file, doesn't need to exist yet
+        """
+        self.path = as_path(path)
+        self._entries: Optional[Dict[str, dict]] = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    @property
+    def entries(self) -> Dict[str, dict]:
+        """The entries, loading them from disk on first access."""
+        with self._lock:
+            if self._entries is None:
+                self._entries = {}
+                if self.path.is_file():
+                    with open(self.path, "r") as f:
+                        self._entries = json.load(f)
+            return self._entries
+
+    def save(self) -> None:
+        """Writes the entries to disk if anything changed since the last save."""
+        with self._lock:
+            if not self._dirty or self._entries is None:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Write to a temp file then move it, so an interrupted run never
+            # leaves a corrupt file behind
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(self._entries, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
@@ -0,0 +1,96 @@
+"""Local ledger of the files that failed to download, to not request them again."""
+
+import time
+from pathlib import Path
+from typing import Optional
+
+from pygsod.jsonstore import JSONStore
+
+# How long a failure is remembered for by default: 30 days
+DEFAULT_TTL = 30 * 24 * 60 * 60
+
+# For the current year, files may just not be published yet: 1 day
+RECENT_TTL = 24 * 60 * 60
+
+# For the files given up on after the connection kept dropping, which says
+# nothing about the file: 1 hour
+CONNECTION_TTL = 60 * 60
+
+
+class FailureLedger(JSONStore):
+    """
+    Keeps track of the remote files that couldn't be downloaded, why, and
+    for how long that should be trusted, so that known-missing station-years
+    aren't requested again on every run.
+
+    It is stored as a JSON file, keyed by the remote path, eg:
+        {
+            "/pub/data/gsod/2017/744860-94789-2017.op.gz": {
+                "reason": "550 No such file or directory",
+                "timestamp": 1514862245.0,
+                "ttl": 2592000
+            }
+        }
+
+    Entries older than their `ttl` (in seconds) are ignored, and retried.
+
+    The file is loaded lazily, and only written when `save` is called.
+    """
+
+    def __init__(self, ledger_path: Path, ttl: float = DEFAULT_TTL):
+        """
+        Args:
+        ------
+            ledger_path (Path): path to the JSON ledger, doesn't need to
+                exist yet
+
+            ttl (float): default time to live of the failures, in seconds
+        """
+        super().__init__(ledger_path)
+        self.ttl = ttl
+
+    @property
+    def ledger_path(self) -> Path:
+        """The path to the JSON ledger, same as `path`."""
+        return self.path
+
+    def known_failure(self, remote_path: str) -> Optional[dict]:
+        """
+        Checks whether `remote_path` failed before, and that's recent enough
+        to still be trusted
+
+        Returns:
+        --------
+            entry (dict or None): the {"reason", "timestamp", "ttl"} of the
+                failure, None if it should be (re)tried
+        """
+        entry = self.entries.get(remote_path)
+        if entry is None or time.time() - entry["timestamp"] > entry["ttl"]:
+            return None
+        return entry
+
+    def record(self, remote_path: str, reason: str, ttl: Optional[float] = None) -> None:
+        """Records that `remote_path` failed because of `reason`, for `ttl` seconds (defaults to `self.ttl`)."""
+        entries = self.entries
+        with self._lock:
+            entries[remote_path] = {
+                "reason": reason,
+                "timestamp": time.time(),
+                "ttl": self.ttl if ttl is None else ttl,
+            }
+            self._dirty = True
+
+    def forget(self, remote_path: str) -> None:
+        """Removes `remote_path` from the ledger, eg: once it was downloaded."""
+        entries = self.entries
+        with self._lock:
+            if entries.pop(remote_path, None) is not None:
+                self._dirty = True
+
+    def clear(self) -> None:
+        """Forgets all failures, so that everything is retried."""
+        entries = self.entries
+        with self._lock:
+            if entries:
+                entries.clear()
+                self._dirty = True
@@ -0,0 +1,73 @@
+"""Local manifest of the files downloaded from NOAA, to only fetch what changed."""
+
+from pathlib import Path
+from typing import Optional
+
+from pygsod.jsonstore import JSONStore
+
+
+class DownloadManifest(JSONStore):
+    """
+    Keeps track of the remote size and modification time of every file that
+    was downloaded, along with where its extracted copy was stored.
+
+    It is stored as a JSON file, keyed by the remote path, eg:
+        {
+            "/pub/data/gsod/2017/744860-94789-2017.op.gz": {
+                "size": 12345,
+                "mtime": "20180102030405",
+                "local_path": "/path/to/weather_files/gsod/2017/JOHN F KENNEDY INTERNATIONAL AIRPORT-2017.op"
+            }
+        }
+
+    The file is loaded lazily, and only written when `save` is called.
+    """
+
+    def __init__(self, manifest_path: Path):
+        """
+        Args:
+        ------
+            manifest_path (Path): path to the JSON manifest, doesn't need
+                to exist yet
+        """
+        super().__init__(manifest_path)
+
+    @property
+    def manifest_path(self) -> Path:
+        """The path to the JSON manifest, same as `path`."""
+        return self.path
+
+    def up_to_date_path(self, remote_path: str, size: Optional[int], mtime: Optional[str]) -> Optional[Path]:
+        """
+        Checks whether `remote_path` was already downloaded with the same size
+        and modification time, and its extracted copy is still on disk.
+        Never, if the server doesn't tell either of them
+
+        Returns:
+        --------
+            local_path (Path or None): the path to the local copy if it is
+                up to date, None if it needs (re)downloading
+        """
+        if size is None or mtime is None:
+            return None
+        entry = self.entries.get(remote_path)
+        if entry is None or entry["size"] != size or entry["mtime"] != mtime:
+            return None
+
+        local_path = Path(entry["local_path"])
+        if not local_path.is_file():
+            return None
+
+        return local_path
+
+    def record(self, remote_path: str, size: Optional[int], mtime: Optional[str], local_path: Path) -> None:
+        """
+        Records that `remote_path`, as of (`size`, `mtime`), is stored at
+        `local_path`. Not if either is unknown, as it couldn't be compared
+        """
+        if size is None or mtime is None:
+            return
+        entries = self.entries
+        with self._lock:
+            entries[remote_path] = {"size": size, "mtime": mtime, "local_path": str(local_path)}
+            self._dirty = True
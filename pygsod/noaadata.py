@@ -3,40 +3,116 @@
 # Make it backwards compatible with python 2
 from __future__ import division, print_function
 
+import asyncio
 import datetime
+import glob
 import gzip
 import os  # TODO: remove ASAP
 import re
+import shutil
+import tarfile
+import threading
+import time
 import warnings
-from ftplib import FTP
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import AsyncIterator, BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
 
 from tqdm import tqdm
 
-from pygsod.constants import SUPPORT_DIR, WEATHER_DIR
+from pygsod.constants import WEATHER_DIR
+from pygsod.inventory import ISDInventory
 from pygsod.isdhistory import ISDHistory
+from pygsod.ledger import CONNECTION_TTL, RECENT_TTL, FailureLedger
+from pygsod.manifest import DownloadManifest
+from pygsod.plan import DownloadPlan, PlannedFile
+from pygsod.streaming import CHUNK_SIZE, CopyWriter, GunzipWriter, PipeReader
+from pygsod.transport import (
+    MAX_RETRIES,
+    TRANSPORT_ERRORS,
+    FTPTransport,
+    Listing,
+    RemoteFileNotFoundError,
+    Transport,
+    TransportPool,
+)
 from pygsod.utils import DataType, ReturnCode, as_path, sanitize_usaf_wban
 
+# Above this many stations, GSOD is fetched as one `gsod_<year>.tar` per year
+# rather than one file per station
+GSOD_BULK_THRESHOLD = 100
+
+# How long the listing of a remote year folder is trusted for, in seconds
+LISTING_TTL = 60 * 60
 
-class NOAAData:
-    """Main class for downloading data from NOAA FTP."""
 
-    def __init__(self, data_type, isd_path: Optional[Path] = None, weather_dir: Optional[Path] = None):
+class NOAAData:
+    """Main class for downloading data from NOAA (FTP, HTTPS or a local mirror)."""
+
+    def __init__(
+        self,
+        data_type,
+        isd_path: Optional[Path] = None,
+        weather_dir: Optional[Path] = None,
+        sync: bool = False,
+        keep_compressed: bool = False,
+        transport: Optional[Transport] = None,
+        bulk_threshold: Optional[int] = GSOD_BULK_THRESHOLD,
+        inventory: Optional[ISDInventory] = None,
+        resumable: bool = False,
+    ):
         """Init the NOAAData main object, and attaches an `isd` (class ISD) to it.
 
         Args:
         ------
         - data_type (DataType): the type of data to fetch
         - isd_path (Path): path to `isd-history.csv`, optional, will default
-          to ../support/isd-history.csv
+          to ../support/isd-history.csv. It is loaded lazily, and shared with
+          the other instances using the same path, see `ISDHistory.shared`
 
         - weather_dir (Path): path to folder to download weather files,
             will default to ../weather_files/
 
+        - sync (bool): incremental sync mode. If True, files whose remote
+            size and modification time match the ones recorded in
+            `{weather_dir}/manifest.json` during a previous download are
+            not transferred again
+
+        - keep_compressed (bool): compressed-at-rest storage mode. If True,
+            the downloaded *(.op).gz files are stored as is rather than
+            extracted, and `ops_files` point to them. The parsers read them
+            transparently
+
+        - transport (Transport): how to reach NOAA's data, see
+            `pygsod.transport`: `FTPTransport` (the default), `HTTPSTransport`
+            or `LocalTransport` for a local mirror. It is also used to
+            download `isd-history.csv` if needed
+
+        - bulk_threshold (int): GSOD only, when more than this many stations
+            are requested, `get_all_data` downloads the yearly archive
+            `gsod_<year>.tar` once instead of one file per station, and only
+            extracts the requested stations from it. None disables it
+
+        - inventory (ISDInventory): optional, the observations per station and
+            month from `isd-inventory.csv`. If given, the station-years
+            without any observation are not requested, see `plan`
+
+        - resumable (bool): keep the compressed data of the downloads in
+            progress in a '*.part' file, so that an interrupted transfer
+            resumes where it stopped, even in a later run, rather than
+            starting over. Only matters when extracting the files: with
+            `keep_compressed`, the downloads are always resumable
+
         """
-        # Initiates an instance of ISD
-        self.isd = ISDHistory(isd_path)
+        if transport is None:
+            transport = FTPTransport()
+        self.transport = transport
+
+        # The ISDHistory is only loaded when first needed, see `isd`
+        self.isd_path = isd_path
+        self._isd: Optional[ISDHistory] = None
 
         if not (isinstance(data_type, DataType)):
             raise ValueError("Wrong data_type passed, expected DataType")
@@ -69,7 +145,31 @@ class NOAAData:
         self.years = [datetime.date.today().year]
 
         self.ops_files: List[Path] = []
-        self.ftp: Optional[FTP] = None
+
+        self.sync = sync
+        self.keep_compressed = keep_compressed
+        self.resumable = resumable
+        self.bulk_threshold = bulk_threshold
+        self.inventory = inventory
+        self.manifest = DownloadManifest(self.weather_dir / "manifest.json")
+        # Station-years known to be missing, not requested again until their
+        # entry expires. Use `failures.clear()` to retry them all
+        self.failures = FailureLedger(self.weather_dir / "failures.json")
+
+        # Listings of the remote year folders: year => (time listed, listing)
+        self._listings: Dict[int, Tuple[float, Listing]] = {}
+        self._listings_lock = threading.Lock()
+
+    @property
+    def isd(self) -> ISDHistory:
+        """The ISDHistory, loaded on first access and shared within the process, see `ISDHistory.shared`."""
+        if self._isd is None:
+            self._isd = ISDHistory.shared(self.isd_path, transport=self.transport)
+        return self._isd
+
+    @isd.setter
+    def isd(self, isd: ISDHistory) -> None:
+        self._isd = isd
 
     def set_years(self, years: List[int]) -> None:
         """
@@ -171,16 +271,17 @@ class NOAAData:
 
         """
         if (country is not None) and (station_name is not None):
-            df = self.isd.df
-
-            if state is None:
-                df_sub = df[(df["CTRY"] == country) & (df["STATION NAME"] == station_name)]
+            usaf_wbans = self.isd.search.find(country, station_name, state=state)
+            if len(usaf_wbans) == 0:
+                msg = "The input country, state and station name is not " "found in isd-history."
+                suggestions = self.isd.search.match(station_name)
+                if len(suggestions):
+                    msg += " Did you mean: {}?".format(
+                        ", ".join(dict.fromkeys(self.isd.df.loc[suggestions.index, "STATION NAME"].astype(str)))
+                    )
+                raise ValueError(msg)
             else:
-                df_sub = df[(df["CTRY"] == country) & (df["STATE"] == state) & (df["STATION NAME"] == station_name)]
-            if len(df_sub) == 0:
-                raise ValueError("The input country, state and station name is not " "found in isd-history.")
-            else:
-                self.stations = [str(df_sub["USAF"].values[0]) + "-" + str(df_sub["WBAN"].values[0])]
+                self.stations = [usaf_wbans[0]]
                 print(self.stations)
                 return self.stations
 
@@ -213,7 +314,145 @@ class NOAAData:
 
         return self.stations
 
-    def get_all_data(self):
+    def plan(self, list_folders: bool = True, strict: bool = True) -> DownloadPlan:
+        """
+        Works out what `get_all_data` will download for all `years` x
+        `stations`, without downloading anything
+
+        All stations are checked against isd-history.csv at once, and the
+        station-years outside of their BEGIN/END are marked as such, so they
+        aren't requested. So are the ones without any observation according
+        to the `inventory` if any, the ones known to be missing from the
+        `failures` ledger, and, if `list_folders`, the ones that aren't in the
+        listing of their remote year folder (see `list_year`), which also
+        gives the size of each file. Nothing is written: the latter are only
+        recorded in the `failures` ledger when the plan is run
+
+        Args:
+        ------
+            list_folders (bool): whether to list the remote year folders, one
+                request per year, over `self.transport`
+
+            strict (bool): if True, raises if any station isn't in
+                isd-history.csv. Otherwise they are planned as missing
+
+        Returns:
+        --------
+            plan (DownloadPlan): to pass to `get_all_data`, see
+                `DownloadPlan.estimated_bytes` for the size of the transfer
+
+        Raises:
+        -------
+            ValueError: if there is nothing to download, or with `strict`,
+                listing all the stations that aren't in isd-history.csv
+
+        """
+        if len(self.years) * len(self.stations) == 0:
+            msg = "Make sure you use `set_years` or `set_years_range` " "AND `set_stations` or `get_stations_from_file`"
+            raise ValueError(msg)
+
+        if list_folders:
+            to_close = not self.transport.connected
+            if to_close:
+                self.transport.connect()
+            try:
+                for year in self.years:
+                    self._list_year(self.transport, year)
+            finally:
+                if to_close:
+                    self.transport.close()
+
+        return self._plan_files(self.years, self.stations, strict=strict)
+
+    def _plan_files(self, years: List[int], stations: List[str], strict: bool = True) -> DownloadPlan:
+        """
+        Same as `plan` for `years` x `stations`, using the listings of the
+        year folders only if they are already cached
+        """
+        stations = [sanitize_usaf_wban(x) for x in stations]
+
+        df_isd = self.isd.df
+        # A station may appear several times in isd-history.csv: keep its last entry
+        df_isd = df_isd[~df_isd.index.duplicated(keep="last")]
+
+        is_known = df_isd.index.isin(stations)
+        known = set(df_isd.index[is_known])
+        unknown = [x for x in dict.fromkeys(stations) if x not in known]
+        if unknown and strict:
+            raise ValueError("{} station(s) not found in isd-history.csv: {}".format(len(unknown), ", ".join(unknown)))
+
+        # Station => (name, BEGIN, END)
+        df_known = df_isd.loc[is_known, ["STATION NAME", "BEGIN", "END"]]
+        begin_years = ISDHistory.years(df_known["BEGIN"], missing=0)
+        end_years = ISDHistory.years(df_known["END"], missing=9999)
+        stations_info = {
+            usaf_wban: (name, begin, end, begin_year, end_year)
+            for usaf_wban, name, begin, end, begin_year, end_year in zip(
+                df_known.index, df_known["STATION NAME"], df_known["BEGIN"], df_known["END"], begin_years, end_years
+            )
+        }
+
+        files = []
+        for year in years:
+            listing = self._cached_listing(year)
+            remote_folder = self.ftp_folder / str(year)
+            local_folder = (self.weather_dir / str(year)).resolve()
+            for usaf_wban in stations:
+                remote_op_name = "{id}-{y}.{e}".format(id=usaf_wban, y=year, e=self.gz_ext)
+                remote_path = (remote_folder / remote_op_name).as_posix()
+
+                info = stations_info.get(usaf_wban)
+                if info is None:
+                    files.append(
+                        PlannedFile(
+                            year,
+                            usaf_wban,
+                            station_name="",
+                            remote_path=remote_path,
+                            out_path=local_folder / remote_op_name,
+                            status=ReturnCode.missing,
+                            reason="{} isn't in isd-history.csv".format(usaf_wban),
+                        )
+                    )
+                    continue
+
+                name, begin, end, begin_year, end_year = info
+                # replace slash in the station name to not infer on the Path
+                out_path = local_folder / "{s}-{y}.{e}".format(s=name.replace("/", " "), y=year, e=self.gz_ext)
+                if not self.keep_compressed:
+                    out_path = out_path.with_suffix("")
+
+                item = PlannedFile(year, usaf_wban, name, remote_path, out_path)
+                if year > end_year:
+                    item.status = ReturnCode.outdated
+                    item.reason = "{} doesn't have data up to this year. It stopped on:" "{}".format(
+                        name, ISDHistory.date(end)
+                    )
+                elif year < begin_year:
+                    item.status = ReturnCode.missing
+                    item.reason = "{} didn't start recording data until {}".format(name, ISDHistory.date(begin))
+                elif self.inventory is not None and self.inventory.has_data(usaf_wban, year) is False:
+                    item.status = ReturnCode.missing
+                    item.reason = "{} has no observations in {} according to isd-inventory.csv".format(name, year)
+                else:
+                    # Failed requests are the slowest ones: don't repeat them
+                    failure = self.failures.known_failure(remote_path)
+                    if failure is not None:
+                        item.status = ReturnCode.missing
+                        item.reason = "Known to be missing: {} ({})".format(remote_op_name, failure["reason"])
+                    elif listing is not None:
+                        # If the year folder was listed, it is authoritative
+                        if remote_op_name in listing:
+                            item.remote_stat = listing[remote_op_name]
+                        else:
+                            item.status = ReturnCode.missing
+                            item.reason = "{} doesn't exist: not in the listing of its folder".format(remote_op_name)
+                            item.unlisted = True
+                files.append(item)
+
+        return DownloadPlan(self.data_type, years=list(years), stations=stations, files=files)
+
+    def get_all_data(self, n_connections: int = 1, plan: Optional[DownloadPlan] = None):
         """
         Downloads data from the appropriate source (GSOD, ISD, ISD_LITE)
         for all `years` and `stations`
@@ -221,8 +460,23 @@ class NOAAData:
 
         Args:
         ------
-            None, `years`, `stations`, and `weather_dir`
-                are stored as a GSOD attribute
+            n_connections (int, optional): number of concurrent sessions
+                to download with. Defaults to 1, which downloads one file at a
+                time over `self.transport`. Above 1, files are fetched by a
+                pool of worker sessions (see `pygsod.transport.TransportPool`),
+                each with its own connection.
+
+            plan (DownloadPlan, optional): what to download, as returned by
+                `plan`. If None, it is made first: the stations are all
+                checked against isd-history.csv before anything is downloaded
+
+            `years`, `stations`, and `weather_dir` are stored as a GSOD attribute
+
+            Above `bulk_threshold` stations, GSOD is fetched from the yearly
+            archives instead, see `_get_year_archive`. Otherwise the remote
+            folder of each year is listed first (see `list_year`), so the
+            station-years that don't exist aren't requested at all, and the
+            progress is reported in bytes
 
         Returns:
         --------
@@ -235,36 +489,402 @@ class NOAAData:
         r = 0
         o = 0
 
-        max_value = len(self.years) * len(self.stations)
+        if n_connections < 1:
+            raise ValueError("n_connections must be at least 1, not {}".format(n_connections))
 
-        if max_value == 0:
-            msg = "Make sure you use `set_years` or `set_years_range` " "AND `set_stations` or `get_stations_from_file`"
+        if plan is None:
+            plan = self._default_plan()
 
-            raise ValueError(msg)
+        final_close = not self.transport.connected
 
-        final_close = self.ftp is None
-        i = 0
-        for year in tqdm(self.years):
-            for usaf_wban in self.stations:
-                i += 1
+        if self._use_archives(len(plan.stations)):
+            results = self._get_all_data_archives(plan, n_connections=n_connections)
+        else:
+            if n_connections == 1:
+                results = (
+                    # Try downloading, force not closing the connection yet
+                    self._get_file(item, to_close=False)
+                    for item in plan
+                )
+            else:
+                results = self._get_all_data_pooled(plan, n_connections=n_connections)
+            results = self._with_progress(plan, results)
 
-                # Try downloading, force not closing the connection yet
-                (return_code, op_path) = self.get_year_file(year=year, usaf_wban=usaf_wban, to_close=False)
+        for return_code, op_path in results:
+            print(op_path)
+            if return_code == ReturnCode.success:
+                c += 1
+                self.ops_files.append(op_path)
+            elif return_code == ReturnCode.missing:
+                r += 1
+            elif return_code == ReturnCode.outdated:
+                o += 1
 
-                print(op_path)
-                if return_code == ReturnCode.success:
-                    c += 1
-                    self.ops_files.append(op_path)
-                elif return_code == ReturnCode.missing:
-                    r += 1
-                elif return_code == ReturnCode.outdated:
-                    o += 1
+        if final_close:
+            self.transport.close()
 
-                # bar.update(i)
+        self._save_state()
 
-        if self.ftp is not None and final_close:
-            self.ftp.close()
-            self.ftp = None
+        print("Success: {} files have been stored. ".format(c))
+        print("{} station IDs didn't exist. ".format(r))
+        print("{} stations stopped recording data before a year " "that was requested".format(o))
+
+        return (c, r, o)
+
+    def _get_all_data_pooled(
+        self, plan: DownloadPlan, n_connections: int
+    ) -> Iterator[Tuple[ReturnCode, Union[Path, bool]]]:
+        """
+        Downloads all files of `plan` with a pool of `n_connections`
+        sessions, one worker thread per session.
+
+        Yields the (return_code, op_path) of each file in the same (year,
+        station) order as the sequential download, so the resulting
+        `ops_files` are identical.
+        """
+        with TransportPool(self.transport, size=n_connections) as pool:
+            with ThreadPoolExecutor(max_workers=n_connections) as executor:
+                yield from executor.map(lambda item: self._get_file_pooled(pool, item), plan.files)
+
+    def _with_progress(
+        self, plan: DownloadPlan, results: Iterator[Tuple[ReturnCode, Union[Path, bool]]]
+    ) -> Iterator[Tuple[ReturnCode, Union[Path, bool]]]:
+        """
+        Passes through the `results` of all files of `plan`, in that order,
+        showing a progress bar: in bytes if the size of every file to download
+        is known, in number of files otherwise
+        """
+        if plan.total_bytes is None:
+            progress = tqdm(total=len(plan))
+            sizes = [1] * len(plan)
+        else:
+            print("{} files to download, {:.1f} MB".format(len(plan.to_download), plan.total_bytes / 1e6))
+            progress = tqdm(total=plan.total_bytes, unit="B", unit_scale=True)
+            sizes = [0 if item.status is not None else item.size for item in plan]
+
+        with progress:
+            for size, result in zip(sizes, results):
+                progress.update(size)
+                yield result
+
+    def _get_file_pooled(self, pool: TransportPool, item: PlannedFile) -> Tuple[ReturnCode, Union[Path, bool]]:
+        """
+        Same as `get_year_file`, but borrows a session from `pool`.
+
+        If the session drops mid-way, it is discarded and the transfer is
+        retried on a fresh one, up to `pool.max_retries` times, after which the
+        file is reported as missing.
+        """
+        if item.status is not None:
+            return self._fetch_file(None, item)
+
+        last_err: Optional[BaseException] = None
+        for _ in range(pool.max_retries + 1):
+            try:
+                with pool.session() as transport:
+                    return_code, op_path = self._fetch_file(transport=transport, item=item)
+                break
+            except TRANSPORT_ERRORS as err:
+                last_err = err
+        else:
+            return self._give_up(item, pool.max_retries + 1, last_err)
+
+        return return_code, op_path
+
+    def _give_up(
+        self, item: PlannedFile, attempts: int, err: Optional[BaseException]
+    ) -> Tuple[ReturnCode, Union[Path, bool]]:
+        """
+        Reports a file whose session kept dropping as missing, with a warning,
+        and records it in the `failures` ledger for `CONNECTION_TTL` only,
+        as it may well be there
+        """
+        msg = "Giving up on {} for {} after {} attempts: {}".format(item.usaf_wban, item.year, attempts, err)
+        warnings.warn(msg, UserWarning)
+        self.failures.record(item.remote_path, reason="Connection lost: {}".format(err), ttl=CONNECTION_TTL)
+        return ReturnCode.missing, False
+
+    def list_year(self, year: int) -> Optional[Listing]:
+        """
+        Lists the remote folder of `year`, in a single request, over
+        `self.transport`
+
+        The listing is cached for `LISTING_TTL` seconds, during which the
+        downloads use it to skip the files that don't exist without
+        requesting them, and instead of querying the size and modification
+        time of each file
+
+        Args:
+        ------
+            year (int): the year folder to list
+
+        Returns:
+        --------
+            listing (dict or None): file name => (size, mtime), each None if
+                the server doesn't tell. Empty if the folder doesn't exist,
+                None if it couldn't be listed
+        """
+        to_close = not self.transport.connected
+        if to_close:
+            self.transport.connect()
+        try:
+            return self._list_year(self.transport, year)
+        finally:
+            if to_close:
+                self.transport.close()
+
+    def _list_year(self, transport: Transport, year: int) -> Optional[Listing]:
+        """Same as `list_year`, over `transport`."""
+        listing = self._cached_listing(year)
+        if listing is not None:
+            return listing
+
+        remote_dir = (self.ftp_folder / str(year)).as_posix()
+        try:
+            listing = transport.listdir(remote_dir)
+        except RemoteFileNotFoundError:
+            listing = {}
+        except TRANSPORT_ERRORS as err:
+            print("Couldn't list {}, will request each file: {}".format(remote_dir, err))
+            return None
+
+        with self._listings_lock:
+            self._listings[year] = (time.time(), listing)
+        return listing
+
+    def _cached_listing(self, year: int) -> Optional[Listing]:
+        """The listing of the remote folder of `year`, if it was listed less than `LISTING_TTL` ago."""
+        with self._listings_lock:
+            listed_at, listing = self._listings.get(year, (0.0, None))
+        if listing is None or time.time() - listed_at > LISTING_TTL:
+            return None
+        return listing
+
+    def _use_archives(self, n_stations: int) -> bool:
+        """Whether to download the yearly archives rather than one file per station, for `n_stations`."""
+        return self.data_type == DataType.gsod and self.bulk_threshold is not None and n_stations > self.bulk_threshold
+
+    def _get_all_data_archives(
+        self, plan: DownloadPlan, n_connections: int
+    ) -> Iterator[Tuple[ReturnCode, Union[Path, bool]]]:
+        """
+        Downloads all files of `plan` from the yearly archives, up to
+        `n_connections` years at a time.
+
+        Yields the (return_code, op_path) of each file in the same (year,
+        station) order as the sequential download.
+        """
+        with TransportPool(self.transport, size=n_connections) as pool:
+            with ThreadPoolExecutor(max_workers=n_connections) as executor:
+                results = executor.map(lambda year: self._get_year_archive(pool, year, plan), plan.years)
+                for year, year_results in tqdm(zip(plan.years, results), total=len(plan.years)):
+                    yield from (year_results[item.usaf_wban] for item in plan if item.year == year)
+
+    def _get_year_archive(
+        self, pool: TransportPool, year: int, plan: DownloadPlan
+    ) -> Dict[str, Tuple[ReturnCode, Union[Path, bool]]]:
+        """
+        Downloads all files of `plan` for `year` from the yearly GSOD archive
+        '/pub/data/gsod/<year>/gsod_<year>.tar'
+
+        The archive is streamed: its members are read as they arrive, the ones
+        of the requested stations are extracted the same way `get_year_file`
+        does it and all the others are skipped, so the tar itself is never
+        written to disk.
+
+        In `sync` mode, stations are recorded in the `manifest` against the
+        size and modification time of the archive, and the archive is not
+        transferred at all if they are all up to date.
+
+        If the archive can't be downloaded, the stations that weren't
+        extracted yet are downloaded one file at a time instead.
+
+        Args:
+        ------
+            pool (TransportPool): the pool to borrow a session from
+
+            year (int): Year to download data for (format YYYY)
+
+            plan (DownloadPlan): the files to download
+
+        Returns:
+        --------
+            results (dict): the (return_code, op_path) of each USAF-WBAN of
+                `plan` for `year`, same as `get_year_file`
+        """
+        results: Dict[str, Tuple[ReturnCode, Union[Path, bool]]] = {}
+
+        # Archive member name => (USAF-WBAN, local path)
+        wanted: Dict[str, Tuple[str, Path]] = {}
+        items = {}
+        for item in plan:
+            if item.year != year:
+                continue
+            if item.status is not None:
+                results[item.usaf_wban] = self._fetch_file(None, item)
+            else:
+                item.out_path.parent.mkdir(parents=True, exist_ok=True)
+                wanted[os.path.basename(item.remote_path)] = (item.usaf_wban, item.out_path)
+                items[item.usaf_wban] = item
+
+        archive_path = (self.ftp_folder / str(year) / "gsod_{}.tar".format(year)).as_posix()
+
+        try:
+            if wanted:
+                with pool.session() as session:
+                    archive_stat = None
+                    if self.sync:
+                        archive_stat = session.stat(archive_path)
+                        for name, (usaf_wban, _) in list(wanted.items()):
+                            up_to_date_path = self.manifest.up_to_date_path(
+                                "{}/{}".format(archive_path, name), *archive_stat
+                            )
+                            if up_to_date_path is not None:
+                                results[usaf_wban] = (ReturnCode.success, up_to_date_path)
+                                del wanted[name]
+
+                    if wanted:
+                        self._extract_archive(session, archive_path, archive_stat, wanted, results)
+        except (RemoteFileNotFoundError,) + TRANSPORT_ERRORS as err:
+            msg = "Couldn't download {}, downloading the stations one by one instead: {}".format(archive_path, err)
+            warnings.warn(msg, UserWarning)
+            for usaf_wban, _ in wanted.values():
+                if usaf_wban not in results:
+                    results[usaf_wban] = self._get_file_pooled(pool, items[usaf_wban])
+
+        # Whatever is left wasn't in the archive
+        for name, (usaf_wban, _) in wanted.items():
+            if usaf_wban not in results:
+                results[usaf_wban] = (ReturnCode.missing, False)
+                self.failures.record(
+                    (self.ftp_folder / str(year) / name).as_posix(),
+                    reason="Not in {}".format(archive_path),
+                    ttl=self._failure_ttl(year),
+                )
+
+        return results
+
+    def _extract_archive(
+        self,
+        transport: Transport,
+        archive_path: str,
+        archive_stat: Optional[Tuple[int, str]],
+        wanted: Dict[str, Tuple[str, Path]],
+        results: Dict[str, Tuple[ReturnCode, Union[Path, bool]]],
+    ) -> None:
+        """
+        Streams the tar at `archive_path` over `transport`, and extracts the
+        `wanted` members, storing their (return_code, op_path) into `results`
+        as they come.
+
+        The transfer runs in a separate thread, feeding a `PipeReader` that
+        `tarfile` reads from in stream mode.
+
+        Raises:
+        -------
+            RemoteFileNotFoundError if the archive doesn't exist
+
+            One of `TRANSPORT_ERRORS` if the transfer failed, including
+            when it was cut short and isn't a valid tar
+        """
+        pipe = PipeReader()
+
+        def produce():
+            try:
+                transport.retrieve(archive_path, pipe.write)
+                pipe.close_write()
+            except BaseException as err:
+                pipe.close_write(err)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        try:
+            with tarfile.open(fileobj=pipe, mode="r|") as tar:
+                for member in tar:
+                    name = os.path.basename(member.name)
+                    if name not in wanted or not member.isfile():
+                        continue
+                    usaf_wban, out_path = wanted[name]
+                    member_file = tar.extractfile(member)
+                    if member_file is None or member.size == 0:
+                        continue
+
+                    # Write to a temp file then move it, so there's never a
+                    # truncated file behind
+                    tmp_path = out_path.with_name(out_path.name + ".tmp")
+                    try:
+                        with open(tmp_path, "wb") as f:
+                            writer = self._make_writer(f)
+                            shutil.copyfileobj(member_file, writer, CHUNK_SIZE)  # type: ignore
+                            writer.close()
+                        os.replace(tmp_path, out_path)
+                    finally:
+                        if tmp_path.exists():
+                            tmp_path.unlink()
+
+                    results[usaf_wban] = (ReturnCode.success, out_path)
+                    if archive_stat is not None:
+                        self.manifest.record("{}/{}".format(archive_path, name), *archive_stat, local_path=out_path)
+
+            # Read the padding after the end-of-archive marker, so that the
+            # transfer completes and the session can be reused
+            while pipe.read(CHUNK_SIZE):
+                pass
+        except tarfile.TarError as err:
+            raise EOFError("{} is not a complete tar archive: {}".format(archive_path, err)) from err
+        finally:
+            pipe.close()
+            producer.join()
+
+    async def get_all_data_async(self, max_concurrency: int = 4, plan: Optional[DownloadPlan] = None):
+        """
+        Awaitable counterpart of `get_all_data`: downloads all `years` x
+        `stations` without blocking the event loop.
+
+        Consumes `iter_year_files_async`, so at most `max_concurrency`
+        transfers are in flight at once. `ops_files` is extended in the same
+        (year, station) order as the sync path, regardless of the order in
+        which the transfers completed.
+
+        Args:
+        ------
+            max_concurrency (int, optional): maximum number of concurrent
+                transfers, which is also the number of sessions opened
+
+            plan (DownloadPlan, optional): what to download, see `plan`
+
+        Returns:
+        --------
+
+            stats (3-uple): (n_success, n_doesnt_exists, n_outdated)
+        """
+
+        # c = done; r = doesn't exist; o = outdated, stopped before
+        c = 0
+        r = 0
+        o = 0
+
+        if plan is None:
+            loop = asyncio.get_running_loop()
+            plan = await loop.run_in_executor(None, self._default_plan)
+
+        ops_files = {}
+        async for year, usaf_wban, return_code, op_path in self.iter_year_files_async(
+            max_concurrency=max_concurrency, plan=plan
+        ):
+            if return_code == ReturnCode.success:
+                c += 1
+                ops_files[(year, usaf_wban)] = op_path
+            elif return_code == ReturnCode.missing:
+                r += 1
+            elif return_code == ReturnCode.outdated:
+                o += 1
+
+        self._save_state()
+
+        self.ops_files.extend(
+            ops_files[(item.year, item.usaf_wban)] for item in plan if (item.year, item.usaf_wban) in ops_files
+        )
 
         print("Success: {} files have been stored. ".format(c))
         print("{} station IDs didn't exist. ".format(r))
@@ -272,12 +892,79 @@ class NOAAData:
 
         return (c, r, o)
 
-    def get_year_file(self, year, usaf_wban, to_close=None):
+    async def iter_year_files_async(
+        self, max_concurrency: int = 4, plan: Optional[DownloadPlan] = None
+    ) -> AsyncIterator[Tuple[int, str, ReturnCode, Union[Path, bool]]]:
         """
-        Downloads and extracts data from the appropriate source (GSOD, ISD,
-        etc) from a single year for a single station.
+        Schedules one task per (year, station) of `years` x `stations`, and
+        yields each result as soon as it completes.
+
+        Unless a `plan` is given, it is made first, see `plan`.
+
+        Above `bulk_threshold` stations, GSOD is fetched from the yearly
+        archives instead, with one task per year whose results are yielded
+        together.
+
+        The transfers themselves are blocking calls, so they run in worker
+        threads, each borrowing a session from a `TransportPool` of size
+        `max_concurrency`; an `asyncio.Semaphore` bounds how many are
+        submitted at once.
+
+        Args:
+        ------
+            max_concurrency (int, optional): maximum number of concurrent
+                transfers, which is also the number of sessions opened
+
+            plan (DownloadPlan, optional): what to download, see `plan`
+
+        Yields:
+        --------
+
+            (year, usaf_wban, return_code, op_path): same `return_code` and
+                `op_path` as `get_year_file`
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1, not {}".format(max_concurrency))
+
+        loop = asyncio.get_running_loop()
+        if plan is None:
+            plan = await loop.run_in_executor(None, self._default_plan)
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+        pool = TransportPool(self.transport, size=max_concurrency)
+        executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+        async def fetch(item: PlannedFile):
+            async with semaphore:
+                return_code, op_path = await loop.run_in_executor(executor, self._get_file_pooled, pool, item)
+            return [(item.year, item.usaf_wban, return_code, op_path)]
 
-        calls `GSOD._get_year_file` followed by `GSOD._cleanup_extract_file`
+        async def fetch_archive(year: int):
+            async with semaphore:
+                results = await loop.run_in_executor(executor, self._get_year_archive, pool, year, plan)
+            return [(year, item.usaf_wban, *results[item.usaf_wban]) for item in plan if item.year == year]
+
+        if self._use_archives(len(plan.stations)):
+            tasks = [asyncio.ensure_future(fetch_archive(year=year)) for year in plan.years]
+        else:
+            tasks = [asyncio.ensure_future(fetch(item=item)) for item in plan]
+        try:
+            for task in asyncio.as_completed(tasks):
+                for result in await task:
+                    yield result
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await loop.run_in_executor(executor, pool.close)
+            executor.shutdown(wait=False)
+
+    async def get_year_file_async(
+        self, year: int, usaf_wban: str, pool: Optional[TransportPool] = None
+    ) -> Tuple[ReturnCode, Union[Path, bool]]:
+        """
+        Awaitable counterpart of `get_year_file`: the download and extraction
+        run in a worker thread so the event loop isn't blocked.
 
         Args:
         ------
@@ -286,17 +973,8 @@ class NOAAData:
             usaf_wban (str): the USAF-WBAN (eg '064500-99999') to download data
             for
 
-            ftp (ftplib.FTP): an instance of ftplib.FTP logged into
-                ftp.ncdc.noaa.gov
-                Will create one if None is passed
-
-            weather_dir (str): path to the folder to store weather files, will
-                default to self.weather_dir
-
-            to_close (optional bool): whether to close the ftp connection after download
-                True: force close
-                False: force keep alive (even if it was first created during this call)
-                None: if self.ftp is None originally, will close it, otherwise do nothing
+            pool (TransportPool, optional): the pool to borrow a session from. If
+                None, a single session is opened and closed for this call
 
         Returns:
         --------
@@ -306,25 +984,27 @@ class NOAAData:
 
             op_path (str): path to the uncompressed op_path,
                 False if didn't work
-
         """
+        loop = asyncio.get_running_loop()
 
-        op_path = False
+        own_pool = pool is None
+        if pool is None:
+            pool = TransportPool(self.transport, size=1)
 
-        # TODO: CHECK IF FILE EXISTS BEFORE DOWNLOADING
-        return_code, op_gz_path = self._get_year_file(year=year, usaf_wban=usaf_wban, to_close=to_close)
-        if return_code == ReturnCode.success:
-            op_path = self._cleanup_extract_file(op_gz_path=op_gz_path, delete_op_gz=True)
+        try:
+            item = await loop.run_in_executor(None, self._plan_file, year, usaf_wban)
+            return await loop.run_in_executor(None, self._get_file_pooled, pool, item)
+        finally:
+            if own_pool:
+                await loop.run_in_executor(None, pool.close)
+            self._save_state()
 
-        return return_code, op_path
-
-    def _get_year_file(self, year: int, usaf_wban: str, to_close=None) -> Tuple[ReturnCode, Path]:
+    def get_year_file(self, year, usaf_wban, to_close=None):
         """
-        Downloads data for a single year for a single station
+        Downloads and extracts data from the appropriate source (GSOD, ISD,
+        etc) from a single year for a single station.
 
-        Loads the isd-history.csv in a pandas dataframe to check the station
-        name and make sure there is actually data for the year we want
-        (otherwise would try to download a file that doesn't exist)
+        calls `GSOD._get_file`, then saves the `manifest`
 
         Args:
         ------
@@ -333,101 +1013,334 @@ class NOAAData:
             usaf_wban (str): the USAF-WBAN (eg '064500-99999') to download data
             for
 
-            to_close (optional bool): whether to close the ftp connection after download
+            to_close (optional bool): whether to close `self.transport` after download
+                True: force close
+                False: force keep alive (even if it was first connected during this call)
+                None: if `self.transport` wasn't connected originally, will
+                close it, otherwise do nothing
 
         Returns:
         --------
+
             return_code (ReturnCode): an enum showing the return status
                ('success', 'missing', 'outdated')
 
-            local_path (str): the path to the downloaded *(.op).gz file
+            op_path (str): path to the uncompressed op_path,
+                False if didn't work
 
-        Needs:
-        -------------------------------
-            from ftplib import FTP
-            import pandas as pd
+        """
+
+        return_code, op_path = self._get_file(self._plan_file(year, usaf_wban), to_close=to_close)
+        self._save_state()
+
+        return return_code, op_path
 
+    def _get_file(self, item: PlannedFile, to_close=None) -> Tuple[ReturnCode, Union[Path, bool]]:
         """
+        Downloads and extracts a single station-year of a plan, over
+        `self.transport`
+
+        Connects `self.transport` if it isn't already, then calls
+        `_fetch_file`. If the session drops mid-way, it reconnects and
+        resumes the transfer, up to `MAX_RETRIES` times, after which the file
+        is reported as missing
+
+        Args:
+        ------
+            item (PlannedFile): the station-year to download
+
+            to_close (optional bool): whether to close `self.transport` after download
+
+        Returns:
+        --------
+            return_code (ReturnCode): an enum showing the return status
+               ('success', 'missing', 'outdated')
+
+            op_path (str): path to the uncompressed op_path,
+                False if didn't work
 
-        # Test if folder doesn't exist, create folder
-        self.weather_dir.mkdir(parents=True, exist_ok=True)
+        """
+        if item.status is not None:
+            return self._fetch_file(None, item)
 
-        # Whether you need to close the ftp connection or not
-        if self.ftp is None:
-            # Log to NOAA ftp
-            self.ftp = FTP("ftp.ncdc.noaa.gov")
-            self.ftp.login()
+        # Whether you need to close the connection or not
+        if not self.transport.connected:
+            self.transport.connect()
             if to_close is None:
                 to_close = True
+
+        last_err: Optional[BaseException] = None
+        for _ in range(MAX_RETRIES + 1):
+            try:
+                if not self.transport.connected:
+                    self.transport.connect()
+                return_code, op_path = self._fetch_file(transport=self.transport, item=item)
+                break
+            except TRANSPORT_ERRORS as err:
+                # The session is dead: drop it so that the next attempt reconnects
+                print("Connection lost while downloading {} for {}: {}".format(item.usaf_wban, item.year, err))
+                self.transport.close()
+                last_err = err
         else:
-            if self.ftp.host != "ftp.ncdc.noaa.gov":
-                raise ValueError(
-                    "ftp should be logged into " "'ftp.ncdc.noaa.gov' not into " "'{}'".format(self.ftp.host)
-                )
+            return self._give_up(item, MAX_RETRIES + 1, last_err)
 
-        # Load dataframe of isd-history
-        df_isd = self.isd.df
+        if to_close:
+            self.transport.close()
 
-        # Open an error log file.
-        ferror = open(SUPPORT_DIR / "errors.txt", "w")
+        return (return_code, op_path)
 
-        # Sanitize: should have been done already, but better safe... fast
-        # anyways
-        usaf_wban = sanitize_usaf_wban(usaf_wban)
+    def _fetch_file(self, transport: Optional[Transport], item: PlannedFile) -> Tuple[ReturnCode, Union[Path, bool]]:
+        """
+        Downloads and extracts a single station-year of a plan over
+        `transport`
 
-        # Construct file names
-        remote_op_name = "{id}-{y}.{e}".format(id=usaf_wban, y=year, e=self.gz_ext)
+        The planned files that aren't to be requested (outdated or known to
+        be missing) are reported as such without using `transport`, which
+        can then be None.
 
-        local_op_name = "{s}-{y}.{e}".format(
-            # replace slash in the station name to not infer on the Path
-            s=df_isd.loc[usaf_wban, "STATION NAME"].replace("/", " "),
-            y=year,
-            e=self.gz_ext,
-        )
+        In `sync` mode, the remote size and modification time are checked
+        against the `manifest` first, and the transfer is skipped entirely if
+        the local copy is up to date.
 
-        remote_folder = self.ftp_folder / str(year)
-        local_folder = (self.weather_dir / str(year)).resolve()
-        local_folder.mkdir(parents=True, exist_ok=True)
+        Does not touch `self.transport`, so several of these can run
+        concurrently, one per session.
 
-        remote_path = (remote_folder / remote_op_name).as_posix()
-        local_path = local_folder / local_op_name
+        Args:
+        ------
+            transport (Transport): a connected session
 
-        # Check if there's data or not
-        end_year = df_isd.loc[usaf_wban, "END"].year
+            item (PlannedFile): the station-year to download
 
-        return_code = None
-        if year <= end_year:
-            # Retrieve file: open(fgsod, 'wb') opens a local file to receive
-            # the distant blocks of binary data, in binary write mode
-            # retrbinary(command, callback): command is a 'RETR filename',
-            # and callback function is called for each block of data received:
-            # here we write it to the local file
+        Returns:
+        --------
+            return_code (ReturnCode): an enum showing the return status
+               ('success', 'missing', 'outdated')
 
-            # Try to retrieve it
-            try:
-                self.ftp.retrbinary("RETR " + str(remote_path), open(local_path, "wb").write)
-                print("Station downloaded:" + df_isd.loc[usaf_wban, "STATION NAME"])
+            op_path (str): path to the uncompressed op_path,
+                False if didn't work
+
+        Raises:
+        -------
+            One of `TRANSPORT_ERRORS` if the session itself failed, in
+            which case it should be discarded
+
+        """
+        if item.status == ReturnCode.outdated:
+            warnings.warn(item.reason, UserWarning)
+            return (item.status, False)
+        if item.status is not None:
+            print(item.reason)
+            if item.unlisted:
+                self.failures.record(
+                    item.remote_path, reason="Not in the listing of its folder", ttl=self._failure_ttl(item.year)
+                )
+            return (item.status, False)
+        assert transport is not None
+
+        remote_path = item.remote_path
+        remote_op_name = os.path.basename(remote_path)
+        out_path = item.out_path
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Retrieve file: the callback function is called for each block of
+        # data received: here we inflate it on the fly into the uncompressed
+        # local file, see `_retrieve_file`
+        try:
+            # stat fails if the file doesn't exist, which saves the
+            # transfer too. The size is what the download is checked
+            # against, when the server tells
+            if item.remote_stat is not None and None not in item.remote_stat:
+                remote_stat = item.remote_stat
+            else:
+                remote_stat = transport.stat(remote_path)
+            if self.sync:
+                up_to_date_path = self.manifest.up_to_date_path(remote_path, *remote_stat)
+                if up_to_date_path is not None:
+                    print("Already up to date:" + item.station_name)
+                    return (ReturnCode.success, up_to_date_path)
+
+            if remote_stat[0] == 0:
+                raise RemoteFileNotFoundError("{} is empty".format(remote_op_name))
 
-                return_code = ReturnCode.success
+            self._retrieve_file(transport, remote_path, remote_stat, out_path)
 
-            except Exception as err:
-                return_code = ReturnCode.missing
-                ferror.write(remote_op_name + " doesn't exist\r\n")
-                ferror.write("  {}".format(err))
+            print("Station downloaded:" + item.station_name)
 
+            if self.sync:
+                self.manifest.record(remote_path, *remote_stat, local_path=out_path)
+            self.failures.forget(remote_path)
+
+        except RemoteFileNotFoundError as err:
+            print("{} doesn't exist: {}".format(remote_op_name, err))
+            self.failures.record(remote_path, reason=str(err), ttl=self._failure_ttl(item.year))
+            return (ReturnCode.missing, False)
+
+        return (ReturnCode.success, out_path)
+
+    def _retrieve_file(self, transport: Transport, remote_path: str, remote_stat: Tuple[int, str], out_path: Path):
+        """
+        Downloads `remote_path` to `out_path`, atomically, and resumably if
+        `keep_compressed` or `resumable`.
+
+        Unless `keep_compressed` or `resumable`, the data is inflated on the
+        fly to '<name>(.op).tmp', which is moved to `out_path` once the
+        number of bytes received matches the remote size: the .gz never
+        touches the disk, and an interrupted transfer starts over.
+
+        Otherwise, the compressed stream is appended to a partial file next to it,
+        '<name>(.op).gz.<remote mtime>.part', which is only moved to
+        `out_path` once its size matches the remote one. If the transfer is
+        interrupted, the partial file stays, and the next attempt restarts the
+        transfer at its current size (FTP REST / HTTP Range). Partial files of
+        another version of the remote file are discarded.
+
+        Unless `keep_compressed`, the data is also inflated on the fly to
+        '<name>(.op).tmp', and that is what is moved to `out_path`, and the
+        partial file deleted: when resuming, the partial file is inflated
+        again first, to pick up the decompression where it stopped.
+
+        Args:
+        ------
+            transport (Transport): a connected session
+
+            remote_path (str): the path of the file on NOAA's servers
+
+            remote_stat (tuple): its (size, mtime), see `Transport.stat`. If
+                the size is unknown, the transfer can't be checked against it
+                nor resumed, and starts over
+
+            out_path (Path): where to store it
+
+        Raises:
+        -------
+            One of `TRANSPORT_ERRORS` if the transfer failed or is incomplete
+        """
+        size, mtime = remote_stat
+        tmp_path = out_path.with_name(out_path.name + ".tmp")
+        if not (self.keep_compressed or self.resumable):
+            self._retrieve_inflated(transport, remote_path, size, tmp_path)
+            os.replace(tmp_path, out_path)
+            return
+
+        if self.keep_compressed:
+            gz_path = out_path
         else:
-            return_code = ReturnCode.outdated
-            msg = "{} doesn't have data up to this year. It stopped on:" "{}".format(
-                df_isd.loc[usaf_wban, "STATION NAME"],
-                df_isd.loc[usaf_wban, "END"].date(),
-            )
-            warnings.warn(msg, UserWarning)
+            gz_path = out_path.with_name(out_path.name + ".gz")
+        part_path = gz_path.with_name("{}.{}.part".format(gz_path.name, mtime))
+
+        for stale_path in gz_path.parent.glob(glob.escape(gz_path.name) + ".*.part"):
+            if stale_path != part_path:
+                stale_path.unlink()
+
+        rest = part_path.stat().st_size if part_path.is_file() else 0
+        if rest and (size is None or rest > size):
+            part_path.unlink()
+            rest = 0
+
+        try:
+            with ExitStack() as stack:
+                writer: Optional[GunzipWriter] = None
+                if not self.keep_compressed:
+                    writer = GunzipWriter(stack.enter_context(open(tmp_path, "wb")))
+                    if rest:
+                        # Inflate what was already downloaded
+                        with open(part_path, "rb") as part_file:
+                            shutil.copyfileobj(part_file, writer, CHUNK_SIZE)  # type: ignore
+
+                with open(part_path, "ab") as part_file:
+
+                    def write(data: bytes) -> None:
+                        part_file.write(data)
+                        if writer is not None:
+                            writer.write(data)
+
+                    if size is None or rest < size:
+                        transport.retrieve(remote_path, write, rest=rest)
+
+                received = part_path.stat().st_size
+                if size is not None and received != size:
+                    raise EOFError("{} is incomplete: {} bytes out of {}".format(remote_path, received, size))
+
+                if writer is not None:
+                    try:
+                        writer.close()
+                    except EOFError:
+                        # Complete, yet not a valid gzip: start over next time
+                        part_path.unlink()
+                        raise
+
+        except zlib.error as err:
+            # The partial file can't be trusted, start over next time
+            part_path.unlink()
+            raise EOFError("{} is corrupt: {}".format(remote_path, err)) from err
+        else:
+            if self.keep_compressed:
+                os.replace(part_path, out_path)
+            else:
+                os.replace(tmp_path, out_path)
+                part_path.unlink()
+        finally:
+            # The partial file is kept to resume, never the inflated one
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+    @staticmethod
+    def _retrieve_inflated(transport: Transport, remote_path: str, size: Optional[int], tmp_path: Path):
+        """
+        Downloads `remote_path`, of `size` compressed bytes if known, inflating
+        it on the fly to `tmp_path`, which is deleted if anything goes wrong
 
-        if to_close:
-            self.ftp.close()
-            self.ftp = None
+        Raises:
+        -------
+            One of `TRANSPORT_ERRORS` if the transfer failed or is incomplete
+        """
+        try:
+            with open(tmp_path, "wb") as f:
+                writer = GunzipWriter(f)
+                transport.retrieve(remote_path, writer.write)
+                if size is not None and writer.received != size:
+                    raise EOFError("{} is incomplete: {} bytes out of {}".format(remote_path, writer.received, size))
+                writer.close()
+        except zlib.error as err:
+            tmp_path.unlink()
+            raise EOFError("{} is corrupt: {}".format(remote_path, err)) from err
+        except BaseException:
+            if tmp_path.exists():
+                tmp_path.unlink()
+            raise
+
+    def _save_state(self) -> None:
+        """Writes the `manifest` and the `failures` ledger to disk."""
+        self.manifest.save()
+        self.failures.save()
+
+    @staticmethod
+    def _failure_ttl(year: int) -> Optional[float]:
+        """
+        How long a missing file for `year` is remembered: files of the
+        current year may be published later, so not for long. None means
+        the ledger's default
+        """
+        if year >= datetime.date.today().year:
+            return RECENT_TTL
+        return None
+
+    def _plan_file(self, year: int, usaf_wban: str) -> PlannedFile:
+        """The plan of a single station-year, see `plan`: raises if the station isn't in isd-history.csv."""
+        return self._plan_files([int(year)], [usaf_wban]).files[0]
 
-        return (return_code, local_path)
+    def _default_plan(self) -> DownloadPlan:
+        """The plan of `get_all_data` when none is given: lists the year folders, unless using the archives."""
+        return self.plan(list_folders=not self._use_archives(len(self.stations)))
+
+    def _make_writer(self, f: BinaryIO) -> Union[CopyWriter, GunzipWriter]:
+        """
+        The sink to write a downloaded *(.op).gz to `f`: as is if
+        `keep_compressed`, inflated on the fly otherwise
+        """
+        if self.keep_compressed:
+            return CopyWriter(f)
+        return GunzipWriter(f)
 
     def _cleanup_extract_file(self, op_gz_path: Path, delete_op_gz: bool = True) -> Path:
         """
@@ -468,7 +1381,7 @@ class NOAAData:
                 with gzip.open(op_gz_path, "rb") as in_file:
                     # Open a second file to write the uncompressed stream
                     with open(op_path, "wb") as out_file:
-                        out_file.write(in_file.read())
+                        shutil.copyfileobj(in_file, out_file, CHUNK_SIZE)
 
                 # Deletes the op_gz_path
                 if delete_op_gz:
@@ -478,15 +1391,22 @@ class NOAAData:
 
         return op_path
 
-    def cleanup_extract_all(self, year):
+    def cleanup_extract_all(self, year, extract: Optional[bool] = None):
         """
         Extracts the GSOD *(.op).gz files to *.op
         and deletes the original gzip file
 
+        With `keep_compressed=True`, the parsers read the *(.op).gz files
+        directly so there is nothing to extract: only the empty files are
+        deleted
+
         Args:
         ------
             year (int): Year to download data for
 
+            extract (bool, optional): whether to extract the files. Defaults
+                to `not self.keep_compressed`
+
         Returns:
         --------
             None
@@ -501,6 +1421,9 @@ class NOAAData:
         # Input: year.
         # Import the os module, for the os.walk function
 
+        if extract is None:
+            extract = not self.keep_compressed
+
         # Set the directory you want to start from
         weatherfolder = self.weather_dir / str(year)
 
@@ -519,7 +1442,7 @@ class NOAAData:
                 # If the file is empty, we delete it
                 if os.path.getsize(path) == 0:
                     os.remove(path)
-                else:
+                elif extract:
                     # If not, we extract
                     # Another way of getting the extension
                     if os.path.splitext(fname)[1] == ".gz":
@@ -528,7 +1451,7 @@ class NOAAData:
                         in_file = gzip.open(path, "rb")
                         # Open a second file to write the uncompressed stream
                         out_file = open(outpath, "wb")
-                        out_file.write(in_file.read())
+                        shutil.copyfileobj(in_file, out_file, CHUNK_SIZE)
 
                         # close both
                         in_file.close()
@@ -8,7 +8,7 @@ from pygsod.epw_converter import clean_df, epw_convert
 from pygsod.ish_full import parse_ish_file
 from pygsod.noaadata import NOAAData
 from pygsod.tmy_download import TMY
-from pygsod.utils import DataType, FileType, OutputType
+from pygsod.utils import DataType, FileType, OutputType, strip_gz_suffix
 
 
 class GetOneStation(object):
@@ -159,7 +159,8 @@ class Output(object):
     ):
         """Constructs an Output object."""
 
-        self.file = Path(file)
+        # Files kept compressed at rest are named after their extracted version
+        self.file = strip_gz_suffix(file)
         self.op_file_name = self.file.name
 
         self._file_names()
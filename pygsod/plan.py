@@ -0,0 +1,152 @@
+"""Download plans: what to fetch from NOAA, what to skip, and how big it is."""
+
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from pygsod.utils import DataType, ReturnCode
+
+# Typical size of a compressed station-year file, to estimate the transfer
+# when the size isn't known from a listing of the remote folders
+TYPICAL_FILE_SIZES = {
+    DataType.gsod: 13000,
+    DataType.isd_lite: 100000,
+    DataType.isd_full: 800000,
+}
+
+
+class PlannedFile:
+    """
+    One station-year of a `DownloadPlan`: where it is on NOAA's servers,
+    where it goes locally, and whether it needs to be requested at all
+    """
+
+    def __init__(
+        self,
+        year: int,
+        usaf_wban: str,
+        station_name: str,
+        remote_path: str,
+        out_path: Path,
+        status: Optional[ReturnCode] = None,
+        reason: str = "",
+        remote_stat: Optional[Tuple[Optional[int], Optional[str]]] = None,
+        unlisted: bool = False,
+    ):
+        """
+        Args:
+        ------
+            year (int): Year to download data for (format YYYY)
+
+            usaf_wban (str): the sanitized USAF-WBAN (eg '064500-99999')
+
+            station_name (str): its 'STATION NAME' in isd-history.csv
+
+            remote_path (str): eg '/pub/data/gsod/2017/744860-94789-2017.op.gz'
+
+            out_path (Path): where to store it
+
+            status (ReturnCode, optional): None if the file is to be
+                downloaded, otherwise the outcome known in advance
+                ('missing' or 'outdated'), so it isn't requested
+
+            reason (str): why it isn't requested, if so
+
+            remote_stat (tuple, optional): the remote (size, mtime), if known
+                from a listing of the remote folder, each may be None
+
+            unlisted (bool): missing because it isn't in the listing of the
+                remote folder, which is recorded in the failures ledger when
+                the plan is run, not when it is made
+        """
+        self.year = year
+        self.usaf_wban = usaf_wban
+        self.station_name = station_name
+        self.remote_path = remote_path
+        self.out_path = out_path
+        self.status = status
+        self.reason = reason
+        self.remote_stat = remote_stat
+        self.unlisted = unlisted
+
+    @property
+    def size(self) -> Optional[int]:
+        """The remote size in bytes, if known."""
+        if self.remote_stat is None:
+            return None
+        return self.remote_stat[0]
+
+    def __repr__(self):
+        return "PlannedFile({!r}, {}, status={})".format(self.usaf_wban, self.year, self.status)
+
+
+class DownloadPlan:
+    """
+    The station-years to download for `years` x `stations`, as returned by
+    `NOAAData.plan`, and run by `NOAAData.get_all_data`.
+
+    `files` are in the (year, station) order of the downloads.
+    """
+
+    def __init__(self, data_type: DataType, years: List[int], stations: List[str], files: List[PlannedFile]):
+        """
+        Args:
+        ------
+            data_type (DataType): the type of data to fetch
+
+            years (list of int): years to download data for
+
+            stations (list of str): sanitized USAF-WBANs
+
+            files (list of PlannedFile): one per (year, station)
+        """
+        self.data_type = data_type
+        self.years = years
+        self.stations = stations
+        self.files = files
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def __iter__(self) -> Iterator[PlannedFile]:
+        return iter(self.files)
+
+    def __repr__(self):
+        return "DownloadPlan({} files to download out of {}, ~{:.1f} MB)".format(
+            len(self.to_download), len(self.files), self.estimated_bytes / 1e6
+        )
+
+    @property
+    def to_download(self) -> List[PlannedFile]:
+        """The files that will be requested."""
+        return [f for f in self.files if f.status is None]
+
+    @property
+    def total_bytes(self) -> Optional[int]:
+        """The exact size of the transfer, None if the size of any file is unknown."""
+        sizes = [f.size for f in self.to_download]
+        if None in sizes:
+            return None
+        return sum(sizes)  # type: ignore
+
+    @property
+    def estimated_bytes(self) -> int:
+        """The size of the transfer, using `TYPICAL_FILE_SIZES` for the files whose size is unknown."""
+        typical_size = TYPICAL_FILE_SIZES[self.data_type]
+        return sum(typical_size if f.size is None else f.size for f in self.to_download)
+
+    def to_frame(self) -> pd.DataFrame:
+        """The plan as a DataFrame, one row per file, to inspect it."""
+        return pd.DataFrame(
+            {
+                "year": [f.year for f in self.files],
+                "usaf_wban": [f.usaf_wban for f in self.files],
+                "station_name": [f.station_name for f in self.files],
+                "status": [None if f.status is None else f.status.name for f in self.files],
+                "reason": [f.reason for f in self.files],
+                "size": [f.size for f in self.files],
+                "remote_path": [f.remote_path for f in self.files],
+                "out_path": [f.out_path for f in self.files],
+            }
+        )
@@ -0,0 +1,206 @@
+"""Search index over weather stations' country, state and name."""
+
+import bisect
+import difflib
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import pandas as pd
+
+# What separates the words of a station name, once upper-cased
+_NON_ALNUM = re.compile(r"[^0-9A-Z]+")
+
+# How many candidate names `StationSearch.match` scores at most: the ones
+# sharing the most words with the query
+MAX_CANDIDATES = 200
+
+
+def normalize_name(name: str) -> str:
+    """Upper-cases `name` and collapses anything but letters and digits to single spaces."""
+    return _NON_ALNUM.sub(" ", str(name).upper()).strip()
+
+
+def _key(value) -> Optional[str]:
+    """A CTRY/STATE value as a dict key, None if missing."""
+    if pd.isna(value):
+        return None
+    return str(value)
+
+
+class StationSearch:
+    """
+    Prebuilt lookups over the CTRY, STATE and STATION NAME columns of a
+    stations table, eg `ISDHistory.df`:
+        * hash maps for the exact matches, as used by
+          `NOAAData.get_stations_from_user_input`
+        * the sorted, distinct values for the dropdowns (countries, states
+          of a country, stations of a country/state)
+        * a sorted index of the normalized names for type-ahead, and a word
+          index for tolerant matching of misspelled names
+
+    Everything is computed once, when built.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        """
+        Args:
+        ------
+            df (pd.DataFrame): with 'CTRY', 'STATE' and 'STATION NAME'
+                columns. The lookups return its index labels
+        """
+        self.labels = df.index
+        countries = [_key(x) for x in df["CTRY"]]
+        states = [_key(x) for x in df["STATE"]]
+        names = [str(x) for x in df["STATION NAME"]]
+
+        # Exact matches => positions, in the order of `df`
+        self._by_country_name: Dict[Tuple[Optional[str], str], List[int]] = defaultdict(list)
+        self._by_country_state_name: Dict[Tuple[Optional[str], Optional[str], str], List[int]] = defaultdict(list)
+        # Dropdowns
+        self._states: Dict[Optional[str], set] = defaultdict(set)
+        self._names: Dict[Tuple[Optional[str], Optional[str]], set] = defaultdict(set)
+        # Normalized name => positions
+        self._by_normalized: Dict[str, List[int]] = defaultdict(list)
+
+        for i, (country, state, name) in enumerate(zip(countries, states, names)):
+            self._by_country_name[(country, name)].append(i)
+            self._by_country_state_name[(country, state, name)].append(i)
+            self._states[country].add(state)
+            self._names[(country, None)].add(name)
+            self._names[(country, state)].add(name)
+            self._by_normalized[normalize_name(name)].append(i)
+
+        self._countries = set(countries)
+        # Sorted normalized names, for the prefix search
+        self._sorted_names = sorted(self._by_normalized)
+        # Sorted (word, normalized name), for the tolerant search
+        self._sorted_words = sorted({(word, name) for name in self._by_normalized for word in name.split()})
+        self._sorted_words_keys = [word for word, _ in self._sorted_words]
+        self._cache: Dict[Hashable, List[str]] = {}
+
+    @staticmethod
+    def _sorted(values, na_rep: Optional[str]) -> List[str]:
+        """Sorted values, the missing ones as `na_rep`, or dropped if None."""
+        values = [na_rep if value is None else value for value in values]
+        return sorted(value for value in set(values) if value is not None)
+
+    def countries(self, na_rep: Optional[str] = None) -> List[str]:
+        """The sorted distinct countries, the missing ones as `na_rep`, or dropped if None."""
+        key = ("countries", na_rep)
+        if key not in self._cache:
+            self._cache[key] = self._sorted(self._countries, na_rep)
+        return self._cache[key]
+
+    def states(self, country: Optional[str], na_rep: Optional[str] = None) -> List[str]:
+        """The sorted distinct states of `country`, the missing ones as `na_rep`, or dropped if None."""
+        key = ("states", country, na_rep)
+        if key not in self._cache:
+            self._cache[key] = self._sorted(self._states.get(country, ()), na_rep)
+        return self._cache[key]
+
+    def station_names(self, country: Optional[str], state: Optional[str] = None) -> List[str]:
+        """The sorted distinct station names of `country`, and `state` if not None."""
+        key = ("names", country, state)
+        if key not in self._cache:
+            self._cache[key] = sorted(self._names.get((country, state), ()))
+        return self._cache[key]
+
+    def find(self, country: Optional[str], station_name: str, state: Optional[str] = None) -> pd.Index:
+        """
+        The labels of the stations named exactly `station_name` in `country`,
+        and `state` if not None, in the order of the table
+        """
+        if state is None:
+            positions = self._by_country_name.get((country, station_name), [])
+        else:
+            positions = self._by_country_state_name.get((country, state, station_name), [])
+        return self.labels[positions]
+
+    def prefix(self, prefix: str, limit: Optional[int] = 20) -> pd.Index:
+        """
+        The labels of the stations whose name starts with `prefix`, ignoring
+        case and punctuation, by name, for type-ahead
+
+        Args:
+        ------
+            prefix (str): the beginning of a station name
+
+            limit (int, optional): maximum number of labels, all if None
+        """
+        prefix = normalize_name(prefix)
+        positions: List[int] = []
+        for i in range(bisect.bisect_left(self._sorted_names, prefix), len(self._sorted_names)):
+            name = self._sorted_names[i]
+            if not name.startswith(prefix) or (limit is not None and len(positions) >= limit):
+                break
+            positions.extend(self._by_normalized[name])
+        return self.labels[positions[:limit]]
+
+    def match(self, station_name: str, limit: int = 5, cutoff: float = 0.6) -> pd.Series:
+        """
+        The stations whose name best matches `station_name`, tolerating typos
+        and missing or reordered words
+
+        The candidates are the names sharing word prefixes with
+        `station_name`: only the `MAX_CANDIDATES` sharing the most are
+        scored, with `difflib`, rather than all the names. The score is the
+        best of the similarity of the whole names, and the mean similarity of
+        each word of `station_name` to its closest word in the name, so that
+        partial names match too
+
+        Args:
+        ------
+            station_name (str): a, possibly misspelled, station name
+
+            limit (int): maximum number of names
+
+            cutoff (float): minimum score, in [0, 1]
+
+        Returns:
+        --------
+            scores (pd.Series): the score of each matching station, indexed
+                by label, best first
+        """
+        query = normalize_name(station_name)
+        query_words = query.split()
+        candidates: Counter = Counter()
+        # Initials and the likes would make nearly every name a candidate
+        for word in [word for word in query_words if len(word) >= 3] or query_words:
+            # Words starting with the first 3 letters of `word`, for the typos at the end
+            stem = word[:3]
+            names = set()
+            for i in range(bisect.bisect_left(self._sorted_words_keys, stem), len(self._sorted_words)):
+                other_word, name = self._sorted_words[i]
+                if not other_word.startswith(stem):
+                    break
+                names.add(name)
+            candidates.update(names)
+
+        matcher = difflib.SequenceMatcher(b=query, autojunk=False)
+        word_matchers = [difflib.SequenceMatcher(b=word, autojunk=False) for word in query_words]
+        scored = []
+        for name, _ in candidates.most_common(MAX_CANDIDATES):
+            matcher.set_seq1(name)
+            score = matcher.ratio()
+            words = name.split()
+            word_scores = []
+            for word_matcher in word_matchers:
+                best = 0.0
+                for word in words:
+                    word_matcher.set_seq1(word)
+                    if word_matcher.real_quick_ratio() > best:
+                        best = max(best, word_matcher.ratio())
+                word_scores.append(best)
+            if word_scores:
+                score = max(score, sum(word_scores) / len(word_scores))
+            if score >= cutoff:
+                scored.append((score, name))
+        scored.sort(key=lambda x: (-x[0], x[1]))
+
+        positions = []
+        scores = []
+        for score, name in scored[:limit]:
+            positions.extend(self._by_normalized[name])
+            scores.extend([score] * len(self._by_normalized[name]))
+        return pd.Series(scores, index=self.labels[positions], name="score", dtype=float)
@@ -0,0 +1,248 @@
+"""Spatial index over weather stations, for k-nearest and radius queries."""
+
+import heapq
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# Mean radius of the Earth in km, same as `ISDHistory.distance`
+EARTH_RADIUS = 6371.0
+
+# Stations per leaf: distances are computed for a whole leaf at once
+LEAF_SIZE = 32
+
+
+def to_unit_vectors(lat, lon) -> np.ndarray:
+    """Converts latitudes and longitudes in degrees to (n, 3) points on the unit sphere."""
+    lat_rad = np.radians(np.asarray(lat, dtype=np.float64))
+    lon_rad = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat_rad)
+    return np.stack([cos_lat * np.cos(lon_rad), cos_lat * np.sin(lon_rad), np.sin(lat_rad)], axis=-1)
+
+
+def chord_to_km(chord):
+    """The great-circle distance in km for a chord length on the unit sphere."""
+    return 2 * EARTH_RADIUS * np.arcsin(np.minimum(chord / 2, 1.0))
+
+
+def km_to_chord(distance):
+    """The chord length on the unit sphere for a great-circle distance in km."""
+    return 2 * np.sin(np.minimum(distance / (2 * EARTH_RADIUS), np.pi / 2))
+
+
+class StationIndex:
+    """
+    KD-tree over the stations' positions as 3-D unit vectors, so that the
+    straight-line (chord) distance orders the stations the same way the
+    great-circle distance does, without special cases at the poles or the
+    antimeridian.
+
+    The tree is stored as flat arrays: leaves hold up to `LEAF_SIZE`
+    stations, contiguous in `order`, and every node has the bounding box of
+    its stations, and the earliest BEGIN / latest END year among them so
+    that the year filters prune whole subtrees.
+
+    Stations without coordinates are left out.
+    """
+
+    def __init__(self, lat, lon, begin_years, end_years, leaf_size: int = LEAF_SIZE):
+        """
+        Args:
+        ------
+            lat, lon (array-like): the stations' coordinates, in degrees
+
+            begin_years, end_years (array-like of int): the first and last
+                year each station recorded data
+
+            leaf_size (int): maximum number of stations per leaf
+        """
+        points = to_unit_vectors(lat, lon)
+        valid = np.flatnonzero(np.isfinite(points).all(axis=1))
+
+        self.leaf_size = leaf_size
+        self.begin_years = np.asarray(begin_years, dtype=np.int32)
+        self.end_years = np.asarray(end_years, dtype=np.int32)
+
+        # Nodes, as lists while building
+        starts: List[int] = []
+        ends: List[int] = []
+        children: List[Tuple[int, int]] = []
+
+        order = valid.copy()
+        stack = [(0, len(order), -1, 0)]
+        while stack:
+            start, end, parent, side = stack.pop()
+            node = len(starts)
+            starts.append(start)
+            ends.append(end)
+            children.append((-1, -1))
+            if parent >= 0:
+                left, right = children[parent]
+                children[parent] = (node, right) if side == 0 else (left, node)
+
+            if end - start <= leaf_size:
+                continue
+            # Split on the median along the widest dimension
+            idx = order[start:end]
+            spread = points[idx].max(axis=0) - points[idx].min(axis=0)
+            dim = int(np.argmax(spread))
+            mid = (end - start) // 2
+            order[start:end] = idx[np.argpartition(points[idx, dim], mid)]
+            stack.append((start + mid, end, node, 1))
+            stack.append((start, start + mid, node, 0))
+
+        self.order = order
+        self.points = points[order]
+        self._begin = self.begin_years[order]
+        self._end = self.end_years[order]
+        self.starts = np.array(starts, dtype=np.int64)
+        self.ends = np.array(ends, dtype=np.int64)
+        self.children = np.array(children, dtype=np.int64).reshape(-1, 2)
+
+        n_nodes = len(starts)
+        self.lo = np.empty((n_nodes, 3))
+        self.hi = np.empty((n_nodes, 3))
+        self.min_begin = np.empty(n_nodes, dtype=np.int32)
+        self.max_end = np.empty(n_nodes, dtype=np.int32)
+        for node in range(n_nodes):
+            start, end = self.starts[node], self.ends[node]
+            if start == end:
+                self.lo[node], self.hi[node] = np.inf, -np.inf
+                self.min_begin[node], self.max_end[node] = np.iinfo(np.int32).max, np.iinfo(np.int32).min
+                continue
+            self.lo[node] = self.points[start:end].min(axis=0)
+            self.hi[node] = self.points[start:end].max(axis=0)
+            self.min_begin[node] = self._begin[start:end].min()
+            self.max_end[node] = self._end[start:end].max()
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def _node_distance(self, node: int, point: np.ndarray) -> float:
+        """The chord distance from `point` to the bounding box of `node`."""
+        return float(np.linalg.norm(point - np.clip(point, self.lo[node], self.hi[node])))
+
+    def _node_pruned(self, node: int, start_year: Optional[int], end_year: Optional[int]) -> bool:
+        """Whether no station of `node` covers `start_year` to `end_year`."""
+        if start_year is not None and self.min_begin[node] > start_year:
+            return True
+        if end_year is not None and self.max_end[node] < end_year:
+            return True
+        return False
+
+    def _leaf(
+        self, node: int, point: np.ndarray, start_year: Optional[int], end_year: Optional[int]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """The tree positions and chord distances of the stations of a leaf that pass the year filters."""
+        start, end = self.starts[node], self.ends[node]
+        positions = np.arange(start, end)
+        mask = np.ones(end - start, dtype=bool)
+        if start_year is not None:
+            mask &= self._begin[start:end] <= start_year
+        if end_year is not None:
+            mask &= self._end[start:end] >= end_year
+        positions = positions[mask]
+        return positions, np.linalg.norm(self.points[positions] - point, axis=1)
+
+    def query(
+        self, lat: float, lon: float, k: int = 1, start_year: Optional[int] = None, end_year: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The `k` nearest stations to a point, closest first
+
+        Args:
+        ------
+            lat, lon (float): the point, in degrees
+
+            k (int): how many stations to return, fewer if not enough pass
+                the filters
+
+            start_year, end_year (int, optional): only consider the stations
+                whose BEGIN/END cover these years
+
+        Returns:
+        --------
+            indices (np.ndarray): positions of the stations in the arrays
+                the index was built from
+
+            distances (np.ndarray): great-circle distances in km
+        """
+        point = to_unit_vectors(lat, lon)
+        # Max-heap of the best so far, as (-distance, position)
+        best: List[Tuple[float, int]] = []
+        # Min-heap of the nodes to visit, as (distance to the box, node)
+        to_visit = [(self._node_distance(0, point), 0)] if len(self) and k > 0 else []
+        while to_visit:
+            node_distance, node = heapq.heappop(to_visit)
+            if len(best) == k and node_distance > -best[0][0]:
+                break
+            if self._node_pruned(node, start_year, end_year):
+                continue
+            left, right = self.children[node]
+            if left < 0:
+                positions, distances = self._leaf(node, point, start_year, end_year)
+                for position, distance in zip(positions.tolist(), distances.tolist()):
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, position))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, position))
+            else:
+                for child in (left, right):
+                    heapq.heappush(to_visit, (self._node_distance(child, point), child))
+
+        best.sort(key=lambda x: (-x[0], x[1]))
+        positions = np.array([position for _, position in best], dtype=np.int64)
+        distances = np.array([-distance for distance, _ in best], dtype=np.float64)
+        return self.order[positions], chord_to_km(distances)
+
+    def query_radius(
+        self,
+        lat: float,
+        lon: float,
+        radius: float,
+        start_year: Optional[int] = None,
+        end_year: Optional[int] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        All the stations within `radius` km of a point, closest first
+
+        Args:
+        ------
+            lat, lon (float): the point, in degrees
+
+            radius (float): in km
+
+            start_year, end_year (int, optional): only consider the stations
+                whose BEGIN/END cover these years
+
+        Returns:
+        --------
+            indices (np.ndarray): positions of the stations in the arrays
+                the index was built from
+
+            distances (np.ndarray): great-circle distances in km
+        """
+        point = to_unit_vectors(lat, lon)
+        chord = km_to_chord(radius)
+        found_positions = []
+        found_distances = []
+        to_visit = [0] if len(self) else []
+        while to_visit:
+            node = to_visit.pop()
+            if self._node_pruned(node, start_year, end_year) or self._node_distance(node, point) > chord:
+                continue
+            left, right = self.children[node]
+            if left < 0:
+                positions, distances = self._leaf(node, point, start_year, end_year)
+                within = distances <= chord
+                found_positions.append(positions[within])
+                found_distances.append(distances[within])
+            else:
+                to_visit.extend((left, right))
+
+        if not found_positions:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        positions = np.concatenate(found_positions)
+        distances = np.concatenate(found_distances)
+        closest = np.lexsort((positions, distances))
+        return self.order[positions[closest]], chord_to_km(distances[closest])
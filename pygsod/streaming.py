@@ -0,0 +1,209 @@
+"""Helpers to process downloads as they stream in, rather than once on disk."""
+
+import queue
+import zlib
+from typing import BinaryIO, Optional
+
+# Size of the blocks requested from the server, and upper bound on the size of
+# any decompressed block held in memory
+CHUNK_SIZE = 64 * 1024
+
+# wbits for zlib to expect a gzip header and trailer
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+class GunzipWriter:
+    """
+    A sink for a gzip stream, that decompresses whatever it receives on the
+    fly and writes the plain data to `out_file`.
+
+    Meant to be passed as the callback of `Transport.retrieve`, so that the
+    `.gz` needn't be written to disk, and never more than `chunk_size` bytes
+    of decompressed data are held in memory. `NOAAData` only writes the `.gz`
+    too when its downloads are resumable.
+
+    Handles multi-member gzip files, like `gzip.open` does.
+
+    Usage:
+    ------
+        with open(op_path, "wb") as f:
+            writer = GunzipWriter(f)
+            ftp.retrbinary("RETR " + remote_path, writer.write)
+            writer.close()
+    """
+
+    def __init__(self, out_file: BinaryIO, chunk_size: int = CHUNK_SIZE):
+        """
+        Args:
+        ------
+            out_file (file-like): opened in binary write mode
+
+            chunk_size (int): maximum size of a decompressed block
+        """
+        self.out_file = out_file
+        self.chunk_size = chunk_size
+        self._decompressor = zlib.decompressobj(GZIP_WBITS)
+
+        # Number of compressed bytes received so far
+        self.received = 0
+
+    def write(self, data: bytes) -> None:
+        """Decompresses `data` and writes the result to `out_file`."""
+        self.received += len(data)
+        while data:
+            if self._decompressor.eof:
+                # Start of another gzip member
+                self._decompressor = zlib.decompressobj(GZIP_WBITS)
+
+            self.out_file.write(self._decompressor.decompress(data, self.chunk_size))
+            if self._decompressor.eof:
+                data = self._decompressor.unused_data
+            else:
+                data = self._decompressor.unconsumed_tail
+
+    def close(self) -> None:
+        """
+        Flushes what remains, and checks the gzip stream was complete.
+
+        Raises:
+        -------
+            EOFError if the stream ended before the end of the gzip member
+        """
+        if self.received == 0:
+            return
+
+        if not self._decompressor.eof:
+            raise EOFError("Compressed stream ended before the end-of-stream marker was reached")
+
+        self.out_file.write(self._decompressor.flush())
+
+
+class CopyWriter:
+    """
+    Same interface as `GunzipWriter`, but writes the data as is: used when
+    files are kept compressed at rest.
+    """
+
+    def __init__(self, out_file: BinaryIO):
+        """
+        Args:
+        ------
+            out_file (file-like): opened in binary write mode
+        """
+        self.out_file = out_file
+
+        # Number of bytes received so far
+        self.received = 0
+
+    def write(self, data: bytes) -> None:
+        """Writes `data` to `out_file`."""
+        self.received += len(data)
+        self.out_file.write(data)
+
+    def close(self) -> None:
+        """Nothing to flush, for compatibility with `GunzipWriter`."""
+        pass
+
+
+# Marks the end of the stream in `PipeReader`'s queue
+_EOF = object()
+
+
+class PipeReader:
+    """
+    A read-only file-like object fed by another thread through `write`: turns
+    the push-style callback of `Transport.retrieve` into something that
+    pull-style consumers, like `tarfile` in stream mode, can `read` from.
+
+    At most `max_chunks` blocks are buffered, so a slow consumer throttles
+    the transfer instead of piling it up in memory.
+
+    Usage:
+    ------
+        pipe = PipeReader()
+        # In the producer thread:
+        try:
+            transport.retrieve(remote_path, pipe.write)
+            pipe.close_write()
+        except BaseException as err:
+            pipe.close_write(err)
+        # In the consumer thread:
+        with tarfile.open(fileobj=pipe, mode="r|") as tar:
+            ...
+        pipe.close()
+    """
+
+    def __init__(self, max_chunks: int = 16):
+        """
+        Args:
+        ------
+            max_chunks (int): maximum number of blocks held in memory
+        """
+        self._queue: "queue.Queue[object]" = queue.Queue(max_chunks)
+        self._buffer = b""
+        self._pos = 0
+        self._eof = False
+        self._closed = False
+
+    def write(self, data: bytes) -> None:
+        """
+        Producer side: queues `data`, blocking while the buffer is full.
+
+        Raises:
+        -------
+            BrokenPipeError if the consumer closed the pipe, so that the
+            transfer is aborted
+        """
+        if self._closed:
+            raise BrokenPipeError("PipeReader was closed by its consumer")
+        self._queue.put(data)
+
+    def close_write(self, error: Optional[BaseException] = None) -> None:
+        """
+        Producer side: signals the end of the stream, or that it failed with
+        `error`, which is then raised by the consumer's next `read`.
+        """
+        if not self._closed:
+            self._queue.put(_EOF if error is None else error)
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        """Consumer side: reads up to `size` bytes, b"" at the end of the stream."""
+        if size is None or size < 0:
+            chunks = []
+            while True:
+                chunk = self.read(CHUNK_SIZE)
+                if not chunk:
+                    return b"".join(chunks)
+                chunks.append(chunk)
+
+        while self._pos >= len(self._buffer):
+            if self._eof:
+                return b""
+            item = self._queue.get()
+            if item is _EOF:
+                self._eof = True
+            elif isinstance(item, BaseException):
+                self._eof = True
+                raise item
+            else:
+                self._buffer = item  # type: ignore
+                self._pos = 0
+
+        data = self._buffer[self._pos : self._pos + size]
+        self._pos += len(data)
+        return data
+
+    def close(self) -> None:
+        """
+        Consumer side: stops reading. Whatever is buffered is dropped, and
+        the producer's next `write` raises.
+        """
+        self._closed = True
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
@@ -0,0 +1,615 @@
+"""The different ways of reaching NOAA's data: FTP, HTTPS, or a local mirror."""
+
+import email.utils
+import http.server
+import os
+import queue
+import re
+import socket
+import ssl
+import threading
+import time
+import urllib.parse
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from ftplib import FTP, error_perm, error_proto, error_reply, error_temp
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional, Set, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from pygsod.constants import NOAA_FTP_HOST, NOAA_HTTPS_URL
+from pygsod.streaming import CHUNK_SIZE
+from pygsod.utils import as_path
+
+# Errors meaning the session itself is broken (dropped, timed out, server
+# hiccup...), as opposed to `RemoteFileNotFoundError` which leaves the session
+# perfectly usable. Only the network ones: local errors, eg a full disk, are
+# not retried nor taken for remote failures, so not any OSError
+TRANSPORT_ERRORS = (
+    EOFError,
+    ConnectionError,
+    TimeoutError,
+    socket.timeout,
+    socket.gaierror,
+    ssl.SSLError,
+    requests.RequestException,
+    error_temp,
+    error_reply,
+    error_proto,
+)
+
+# How many times a transfer is retried after its session dropped. Partial
+# downloads are kept, so a retry resumes where the previous attempt stopped
+MAX_RETRIES = 2
+
+# Modification times are exchanged in the format of FTP's MDTM, in UTC
+MDTM_FORMAT = "%Y%m%d%H%M%S"
+
+# A directory listing: file name => (size, mtime), each None if unknown
+Listing = Dict[str, Tuple[Optional[int], Optional[str]]]
+
+
+class RemoteFileNotFoundError(Exception):
+    """Raised by a Transport when the requested remote file doesn't exist."""
+
+    pass
+
+
+class Transport(ABC):
+    """
+    Base class for a session to a server exposing NOAA's tree of files
+    ('/pub/data/noaa/...', '/pub/data/gsod/...')
+
+    A Transport is a single session and is not thread-safe: use `clone` to get
+    an independent one, or a `TransportPool`.
+
+    Subclasses must implement all the abstract methods to be instantiated.
+    """
+
+    @property
+    @abstractmethod
+    def connected(self) -> bool:
+        """Whether the session is currently open."""
+
+    @abstractmethod
+    def connect(self) -> None:
+        """Opens the session."""
+
+    @abstractmethod
+    def close(self) -> None:
+        """Closes the session, if open."""
+
+    @abstractmethod
+    def clone(self) -> "Transport":
+        """Returns a new, not connected, session with the same settings."""
+
+    @abstractmethod
+    def retrieve(self, remote_path: str, callback: Callable[[bytes], None], rest: int = 0) -> None:
+        """
+        Downloads `remote_path`, calling `callback` for each block received
+
+        Args:
+        ------
+            remote_path (str): the absolute path of the file on the server
+
+            callback (callable): called with each block of bytes
+
+            rest (int): offset to restart the transfer at, in bytes
+
+        Raises:
+        -------
+            RemoteFileNotFoundError if the file doesn't exist
+
+            One of `TRANSPORT_ERRORS` if the session itself failed
+        """
+
+    @abstractmethod
+    def stat(self, remote_path: str) -> Tuple[Optional[int], Optional[str]]:
+        """
+        Gets the size and the modification time of a remote file
+
+        Returns:
+        --------
+            size (int): in bytes, None if the server doesn't tell
+
+            mtime (str): 'YYYYMMDDHHMMSS' in UTC, like FTP's MDTM, None if
+                the server doesn't tell
+
+        Raises:
+        -------
+            RemoteFileNotFoundError if the file doesn't exist
+        """
+
+    @abstractmethod
+    def listdir(self, remote_dir: str) -> Listing:
+        """
+        Lists the files of a remote folder, in a single request
+
+        Returns:
+        --------
+            listing (dict): file name => (size, mtime), like `stat`. Either
+                is None if the server doesn't tell
+
+        Raises:
+        -------
+            RemoteFileNotFoundError if the folder doesn't exist
+        """
+
+    def __enter__(self) -> "Transport":
+        if not self.connected:
+            self.connect()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class FTPTransport(Transport):
+    """Session to an FTP server, by default NOAA's."""
+
+    def __init__(self, host: str = NOAA_FTP_HOST, timeout: Optional[float] = None):
+        """
+        Args:
+        ------
+            host (str): the FTP host to log into anonymously
+
+            timeout (float, optional): socket timeout in seconds
+        """
+        self.host = host
+        self.timeout = timeout
+        self.ftp: Optional[FTP] = None
+
+    def __repr__(self):
+        return "FTPTransport(host={!r})".format(self.host)
+
+    @property
+    def connected(self) -> bool:
+        return self.ftp is not None
+
+    def connect(self) -> None:
+        if self.timeout is None:
+            ftp = FTP(self.host)
+        else:
+            ftp = FTP(self.host, timeout=self.timeout)
+        ftp.login()
+        self.ftp = ftp
+
+    def close(self) -> None:
+        if self.ftp is None:
+            return
+        try:
+            self.ftp.quit()
+        except Exception:
+            self.ftp.close()
+        self.ftp = None
+
+    def clone(self) -> "FTPTransport":
+        return FTPTransport(host=self.host, timeout=self.timeout)
+
+    def _session(self) -> FTP:
+        if self.ftp is None:
+            raise ValueError("{} is not connected".format(self))
+        return self.ftp
+
+    def retrieve(self, remote_path: str, callback: Callable[[bytes], None], rest: int = 0) -> None:
+        try:
+            self._session().retrbinary("RETR " + remote_path, callback, blocksize=CHUNK_SIZE, rest=rest or None)
+        except error_perm as err:
+            raise RemoteFileNotFoundError("{}: {}".format(remote_path, err)) from err
+
+    def stat(self, remote_path: str) -> Tuple[int, str]:
+        ftp = self._session()
+        try:
+            # SIZE is only reliable in binary mode
+            ftp.voidcmd("TYPE I")
+            size = ftp.size(remote_path)
+            mtime = ftp.sendcmd("MDTM " + remote_path)[4:].strip()
+        except error_perm as err:
+            raise RemoteFileNotFoundError("{}: {}".format(remote_path, err)) from err
+        return (int(size), mtime)  # type: ignore
+
+    def listdir(self, remote_dir: str) -> Listing:
+        ftp = self._session()
+        try:
+            return {
+                name: (
+                    int(facts["size"]) if "size" in facts else None,
+                    facts["modify"][:14] if "modify" in facts else None,
+                )
+                for name, facts in ftp.mlsd(remote_dir, facts=["type", "size", "modify"])
+                if facts.get("type", "file") == "file"
+            }
+        except error_perm as err:
+            # 500/501/502: MLSD isn't supported, fall back to a bare list of names
+            if str(err)[:3] not in ("500", "501", "502"):
+                raise RemoteFileNotFoundError("{}: {}".format(remote_dir, err)) from err
+
+        try:
+            names = ftp.nlst(remote_dir)
+        except error_perm as err:
+            raise RemoteFileNotFoundError("{}: {}".format(remote_dir, err)) from err
+        return {name.rsplit("/", 1)[-1]: (None, None) for name in names}
+
+
+class HTTPSTransport(Transport):
+    """
+    Session to NOAA's HTTPS server, which publishes the same tree as the FTP.
+
+    The underlying `requests.Session` keeps its connections alive, so
+    consecutive files are fetched without a new TCP/TLS handshake, and
+    restarted transfers use `Range` requests.
+    """
+
+    def __init__(self, base_url: str = NOAA_HTTPS_URL, timeout: float = 60.0, pool_maxsize: int = 1):
+        """
+        Args:
+        ------
+            base_url (str): scheme and host, the remote paths are appended to it
+
+            timeout (float): connect and read timeout in seconds
+
+            pool_maxsize (int): number of keep-alive connections to hold on to
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.pool_maxsize = pool_maxsize
+        self.session: Optional[requests.Session] = None
+
+    def __repr__(self):
+        return "HTTPSTransport(base_url={!r})".format(self.base_url)
+
+    @property
+    def connected(self) -> bool:
+        return self.session is not None
+
+    def connect(self) -> None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        self.session = session
+
+    def close(self) -> None:
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+    def clone(self) -> "HTTPSTransport":
+        return HTTPSTransport(base_url=self.base_url, timeout=self.timeout, pool_maxsize=self.pool_maxsize)
+
+    def _session(self) -> requests.Session:
+        if self.session is None:
+            raise ValueError("{} is not connected".format(self))
+        return self.session
+
+    def url(self, remote_path: str) -> str:
+        """The URL of `remote_path` on this server."""
+        return self.base_url + "/" + remote_path.lstrip("/")
+
+    def retrieve(self, remote_path: str, callback: Callable[[bytes], None], rest: int = 0) -> None:
+        headers = {}
+        if rest:
+            headers["Range"] = "bytes={}-".format(rest)
+
+        with self._session().get(self.url(remote_path), headers=headers, stream=True, timeout=self.timeout) as r:
+            if r.status_code == 404:
+                raise RemoteFileNotFoundError(self.url(remote_path))
+            r.raise_for_status()
+
+            # The server may ignore the Range header and send the whole file
+            to_skip = rest if (rest and r.status_code != 206) else 0
+
+            # Read the raw stream: the .gz files must not be decoded even if
+            # the server sets a Content-Encoding
+            for chunk in r.raw.stream(CHUNK_SIZE, decode_content=False):
+                if to_skip:
+                    skipped = min(to_skip, len(chunk))
+                    chunk = chunk[skipped:]
+                    to_skip -= skipped
+                if chunk:
+                    callback(chunk)
+
+    def stat(self, remote_path: str) -> Tuple[Optional[int], Optional[str]]:
+        r = self._session().head(self.url(remote_path), allow_redirects=True, timeout=self.timeout)
+        if r.status_code == 404:
+            raise RemoteFileNotFoundError(self.url(remote_path))
+        r.raise_for_status()
+
+        # Either may be left out, eg by proxies or for dynamic files
+        content_length = r.headers.get("Content-Length")
+        last_modified = r.headers.get("Last-Modified")
+        size = int(content_length) if content_length is not None else None
+        mtime = None
+        if last_modified is not None:
+            mtime = time.strftime(MDTM_FORMAT, email.utils.parsedate_to_datetime(last_modified).utctimetuple())
+        return (size, mtime)
+
+    def listdir(self, remote_dir: str) -> Listing:
+        # The sizes of an HTML index are rounded, if at all: only the names
+        # are taken from the links
+        r = self._session().get(self.url(remote_dir.rstrip("/") + "/"), timeout=self.timeout)
+        if r.status_code == 404:
+            raise RemoteFileNotFoundError(self.url(remote_dir))
+        r.raise_for_status()
+
+        listing: Listing = {}
+        for href in re.findall(r'href="([^"]+)"', r.text):
+            name = urllib.parse.unquote(href)
+            if name.startswith(("?", "/", ".")) or "/" in name or ":" in name:
+                # Sorting links, parent and sub folders, other sites
+                continue
+            listing[name] = (None, None)
+        return listing
+
+
+class LocalTransport(Transport):
+    """
+    A local copy of NOAA's tree, eg: a mirror on a network share.
+
+    '/pub/data/gsod/2017/x.op.gz' is read from '{root}/pub/data/gsod/2017/x.op.gz'
+    """
+
+    def __init__(self, root: Union[Path, str]):
+        """
+        Args:
+        ------
+            root (Path): the folder that contains the mirrored 'pub' folder
+        """
+        self.root = as_path(root)
+        self._connected = False
+
+    def __repr__(self):
+        return "LocalTransport(root={!r})".format(str(self.root))
+
+    @property
+    def connected(self) -> bool:
+        return self._connected
+
+    def connect(self) -> None:
+        if not self.root.is_dir():
+            raise ValueError("Local mirror '{}' is not a directory".format(self.root))
+        self._connected = True
+
+    def close(self) -> None:
+        self._connected = False
+
+    def clone(self) -> "LocalTransport":
+        return LocalTransport(root=self.root)
+
+    def local_path(self, remote_path: str) -> Path:
+        """Where `remote_path` is stored in the mirror."""
+        return self.root / remote_path.lstrip("/")
+
+    def retrieve(self, remote_path: str, callback: Callable[[bytes], None], rest: int = 0) -> None:
+        try:
+            f = open(self.local_path(remote_path), "rb")
+        except FileNotFoundError as err:
+            raise RemoteFileNotFoundError(str(err)) from err
+
+        with f:
+            f.seek(rest)
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                callback(chunk)
+
+    def stat(self, remote_path: str) -> Tuple[int, str]:
+        try:
+            st = self.local_path(remote_path).stat()
+        except FileNotFoundError as err:
+            raise RemoteFileNotFoundError(str(err)) from err
+        return (st.st_size, time.strftime(MDTM_FORMAT, time.gmtime(st.st_mtime)))
+
+    def listdir(self, remote_dir: str) -> Listing:
+        try:
+            entries = list(os.scandir(self.local_path(remote_dir)))
+        except FileNotFoundError as err:
+            raise RemoteFileNotFoundError(str(err)) from err
+
+        listing: Listing = {}
+        for entry in entries:
+            if entry.is_file():
+                st = entry.stat()
+                listing[entry.name] = (st.st_size, time.strftime(MDTM_FORMAT, time.gmtime(st.st_mtime)))
+        return listing
+
+
+class TransportPool:
+    """
+    A fixed-size pool of sessions, each one an independent clone of
+    `transport` with its own connection.
+
+    Sessions are opened lazily, the first time a worker needs one, and a
+    session that raised one of `TRANSPORT_ERRORS` is discarded: the next
+    worker that picks up its slot reconnects, so one dropped session never
+    stalls the others.
+
+    Usage:
+    ------
+        with TransportPool(FTPTransport(), size=4) as pool:
+            with pool.session() as transport:
+                transport.retrieve(...)
+    """
+
+    def __init__(self, transport: Transport, size: int, max_retries: int = MAX_RETRIES):
+        """
+        Args:
+        ------
+            transport (Transport): the session to clone, it isn't used itself
+
+            size (int): the number of concurrent sessions
+
+            max_retries (int): how many times a caller should retry a transfer
+                after its session dropped
+        """
+        if size < 1:
+            raise ValueError("size must be at least 1, not {}".format(size))
+
+        self.transport = transport
+        self.size = size
+        self.max_retries = max_retries
+
+        # Each slot holds a connected Transport, or None if it needs (re)connecting
+        self._slots: "queue.LifoQueue[Optional[Transport]]" = queue.LifoQueue()
+        for _ in range(size):
+            self._slots.put(None)
+
+        self._lock = threading.Lock()
+        self._sessions: Set[Transport] = set()
+        self._closed = False
+
+    def _connect(self) -> Transport:
+        session = self.transport.clone()
+        session.connect()
+        with self._lock:
+            self._sessions.add(session)
+        return session
+
+    def _discard(self, session: Transport) -> None:
+        with self._lock:
+            self._sessions.discard(session)
+        try:
+            session.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def session(self) -> Iterator[Transport]:
+        """
+        Borrows a connected session from the pool, blocking until one is free.
+
+        If the body raises one of `TRANSPORT_ERRORS`, the session is closed
+        and its slot is handed back empty, so it gets reconnected on next use.
+        The exception is re-raised for the caller to retry.
+        """
+        if self._closed:
+            raise ValueError("TransportPool is closed")
+
+        session = self._slots.get()
+        try:
+            if session is None:
+                session = self._connect()
+            yield session
+        except TRANSPORT_ERRORS:
+            if session is not None:
+                self._discard(session)
+            session = None
+            raise
+        finally:
+            self._slots.put(session)
+
+    def close(self) -> None:
+        """Closes all the open sessions."""
+        self._closed = True
+        with self._lock:
+            sessions = list(self._sessions)
+            self._sessions.clear()
+        for session in sessions:
+            try:
+                session.close()
+            except Exception:
+                pass
+
+    def __enter__(self) -> "TransportPool":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class _RangeRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """SimpleHTTPRequestHandler with keep-alive and 'Range: bytes=N-' support."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_head(self):
+        range_header = self.headers.get("Range")
+        path = self.translate_path(self.path)
+        if not range_header or not range_header.startswith("bytes=") or os.path.isdir(path):
+            return super().send_head()
+
+        try:
+            f = open(path, "rb")
+        except OSError:
+            self.send_error(404, "File not found")
+            return None
+
+        fs = os.fstat(f.fileno())
+        start = int(range_header[len("bytes=") :].split("-")[0])
+        if start >= fs.st_size:
+            f.close()
+            self.send_error(416, "Requested Range Not Satisfiable")
+            return None
+
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Range", "bytes {}-{}/{}".format(start, fs.st_size - 1, fs.st_size))
+        self.send_header("Content-Length", str(fs.st_size - start))
+        self.send_header("Last-Modified", self.date_time_string(int(fs.st_mtime)))
+        self.end_headers()
+        f.seek(start)
+        return f
+
+
+class LocalHTTPMirror:
+    """
+    Serves a local copy of NOAA's tree over HTTP on 127.0.0.1, as an offline
+    stand-in for NOAA's HTTPS server: point an `HTTPSTransport` to its `url`
+    to test it, or compare the throughput of the different transports.
+
+    Usage:
+    ------
+        with LocalHTTPMirror(root) as mirror:
+            transport = HTTPSTransport(base_url=mirror.url)
+    """
+
+    def __init__(self, root: Union[Path, str], port: int = 0):
+        """
+        Args:
+        ------
+            root (Path): the folder that contains the mirrored 'pub' folder
+
+            port (int): the port to listen to, 0 picks a free one
+        """
+        self.root = as_path(root)
+        self.port = port
+        self._server: Optional[http.server.ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """The base URL to give to `HTTPSTransport`."""
+        return "http://127.0.0.1:{}".format(self.port)
+
+    def start(self) -> None:
+        """Starts serving, in a background thread."""
+        root = str(self.root)
+
+        class Handler(_RangeRequestHandler):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, directory=root, **kwargs)
+
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops serving."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "LocalHTTPMirror":
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
@@ -1,10 +1,11 @@
 import datetime
+import gzip
 import struct
 import sys
 import warnings
 from enum import IntEnum
 from pathlib import Path
-from typing import Union
+from typing import BinaryIO, Union
 
 import numpy as np
 import pandas as pd
@@ -224,3 +225,31 @@ def as_path(path: Union[Path, str]) -> Path:
             raise ValueError("You must provide a pathlib.Path object or a string that can convert to one")
 
     return path
+
+
+# The first two bytes of any gzip file
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def is_gzip_file(path: Union[Path, str]) -> bool:
+    """Checks whether the file at `path` is gzip-compressed, by its magic number."""
+    with open(path, "rb") as f:
+        return f.read(2) == GZIP_MAGIC
+
+
+def open_maybe_gzip(path: Union[Path, str]) -> BinaryIO:
+    """
+    Opens `path` for binary reading, transparently decompressing it if it is
+    gzip-compressed (eg: a `*.op.gz` kept as is with `keep_compressed=True`)
+    """
+    if is_gzip_file(path):
+        return gzip.open(path, "rb")  # type: ignore
+    return open(path, "rb")
+
+
+def strip_gz_suffix(path: Union[Path, str]) -> Path:
+    """Removes the `.gz` suffix of `path` if any, eg: `X-2017.op.gz` => `X-2017.op`."""
+    path = as_path(path)
+    if path.suffix == ".gz":
+        return path.with_suffix("")
+    return path
@@ -1,24 +1,48 @@
 # In top level directory, run with python -m pytest
 # so that the folder is added to PYTHONPATH
+import asyncio
 import datetime
+import errno
+import gzip
+import http.server
+import io
+import json
 
 # import numpy as np
 import os
+import pickle
 from pathlib import Path
 import numpy as np
 
 import pandas as pd
 import pytest
+import tarfile
+import threading
 
 from pygsod.constants import ISDHISTORY_PATH, WEATHER_DIR, RESULT_DIR
 
 # Right now I have to do this, so that the pandas monkeypatching is done...
 from pygsod.epw_converter import clean_df
+from pygsod.gsod import parse_gsod_op_file
+from pygsod.inventory import ISDInventory
+from pygsod.isd_lite import parse_isd_lite_op_file
 from pygsod.isdhistory import ISDHistory
-from pygsod.ish_full import parse_ish_file
+from pygsod.ish_full import (
+    ADDITIONAL_DATA_FIELDS,
+    extract_additional_data,
+    parse_azimuth,
+    parse_ish_file,
+    parse_opaque_sky_cover,
+    parse_rh,
+    parse_total_sky_cover,
+    parse_zenith,
+)
+from pygsod.ledger import CONNECTION_TTL
 from pygsod.noaadata import NOAAData
 from pygsod.output import GetOneStation, Output
-from pygsod.utils import DataType, FileType, OutputType, ReturnCode, sanitize_usaf_wban
+from pygsod.streaming import CopyWriter, GunzipWriter
+from pygsod.transport import HTTPSTransport, LocalHTTPMirror, LocalTransport, RemoteFileNotFoundError, Transport
+from pygsod.utils import DataType, FileType, OutputType, ReturnCode, is_gzip_file, sanitize_usaf_wban
 
 # from mock import patch
 
@@ -134,15 +158,108 @@ class TestGSODDownloads:
     def test_download_GSOD_file(self):
         """py.test for GSOD._download_GSOD_file."""
         gsod = NOAAData(data_type=DataType.gsod)
-        (return_code, local_path) = gsod.get_year_file(year=2017, usaf_wban="744860-94789")
+        return_code, local_path = gsod.get_year_file(year=2017, usaf_wban="744860-94789")
         assert return_code == ReturnCode.success
         assert local_path == (WEATHER_DIR / "gsod" / "2017" / "JOHN F KENNEDY INTERNATIONAL AIRPORT-2017.op").resolve()
         assert local_path.is_file()
 
+    def test_get_all_data_pooled(self, tmp_path):
+        """py.test for NOAAData.get_all_data with several FTP sessions."""
+        gsod = NOAAData(data_type=DataType.gsod, weather_dir=tmp_path)
+        gsod.set_years([2016, 2017])
+        gsod.set_stations(["744860-94789", "725020-14734"])
+        assert gsod.get_all_data(n_connections=2) == (4, 0, 0)
+        assert [p.parent.name for p in gsod.ops_files] == ["2016", "2016", "2017", "2017"]
+        assert all(p.is_file() for p in gsod.ops_files)
+
+        with pytest.raises(ValueError):
+            gsod.get_all_data(n_connections=0)
+
+    def test_get_all_data_async(self, tmp_path):
+        """py.test for NOAAData.get_all_data_async."""
+        gsod = NOAAData(data_type=DataType.gsod, weather_dir=tmp_path)
+        gsod.set_years([2016, 2017])
+        gsod.set_stations(["744860-94789", "725020-14734"])
+        assert asyncio.run(gsod.get_all_data_async(max_concurrency=2)) == (4, 0, 0)
+        assert [p.parent.name for p in gsod.ops_files] == ["2016", "2016", "2017", "2017"]
+
+        return_code, local_path = asyncio.run(gsod.get_year_file_async(year=2017, usaf_wban="744860-94789"))
+        assert return_code == ReturnCode.success
+        assert local_path == tmp_path.resolve() / "2017" / "JOHN F KENNEDY INTERNATIONAL AIRPORT-2017.op"
+
+    def test_get_year_file_sync(self, tmp_path):
+        """py.test for NOAAData's incremental sync mode."""
+        gsod = NOAAData(data_type=DataType.gsod, weather_dir=tmp_path, sync=True)
+        return_code, local_path = gsod.get_year_file(year=2017, usaf_wban="744860-94789")
+        assert return_code == ReturnCode.success
+        assert (tmp_path / "manifest.json").is_file()
+        mtime = local_path.stat().st_mtime_ns
+
+        # Unchanged on the server: not downloaded again
+        gsod = NOAAData(data_type=DataType.gsod, weather_dir=tmp_path, sync=True)
+        assert gsod.get_year_file(year=2017, usaf_wban="744860-94789") == (ReturnCode.success, local_path)
+        assert local_path.stat().st_mtime_ns == mtime
+
+        # Local copy is gone: downloaded again
+        local_path.unlink()
+        assert gsod.get_year_file(year=2017, usaf_wban="744860-94789") == (ReturnCode.success, local_path)
+        assert local_path.is_file()
+
+    def test_get_year_file_keep_compressed(self, tmp_path):
+        """py.test for NOAAData's compressed-at-rest mode."""
+        gsod = NOAAData(data_type=DataType.gsod, weather_dir=tmp_path / "gz", keep_compressed=True)
+        return_code, gz_path = gsod.get_year_file(year=2017, usaf_wban="744860-94789")
+        assert return_code == ReturnCode.success
+        assert gz_path.name == "JOHN F KENNEDY INTERNATIONAL AIRPORT-2017.op.gz"
+        assert is_gzip_file(gz_path)
+
+        gsod = NOAAData(data_type=DataType.gsod, weather_dir=tmp_path / "op")
+        return_code, op_path = gsod.get_year_file(year=2017, usaf_wban="744860-94789")
+        pd.testing.assert_frame_equal(parse_gsod_op_file(gz_path), parse_gsod_op_file(op_path))
+
+    def test_parse_gsod_op_file_engines(self, tmp_path):
+        """py.test for parse_gsod_op_file's engines giving the same DataFrame."""
+        gsod = NOAAData(data_type=DataType.gsod, weather_dir=tmp_path)
+        return_code, op_path = gsod.get_year_file(year=2017, usaf_wban="744860-94789")
+        assert return_code == ReturnCode.success
+        op = parse_gsod_op_file(op_path)
+        pd.testing.assert_frame_equal(op, parse_gsod_op_file(op_path, engine="fwf"))
+        assert op.shape == (365, 42)
+        assert op.index[0] == pd.Timestamp("2017-01-01")
+        assert op["TEMP_F"].iloc[0] == 75.1
+        assert np.isnan(op["DEWP_F"].iloc[1])
+
+        # Negative values, blank flags, CRLF and trailing blanks stripped
+        lines = op_path.read_bytes().splitlines()
+        edited = lines[1][:24] + b" -12.5" + lines[1][30:102] + b"  83.1 " + lines[1][109:]
+        (tmp_path / "edited.op").write_bytes(b"\r\n".join([lines[0], edited, lines[2].rstrip()]) + b"\r\n")
+        op = parse_gsod_op_file(tmp_path / "edited.op")
+        pd.testing.assert_frame_equal(op, parse_gsod_op_file(tmp_path / "edited.op", engine="fwf"))
+        assert op["TEMP_F"].iloc[0] == -12.5
+        assert pd.isna(op["MAX_Flag"].iloc[0])
+
+        with pytest.raises(ValueError):
+            parse_gsod_op_file(op_path, engine="c")
+
+    def test_parse_gsod_op_file_columns(self, tmp_path):
+        """py.test for parse_gsod_op_file only decoding the requested columns."""
+        gsod = NOAAData(data_type=DataType.gsod, weather_dir=tmp_path)
+        return_code, op_path = gsod.get_year_file(year=2017, usaf_wban="744860-94789")
+        op = parse_gsod_op_file(op_path)
+        # In the usual order, whichever order requested
+        columns = ["DEWP_C", "FRSHTT_Fog", "TEMP_C", "StationID"]
+        for engine in ["numpy", "fwf"]:
+            pd.testing.assert_frame_equal(
+                parse_gsod_op_file(op_path, engine=engine, columns=columns), op[[c for c in op if c in columns]]
+            )
+
+        with pytest.raises(ValueError):
+            parse_gsod_op_file(op_path, columns=["TEMP_K"])
+
     def test_download_epw(self):
         station = "CENTRAL PARK"
         state = "NY"
-        
+
         args = {
             "type_of_file": FileType.Historical,
             "type_of_output": OutputType.EPW,
@@ -160,7 +277,570 @@ class TestGSODDownloads:
         stations = GetOneStation(**args)
         stations.run()
 
-        assert Path(RESULT_DIR / "CENTRAL PARK-2017.epw").exists()        
+        assert Path(RESULT_DIR / "CENTRAL PARK-2017.epw").exists()
+
+
+class RecordingFile(io.BytesIO):
+    """Records the size of each write."""
+
+    def __init__(self):
+        super().__init__()
+        self.sizes = []
+
+    def write(self, data):
+        self.sizes.append(len(data))
+        return super().write(data)
+
+
+class TestStreaming:
+    """
+    py.test class for the writers inflating or copying the downloads as they stream in
+    """
+
+    def test_gunzip_writer_multi_member(self):
+        data = gzip.compress(b"first member\n") + gzip.compress(b"second member\n")
+        out_file = io.BytesIO()
+        writer = GunzipWriter(out_file)
+        # Blocks straddling the members
+        for i in range(0, len(data), 7):
+            writer.write(data[i : i + 7])
+        writer.close()
+        assert out_file.getvalue() == b"first member\nsecond member\n"
+        assert writer.received == len(data)
+
+    def test_gunzip_writer_truncated(self):
+        data = gzip.compress(b"0123456789" * 1000)
+        writer = GunzipWriter(io.BytesIO())
+        writer.write(data[:-10])
+        with pytest.raises(EOFError):
+            writer.close()
+
+        # Nothing received at all is fine
+        GunzipWriter(io.BytesIO()).close()
+
+    def test_gunzip_writer_chunk_size(self):
+        plain = b"0123456789" * 100000
+        out_file = RecordingFile()
+        writer = GunzipWriter(out_file, chunk_size=1024)
+        # Highly compressed: inflates to much more than chunk_size at once
+        writer.write(gzip.compress(plain))
+        writer.close()
+        assert out_file.getvalue() == plain
+        assert max(out_file.sizes) <= 1024
+
+    def test_copy_writer(self):
+        out_file = io.BytesIO()
+        writer = CopyWriter(out_file)
+        for block in [b"abc", b"", b"def"]:
+            writer.write(block)
+        writer.close()
+        assert out_file.getvalue() == b"abcdef"
+        assert writer.received == 6
+
+
+class TestTransports:
+    """py.test class for the transports, against an offline mirror of NOAA's tree."""
+
+    OP_CONTENT = b"STN--- WBAN   YEARMODA    TEMP\n744860 94789  20170101    41.2\n" * 100
+
+    @pytest.fixture
+    def mirror(self, tmp_path):
+        root = tmp_path / "mirror"
+        (root / "pub/data/noaa").mkdir(parents=True)
+        (root / "pub/data/noaa/isd-history.csv").write_text(
+            '"USAF","WBAN","STATION NAME","CTRY","STATE","ICAO","LAT","LON","ELEV(M)","BEGIN","END"\n'
+            '"744860","94789","JOHN F KENNEDY INTERNATIONAL AIRPORT","US","NY","KJFK",'
+            '"+40.639","-073.762","+0003.4","19730101","20991231"\n'
+            '"A00001","99999","SOME OLD STATION","US","NY","","+40.000","-073.000","+0001.0","19730101","20101231"\n'
+        )
+        (root / "pub/data/noaa/isd-inventory.csv").write_text(
+            '"USAF","WBAN","YEAR","JAN","FEB","MAR","APR","MAY","JUN","JUL","AUG","SEP","OCT","NOV","DEC"\n'
+            '"744860","94789","2016","0","0","0","0","0","0","0","0","0","0","0","0"\n'
+            '"744860","94789","2017","700","650","0","720","744","720","744","744","720","744","720","100000"\n'
+            '"A00001","99999","2009","744","672","744","720","744","720","744","744","720","744","720","744"\n'
+        )
+        (root / "pub/data/gsod/2017").mkdir(parents=True)
+        (root / "pub/data/gsod/2017/744860-94789-2017.op.gz").write_bytes(gzip.compress(self.OP_CONTENT))
+
+        # Yearly archive, with a station that wasn't requested
+        with tarfile.open(root / "pub/data/gsod/2017/gsod_2017.tar", "w") as tar:
+            for usaf_wban in ["725020-14734", "744860-94789"]:
+                data = gzip.compress(self.OP_CONTENT)
+                member = tarfile.TarInfo("./{}-2017.op.gz".format(usaf_wban))
+                member.size = len(data)
+                tar.addfile(member, io.BytesIO(data))
+        return root
+
+    @pytest.fixture(params=["local", "https"])
+    def transport(self, request, mirror):
+        if request.param == "local":
+            yield LocalTransport(mirror)
+        else:
+            with LocalHTTPMirror(mirror) as http_mirror:
+                yield HTTPSTransport(base_url=http_mirror.url)
+
+    def test_retrieve(self, transport, mirror):
+        remote_path = "/pub/data/gsod/2017/744860-94789-2017.op.gz"
+        expected = (mirror / remote_path.lstrip("/")).read_bytes()
+        with transport.clone() as session:
+            chunks = []
+            session.retrieve(remote_path, chunks.append)
+            assert b"".join(chunks) == expected
+
+            chunks = []
+            session.retrieve(remote_path, chunks.append, rest=10)
+            assert b"".join(chunks) == expected[10:]
+
+            assert session.stat(remote_path)[0] == len(expected)
+
+            with pytest.raises(RemoteFileNotFoundError):
+                session.retrieve("/pub/data/gsod/2017/nope.op.gz", chunks.append)
+            with pytest.raises(RemoteFileNotFoundError):
+                session.stat("/pub/data/gsod/2017/nope.op.gz")
+
+    def test_noaadata(self, transport, tmp_path):
+        isd_path = tmp_path / "isd-history.csv"
+        gsod = NOAAData(
+            data_type=DataType.gsod, isd_path=isd_path, weather_dir=tmp_path / "gsod", sync=True, transport=transport
+        )
+        # Loaded lazily
+        assert not isd_path.is_file()
+        assert gsod.isd.transport is transport
+        assert isd_path.is_file()
+
+        gsod.set_years([2016, 2017])
+        gsod.set_stations(["744860-94789"])
+        assert gsod.get_all_data(n_connections=2) == (1, 1, 0)
+        assert gsod.ops_files[0].read_bytes() == self.OP_CONTENT
+        assert not transport.connected
+
+        # The manifest was filled through `Transport.stat`
+        assert gsod.get_year_file(year=2017, usaf_wban="744860-94789") == (ReturnCode.success, gsod.ops_files[0])
+
+    def test_list_year(self, transport, mirror, tmp_path):
+        gsod = NOAAData(
+            data_type=DataType.gsod,
+            isd_path=tmp_path / "isd-history.csv",
+            weather_dir=tmp_path / "gsod",
+            transport=transport,
+        )
+        listing = gsod.list_year(2017)
+        assert set(listing) == {"744860-94789-2017.op.gz", "gsod_2017.tar"}
+        if isinstance(transport, LocalTransport):
+            size = (mirror / "pub/data/gsod/2017/744860-94789-2017.op.gz").stat().st_size
+            assert listing["744860-94789-2017.op.gz"][0] == size
+        assert gsod.list_year(2016) == {}
+
+    def test_get_all_data_listing(self, mirror, tmp_path):
+        class CountingTransport(LocalTransport):
+            calls = []
+
+            def stat(self, remote_path):
+                self.calls.append(("stat", remote_path))
+                return super().stat(remote_path)
+
+            def retrieve(self, remote_path, callback, rest=0):
+                self.calls.append(("retrieve", remote_path))
+                return super().retrieve(remote_path, callback, rest=rest)
+
+        transport = CountingTransport(mirror)
+        gsod = NOAAData(
+            data_type=DataType.gsod,
+            isd_path=tmp_path / "isd-history.csv",
+            weather_dir=tmp_path / "gsod",
+            transport=transport,
+        )
+        gsod.set_years([2016, 2017])
+        gsod.set_stations(["744860-94789"])
+        transport.calls.clear()
+        assert gsod.get_all_data() == (1, 1, 0)
+        # 2016 isn't requested at all, and the listing gives the size for 2017
+        assert transport.calls == [("retrieve", "/pub/data/gsod/2017/744860-94789-2017.op.gz")]
+
+    def test_failure_ledger(self, mirror, tmp_path):
+        gsod = NOAAData(
+            data_type=DataType.gsod,
+            isd_path=tmp_path / "isd-history.csv",
+            weather_dir=tmp_path / "gsod",
+            transport=LocalTransport(mirror),
+        )
+        assert gsod.get_year_file(year=2016, usaf_wban="744860-94789") == (ReturnCode.missing, False)
+        assert (tmp_path / "gsod" / "failures.json").is_file()
+
+        # Published since, but known to be missing: not requested
+        remote_path = "/pub/data/gsod/2016/744860-94789-2016.op.gz"
+        (mirror / remote_path.lstrip("/")).parent.mkdir()
+        (mirror / remote_path.lstrip("/")).write_bytes(gzip.compress(self.OP_CONTENT))
+        gsod = NOAAData(
+            data_type=DataType.gsod,
+            isd_path=tmp_path / "isd-history.csv",
+            weather_dir=tmp_path / "gsod",
+            transport=LocalTransport(mirror),
+        )
+        assert gsod.failures.known_failure(remote_path) is not None
+        assert gsod.get_year_file(year=2016, usaf_wban="744860-94789") == (ReturnCode.missing, False)
+
+        gsod.failures.clear()
+        assert gsod.get_year_file(year=2016, usaf_wban="744860-94789")[0] == ReturnCode.success
+        assert gsod.failures.known_failure(remote_path) is None
+
+    @pytest.mark.parametrize("n_connections", [1, 2])
+    def test_give_up(self, mirror, tmp_path, n_connections):
+        class DroppingTransport(LocalTransport):
+            def clone(self):
+                return DroppingTransport(self.root)
+
+            def retrieve(self, remote_path, callback, rest=0):
+                if not remote_path.endswith(".gz"):
+                    return super().retrieve(remote_path, callback, rest=rest)
+                raise ConnectionResetError("Connection dropped")
+
+        gsod = NOAAData(
+            data_type=DataType.gsod,
+            isd_path=tmp_path / "isd-history.csv",
+            weather_dir=tmp_path / "gsod",
+            transport=DroppingTransport(mirror),
+        )
+        gsod.set_years([2017])
+        gsod.set_stations(["744860-94789"])
+        # Same warning and bookkeeping, sequential or pooled
+        with pytest.warns(UserWarning, match="Giving up on 744860-94789 for 2017"):
+            gsod.get_all_data(n_connections=n_connections)
+        failure = gsod.failures.known_failure("/pub/data/gsod/2017/744860-94789-2017.op.gz")
+        assert failure["ttl"] == CONNECTION_TTL
+        assert "Connection lost" in failure["reason"]
+
+    def test_https_stat_without_headers(self, mirror, tmp_path):
+        root = str(mirror)
+
+        class Handler(http.server.SimpleHTTPRequestHandler):
+            """Leaves the size and modification time out of the HEAD responses, like some proxies."""
+
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, directory=root, **kwargs)
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_header(self, keyword, value):
+                if self.command == "HEAD" and keyword in ("Content-Length", "Last-Modified"):
+                    return
+                super().send_header(keyword, value)
+
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            transport = HTTPSTransport(base_url="http://127.0.0.1:{}".format(server.server_address[1]))
+            with transport.clone() as session:
+                assert session.stat("/pub/data/gsod/2017/744860-94789-2017.op.gz") == (None, None)
+
+            # Downloaded all the same, but not recorded as up to date
+            for resumable in [False, True]:
+                gsod = NOAAData(
+                    data_type=DataType.gsod,
+                    isd_path=tmp_path / "isd-history.csv",
+                    weather_dir=tmp_path / "gsod{}".format(resumable),
+                    transport=transport,
+                    sync=True,
+                    resumable=resumable,
+                )
+                return_code, local_path = gsod.get_year_file(year=2017, usaf_wban="744860-94789")
+                assert return_code == ReturnCode.success
+                assert local_path.read_bytes() == self.OP_CONTENT
+                assert not gsod.manifest.entries
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_local_errors(self, mirror, tmp_path, monkeypatch):
+        class CountingTransport(LocalTransport):
+            calls = []
+
+            def retrieve(self, remote_path, callback, rest=0):
+                self.calls.append(rest)
+                return super().retrieve(remote_path, callback, rest=rest)
+
+        def disk_full(self, data):
+            raise OSError(errno.ENOSPC, "No space left on device")
+
+        monkeypatch.setattr(GunzipWriter, "write", disk_full)
+        transport = CountingTransport(mirror)
+        gsod = NOAAData(
+            data_type=DataType.gsod,
+            isd_path=tmp_path / "isd-history.csv",
+            weather_dir=tmp_path / "gsod",
+            transport=transport,
+        )
+        # Not a dropped session: neither retried nor recorded as missing
+        with pytest.raises(OSError):
+            gsod.get_year_file(year=2017, usaf_wban="744860-94789")
+        assert transport.calls == [0]
+        assert not gsod.failures.entries
+
+    def test_transport_abstract(self):
+        class IncompleteTransport(Transport):
+            def connect(self):
+                pass
+
+        with pytest.raises(TypeError):
+            IncompleteTransport()
+
+    @pytest.mark.parametrize("keep_compressed, resumable", [(False, False), (False, True), (True, False)])
+    def test_get_year_file_resume(self, mirror, tmp_path, keep_compressed, resumable):
+        class FlakyTransport(LocalTransport):
+            """Drops the connection halfway through the first transfer."""
+
+            rests = []
+            written = []
+
+            def retrieve(self, remote_path, callback, rest=0):
+                self.rests.append(rest)
+                if len(self.rests) > 1:
+                    return super().retrieve(remote_path, callback, rest=rest)
+
+                def half(data):
+                    callback(data[: len(data) // 2])
+                    self.written.extend(sorted(path.name for path in (tmp_path / "gsod").rglob("*.*")))
+                    raise ConnectionResetError("Connection dropped")
+
+                super().retrieve(remote_path, half, rest=rest)
+
+        transport = FlakyTransport(mirror)
+        gsod = NOAAData(
+            data_type=DataType.gsod,
+            isd_path=tmp_path / "isd-history.csv",
+            weather_dir=tmp_path / "gsod",
+            keep_compressed=keep_compressed,
+            transport=transport,
+            resumable=resumable,
+        )
+        return_code, local_path = gsod.get_year_file(year=2017, usaf_wban="744860-94789")
+        assert return_code == ReturnCode.success
+
+        size = (mirror / "pub/data/gsod/2017/744860-94789-2017.op.gz").stat().st_size
+        if keep_compressed or resumable:
+            assert transport.rests == [0, size // 2]
+            assert any(name.endswith(".part") for name in transport.written)
+        else:
+            # Only the inflated file is written, and the transfer starts over
+            assert transport.rests == [0, 0]
+            assert [name for name in transport.written if name != "failures.json"] == [local_path.name + ".tmp"]
+        if keep_compressed:
+            assert gzip.decompress(local_path.read_bytes()) == self.OP_CONTENT
+        else:
+            assert local_path.read_bytes() == self.OP_CONTENT
+        assert os.listdir(local_path.parent) == [local_path.name]
+
+    def test_get_all_data_archive(self, transport, tmp_path):
+        gsod = NOAAData(
+            data_type=DataType.gsod,
+            isd_path=tmp_path / "isd-history.csv",
+            weather_dir=tmp_path / "gsod",
+            transport=transport,
+            bulk_threshold=1,
+        )
+        gsod.set_years([2016, 2017])
+        gsod.set_stations(["744860-94789", "A00001-99999"])
+        # 2016 has no archive: falls back to the single file, which is missing too
+        assert gsod.get_all_data(n_connections=2) == (1, 1, 2)
+        assert gsod.ops_files[0].read_bytes() == self.OP_CONTENT
+        assert os.listdir(tmp_path / "gsod" / "2017") == [gsod.ops_files[0].name]
+
+    def test_plan(self, mirror, tmp_path):
+        gsod = NOAAData(
+            data_type=DataType.gsod,
+            isd_path=tmp_path / "isd-history.csv",
+            weather_dir=tmp_path / "gsod",
+            transport=LocalTransport(mirror),
+        )
+        gsod.set_years([2016, 2017])
+        gsod.set_stations(["744860-94789", "A00001-99999", "123456-99999", "654321-99999"])
+        # All the typos at once, before anything is downloaded
+        with pytest.raises(ValueError, match="2 station.*123456-99999, 654321-99999"):
+            gsod.plan()
+
+        gsod.set_stations(["744860-94789", "A00001-99999"])
+        plan = gsod.plan()
+        assert [(f.year, f.usaf_wban, f.status) for f in plan] == [
+            (2016, "744860-94789", ReturnCode.missing),
+            (2016, "A00001-99999", ReturnCode.outdated),
+            (2017, "744860-94789", None),
+            (2017, "A00001-99999", ReturnCode.outdated),
+        ]
+        size = (mirror / "pub/data/gsod/2017/744860-94789-2017.op.gz").stat().st_size
+        assert plan.total_bytes == plan.estimated_bytes == size
+        assert len(plan.to_frame()) == 4
+        # A dry run: the failures are only recorded when the plan is run
+        assert not gsod.failures.entries
+        assert not (tmp_path / "gsod" / "failures.json").exists()
+
+        assert gsod.get_all_data(plan=plan) == (1, 1, 2)
+        assert gsod.failures.known_failure("/pub/data/gsod/2016/744860-94789-2016.op.gz") is not None
+        assert gsod.ops_files[0].read_bytes() == self.OP_CONTENT
+
+    def test_isd_shared(self, mirror, tmp_path):
+        isd_path = tmp_path / "isd-history.csv"
+        kwargs = dict(data_type=DataType.gsod, isd_path=isd_path, transport=LocalTransport(mirror))
+        gsod1 = NOAAData(weather_dir=tmp_path / "gsod1", **kwargs)
+        gsod2 = NOAAData(weather_dir=tmp_path / "gsod2", **kwargs)
+        assert gsod1.isd is gsod2.isd
+        assert ISDHistory.shared(tmp_path / "." / "isd-history.csv") is gsod1.isd
+
+        ISDHistory.invalidate(isd_path)
+        isd = ISDHistory.shared(isd_path, transport=LocalTransport(mirror))
+        assert isd is not gsod1.isd
+        assert NOAAData(**kwargs).isd is isd
+        ISDHistory.invalidate()
+
+    def test_isd_snapshot(self, mirror, tmp_path, monkeypatch):
+        isd_path = tmp_path / "isd-history.csv"
+        isd = ISDHistory(isd_path, transport=LocalTransport(mirror))
+        assert isd.snapshot_path.is_file()
+
+        # Loaded from the snapshot
+        cached = ISDHistory(isd_path, transport=LocalTransport(mirror))
+        pd.testing.assert_frame_equal(cached.df, isd.df)
+        assert cached.closest_weather_station(40.6, -73.7) == "744860-94789"
+
+        # The CSV changed: parsed again
+        lines = isd_path.read_text().splitlines()
+        isd_path.write_text("\n".join([lines[0], lines[2]]) + "\n")
+        assert ISDHistory(isd_path, transport=LocalTransport(mirror)).df.index.tolist() == ["A00001-99999"]
+
+        # Unreadable snapshot: ignored
+        isd.snapshot_path.write_bytes(b"garbage")
+        assert len(ISDHistory(isd_path, transport=LocalTransport(mirror)).df) == 1
+
+        # Written by another pandas: parsed again, and saved with this one
+        monkeypatch.setattr(pd, "__version__", "0.0.0")
+        assert len(ISDHistory(isd_path, transport=LocalTransport(mirror)).df) == 1
+        with open(isd.snapshot_path, "rb") as f:
+            assert pickle.load(f)[1] == "0.0.0"
+
+    def test_isd_unknown_years(self, mirror, tmp_path):
+        remote_isd_path = mirror / "pub/data/noaa/isd-history.csv"
+        lines = remote_isd_path.read_text().splitlines()
+        remote_isd_path.write_text(
+            "\n".join(
+                lines
+                + [
+                    '"A00002","99999","NO END","US","NY","","+40.639","-073.762","+0001.0","19730101",""',
+                    '"A00003","99999","NO BEGIN","US","NY","","+40.639","-073.762","+0001.0","","20991231"',
+                ]
+            )
+            + "\n"
+        )
+        isd = ISDHistory(tmp_path / "isd-history.csv", transport=LocalTransport(mirror))
+        # Unknown END / BEGIN: not known to cover the year
+        assert "A00002-99999" not in isd.closest_weather_stations(40.639, -73.762, k=3, year=2017).index
+        assert isd.nearest_stations(40.639, -73.762, k=4, start_year=2017, end_year=2017).index.tolist() == [
+            "744860-94789"
+        ]
+        with pytest.raises(ValueError, match="2100"):
+            isd.closest_weather_station(40.639, -73.762, year=2100)
+        ranking = isd.rank_stations(40.639, -73.762, start_year=2017)
+        assert ranking.loc[["A00002-99999", "A00003-99999"], "coverage"].tolist() == [0, 0]
+        assert "A00002-99999" in isd.closest_weather_stations(40.639, -73.762, k=3).index
+
+    def test_isd_freshness(self, mirror, tmp_path):
+        class CountingTransport(LocalTransport):
+            calls = []
+
+            def clone(self):
+                return CountingTransport(self.root)
+
+            def stat(self, remote_path):
+                self.calls.append("stat")
+                return super().stat(remote_path)
+
+            def retrieve(self, remote_path, callback, rest=0):
+                self.calls.append("retrieve")
+                return super().retrieve(remote_path, callback, rest=rest)
+
+        transport = CountingTransport(mirror)
+        isd_path = tmp_path / "isd-history.csv"
+        isd = ISDHistory(isd_path, transport=transport)
+        assert isd.remote_state_path.is_file()
+        assert transport.calls == ["stat", "retrieve"]
+
+        # Checked recently: no request at all
+        assert not isd.update_isd_history()
+        assert transport.calls == ["stat", "retrieve"]
+
+        # Due for a check, unchanged: not downloaded
+        state = json.loads(isd.remote_state_path.read_text())
+        isd.remote_state_path.write_text(json.dumps(dict(state, checked_at=0)))
+        assert not isd.update_isd_history()
+        assert transport.calls == ["stat", "retrieve", "stat"]
+
+        # Check failed, eg offline: not retried right away
+        class FailingTransport(CountingTransport):
+            def clone(self):
+                return FailingTransport(self.root)
+
+            def stat(self, remote_path):
+                self.calls.append("stat")
+                raise ConnectionRefusedError()
+
+        isd.transport = FailingTransport(mirror)
+        isd.remote_state_path.write_text(json.dumps(dict(state, checked_at=0)))
+        assert not isd.update_isd_history()
+        assert not isd.update_isd_history()
+        assert transport.calls == ["stat", "retrieve", "stat", "stat"]
+        isd.transport = transport
+
+        # Changed on the server: downloaded
+        remote_isd_path = mirror / "pub/data/noaa/isd-history.csv"
+        remote_isd_path.write_text(remote_isd_path.read_text().splitlines()[0] + "\n")
+        isd.remote_state_path.write_text(json.dumps(dict(state, checked_at=0)))
+        assert isd.update_isd_history()
+        assert transport.calls[-2:] == ["stat", "retrieve"]
+        assert isd_path.read_text() == remote_isd_path.read_text()
+
+    def test_inventory(self, mirror, tmp_path):
+        transport = LocalTransport(mirror)
+        inventory = ISDInventory(tmp_path / "isd-inventory.csv", transport=transport)
+        assert (tmp_path / "isd-inventory.csv").is_file()
+        assert inventory.counts.dtype == np.uint16
+        assert inventory.monthly_counts("744860-94789", 2017)[[0, 2, 11]].tolist() == [700, 0, 65535]
+        assert inventory.monthly_counts("744860-94789", 2010).sum() == 0
+        assert inventory.has_data("744860-94789", 2017)
+        assert inventory.has_data("744860-94789", 2016) is False
+        assert inventory.has_data("744860-94789", 2018) is None
+        assert inventory.has_data("123456-99999", 2017) is None
+
+        ranking = inventory.rank_stations(years=[2016, 2017])
+        assert ranking.index.tolist() == ["744860-94789", "A00001-99999"]
+        assert ranking.loc["744860-94789", "months"] == 11
+        assert ranking.loc["744860-94789", "completeness"] == 11 / 24
+        assert inventory.rank_stations(years=[2009]).index[0] == "A00001-99999"
+
+        gsod = NOAAData(
+            data_type=DataType.gsod,
+            isd_path=tmp_path / "isd-history.csv",
+            weather_dir=tmp_path / "gsod",
+            transport=transport,
+            inventory=inventory,
+        )
+        gsod.set_years([2016, 2017])
+        gsod.set_stations(["744860-94789"])
+        plan = gsod.plan(list_folders=False)
+        assert "isd-inventory.csv" in plan.files[0].reason
+        assert len(plan.to_download) == 1
+
+        # Interrupted transfer: the previous copy is kept, no partial file
+        class FlakyTransport(LocalTransport):
+            def clone(self):
+                return FlakyTransport(self.root)
+
+            def retrieve(self, remote_path, callback, rest=0):
+                callback(b"USAF,WBAN")
+                raise ConnectionResetError("Connection dropped")
+
+        previous = (tmp_path / "isd-inventory.csv").read_bytes()
+        assert not ISDInventory.download_isd_inventory(tmp_path / "isd-inventory.csv", transport=FlakyTransport(mirror))
+        assert (tmp_path / "isd-inventory.csv").read_bytes() == previous
+        assert not (tmp_path / "isd-inventory.csv.tmp").exists()
 
 
 class TestISD:
@@ -207,6 +887,180 @@ class TestISD:
         closest = isd.closest_weather_station(lat, lon)
         assert closest == "064500-99999"
 
+    def test_closest_weather_stations(self, isd):
+        """
+        py.test for ISD.closest_weather_stations
+        """
+        lat = 51.177593
+        lon = 4.410888
+        columns = list(isd.df.columns)
+        closest = isd.closest_weather_stations(lat, lon, k=3)
+        assert closest.index[0] == "064500-99999"
+        assert closest.is_monotonic_increasing
+        for usaf_wban, distance in closest.items():
+            row = isd.df.loc[usaf_wban]
+            if isinstance(row, pd.DataFrame):
+                row = row.iloc[0]
+            assert distance == pytest.approx(ISDHistory.distance(row["LAT"], row["LON"], lat, lon))
+
+        # The table is left untouched
+        assert list(isd.df.columns) == columns
+
+        closest_2000 = isd.closest_weather_stations(lat, lon, k=3, year=2000)
+        assert (isd.df.loc[closest_2000.index, "END"].dt.year >= 2000).all()
+
+    def test_spatial_index(self, isd):
+        """
+        py.test for ISD.nearest_stations and ISD.stations_within
+        """
+        lat = 40.639
+        lon = -73.762
+        nearest = isd.nearest_stations(lat, lon, k=5)
+        assert nearest.index.tolist() == isd.closest_weather_stations(lat, lon, k=5).index.tolist()
+        assert nearest.values == pytest.approx(isd.closest_weather_stations(lat, lon, k=5).values)
+
+        nearest = isd.nearest_stations(lat, lon, k=5, start_year=2015, end_year=2017)
+        df = isd.df.loc[nearest.index]
+        assert (df["BEGIN"].dt.year <= 2015).all() and (df["END"].dt.year >= 2017).all()
+
+        within = isd.stations_within(lat, lon, radius=50)
+        assert (within <= 50).all()
+        assert len(within) == (np.nan_to_num(isd.distances(lat, lon), nan=np.inf) <= 50).sum()
+
+    def test_compact(self, isd):
+        """
+        py.test for ISD's compact dtypes
+        """
+        compact = ISDHistory(isd.isd_history_path, compact=True)
+        assert compact.df["STATION NAME"].dtype == "category"
+        assert compact.df["LAT"].dtype == np.float32
+        assert compact.df["END"].dtype == np.int32
+        assert compact.df.memory_usage(deep=True).sum() < isd.df.memory_usage(deep=True).sum()
+
+        row = compact.df.loc["744860-94789"]
+        assert row["STATION NAME"] == "JOHN F KENNEDY INTERNATIONAL AIRPORT"
+        assert ISDHistory.date(row["BEGIN"]) == ISDHistory.date(isd.df.loc["744860-94789", "BEGIN"])
+        assert (ISDHistory.years(compact.df["END"]) == ISDHistory.years(isd.df["END"])).all()
+        assert compact.closest_weather_station(51.177593, 4.410888) == "064500-99999"
+
+    def test_search(self, isd):
+        """
+        py.test for ISD.search
+        """
+        search = isd.search
+        assert search.countries() == sorted(isd.df["CTRY"].dropna().unique())
+        assert "NY" in search.states("US")
+        assert "JOHN F KENNEDY INTERNATIONAL AIRPORT" in search.station_names("US", "NY")
+
+        assert search.find("US", "JOHN F KENNEDY INTERNATIONAL AIRPORT").tolist() == ["744860-94789"]
+        assert search.find("US", "JOHN F KENNEDY INTERNATIONAL AIRPORT", state="CA").empty
+        assert "744860-94789" in search.prefix("john f. kennedy")
+        assert search.match("JON F KENEDY AIRPORT").index[0] == "744860-94789"
+        assert search.match("KENNEDY").index[0] == "744860-94789"
+
+        gsod = NOAAData(data_type=DataType.gsod)
+        assert gsod.get_stations_from_user_input("US", "NY", "JOHN F KENNEDY INTERNATIONAL AIRPORT", None, None) == [
+            "744860-94789"
+        ]
+        with pytest.raises(ValueError, match="Did you mean: JOHN F KENNEDY INTERNATIONAL AIRPORT"):
+            gsod.get_stations_from_user_input("US", "NY", "JOHN F KENEDY AIRPORT", None, None)
+
+    def test_closest_weather_station_batch(self, isd):
+        """
+        py.test for ISD.closest_weather_station_batch
+        """
+        lats = [51.177593, 40.639, np.nan, 48.85, -33.9]
+        lons = [4.410888, -73.762, 0.0, 2.35, 151.2]
+        closest = isd.closest_weather_station_batch(lats, lons, year=2010, chunk_size=2)
+        assert len(closest) == 5
+        assert closest.loc[0, "StationID"] == "064500-99999"
+        assert pd.isna(closest.loc[2, "StationID"]) and np.isnan(closest.loc[2, "distance"])
+        for i in [0, 1, 3, 4]:
+            expected = isd.closest_weather_stations(lats[i], lons[i], k=1, year=2010)
+            assert closest.loc[i, "StationID"] == expected.index[0]
+            assert closest.loc[i, "distance"] == pytest.approx(expected.iloc[0])
+
+        with pytest.raises(ValueError):
+            isd.closest_weather_station_batch([1.0, 2.0], [1.0])
+
+    def test_rank_stations(self, isd):
+        """
+        py.test for ISD.rank_stations
+        """
+        # JFK, Newark and Central Park are all within 25 km
+        ranking = isd.rank_stations(40.639, -73.762, elevation=3.4, start_year=2015, end_year=2020, n=3)
+        assert list(ranking.columns) == ["STATION NAME", "distance", "elevation_difference", "coverage", "score"]
+        assert ranking.index[0] == "744860-94789"
+        assert ranking["score"].is_monotonic_increasing
+        assert len(ranking) == 3
+
+        # Distance only is the same as closest_weather_stations
+        closest = isd.closest_weather_stations(40.639, -73.762, k=3)
+        ranking = isd.rank_stations(40.639, -73.762, weights={"elevation": 0, "coverage": 0}, n=3)
+        assert list(ranking.index) == list(closest.index)
+        assert ranking["distance"].to_numpy() == pytest.approx(closest.to_numpy())
+        assert ranking["elevation_difference"].isna().all()
+        assert (ranking["coverage"] == 1).all()
+
+        # Central Park started in 1943, JFK in 1973
+        ranking = isd.rank_stations(40.639, -73.762, start_year=1940, end_year=1950, weights={"coverage": 10}, n=1)
+        assert ranking.index[0] == "725053-94728"
+        assert ranking["coverage"].iloc[0] == pytest.approx(8 / 11)
+
+        assert len(isd.rank_stations(40.639, -73.762, max_distance=1)) <= 1
+        with pytest.raises(ValueError):
+            isd.rank_stations(40.639, -73.762, weights={"altitude": 1})
+
+
+class TestISDLite:
+    """
+    py.test class for isd_lite
+    """
+
+    def test_parse_isd_lite_op_file(self, tmp_path):
+        isd_lite = NOAAData(data_type=DataType.isd_lite, weather_dir=tmp_path)
+        return_code, local_path = isd_lite.get_year_file(year=2017, usaf_wban="744860-94789")
+        assert return_code == ReturnCode.success
+
+        df = parse_isd_lite_op_file(local_path)
+        # No header: the first hour is kept
+        assert df.shape == (8760, 12)
+        assert df.index[0] == pd.Timestamp("2017-01-01 00:00")
+        assert df.index[-1] == pd.Timestamp("2017-12-31 23:00")
+        assert (df.index.hour == df["HOUR"]).all()
+        # Named after the station, not USAF-WBAN-YEAR
+        assert df["StationID"].isna().all()
+
+        lines = [
+            b"2017 01 01 00    72   -28 10159   320    46     0     0 -9999\n",
+            b"2017 01 01 01  -105 -9999 10163 -9999    31     4    -1    13\n",
+        ]
+        (tmp_path / "744860-94789-2017").write_bytes(b"".join(lines))
+        df = parse_isd_lite_op_file(tmp_path / "744860-94789-2017")
+        assert list(df["StationID"]) == ["744860-94789"] * 2
+        assert list(df.index) == [pd.Timestamp("2017-01-01 00:00"), pd.Timestamp("2017-01-01 01:00")]
+        assert list(df["TEMP_C"]) == [7.2, -10.5]
+        assert df["SLP_HPa"].iloc[0] == 1015.9
+        assert np.isnan(df["DEWP_C"].iloc[1]) and np.isnan(df["WIND_dir"].iloc[1])
+        assert np.isnan(df["PRCP_mm_6hr"].iloc[0]) and df["PRCP_mm_6hr"].iloc[1] == 1.3
+        assert df["SkyCond"].iloc[1] == 4
+
+        columns = ["StationID", "TEMP_C", "PRCP_mm_6hr"]
+        pd.testing.assert_frame_equal(
+            parse_isd_lite_op_file(tmp_path / "744860-94789-2017", columns=columns),
+            df[["TEMP_C", "PRCP_mm_6hr", "StationID"]],
+        )
+        with pytest.raises(ValueError):
+            parse_isd_lite_op_file(tmp_path / "744860-94789-2017", columns=["TEMP_F"])
+
+        # Trailing fields stripped: missing, not zero
+        lines[1] = lines[1][:49] + b"\n"
+        (tmp_path / "744860-94789-2017").write_bytes(b"".join(lines))
+        df = parse_isd_lite_op_file(tmp_path / "744860-94789-2017")
+        assert df["SkyCond"].iloc[1] == 4
+        assert df[["PRCP_mm_1hr", "PRCP_mm_6hr"]].iloc[1].isna().all()
+        assert df["PRCP_mm_1hr"].iloc[0] == 0
+
 
 class TestISDFULL:
     """
@@ -245,6 +1099,52 @@ class TestISDFULL:
         assert isinstance(df, pd.DataFrame)
         assert df.shape == (13520, 18)
 
+    def test_parse_ish_file_columns(self, df, isd_full):
+        columns = ["TEMP_F", "ZENITH_ANGLE", "StationID"]
+        pd.testing.assert_frame_equal(parse_ish_file(isd_full, create_excel_file=False, columns=columns), df[columns])
+        with pytest.raises(ValueError):
+            parse_ish_file(isd_full, create_excel_file=False, columns=["VISIBILITY"])
+
+    def test_extract_additional_data(self, df):
+        add_data = pd.Series(
+            [
+                "ADDRH1024X08191RH2024N03091RH3024M05091GF108031011011010001011011",
+                "ADDGQ100601234199991REMGF10101",
+                "",
+                "ADDAA112001595MA1101501099999",
+            ]
+        )
+        values = extract_additional_data(add_data, columns=list(ADDITIONAL_DATA_FIELDS))
+        assert list(values.columns) == list(ADDITIONAL_DATA_FIELDS)
+        # The mean, whichever RH group has it
+        assert values["RELATIVE_HUMIDITY_PERCENTAGE"].iloc[0] == 50
+        assert parse_rh(add_data[0]) == 50
+        assert values.loc[0, ["TOTAL_SKY_COVER", "OPAQUE_SKY_COVER"]].tolist() == [8, 3]
+        # Missing values, and groups in the remarks are ignored
+        assert values.loc[1, "ZENITH_ANGLE"] == 123.4
+        assert values.loc[1, ["AZIMUTH_ANGLE", "TOTAL_SKY_COVER"]].isna().all()
+        assert values.loc[2].isna().all()
+        assert values.loc[3, ["PRCP_PERIOD_hr", "PRCP_mm", "ALTIMETER_hPa", "STP_hPa"]].tolist() == [
+            12,
+            1.5,
+            1015,
+            999.9,
+        ]
+
+        # Same as the former per-row parsers
+        expected = pd.DataFrame(
+            {
+                "TOTAL_SKY_COVER": df["ADD_DATA"].apply(parse_total_sky_cover),
+                "OPAQUE_SKY_COVER": df["ADD_DATA"].apply(parse_opaque_sky_cover),
+                "AZIMUTH_ANGLE": df["ADD_DATA"].apply(parse_azimuth),
+                "ZENITH_ANGLE": df["ADD_DATA"].apply(parse_zenith),
+            }
+        ).astype(float)
+        pd.testing.assert_frame_equal(df[expected.columns], expected)
+
+        with pytest.raises(ValueError):
+            extract_additional_data(add_data, columns=["VISIBILITY"])
+
     """
     test for epw_converter
     """